@@ -0,0 +1,299 @@
+"""
+效能基準測試: 網格每一輪(trader.start)的耗時, 以及gateway/精度換算的熱點.
+交易所用simulator的SimulatedExchange, 請求在同一個process裡處理, 不經過網路, 量到的是程式本身的耗時.
+
+python benchmark.py                                  # 全部跑完, 結果存成json
+python benchmark.py --quick                          # 少跑幾次, 只看大概
+python benchmark.py --compare trader/benchmarks/xxx.json   # 跟之前的結果比較, 變慢超過threshold的會標出來
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from gateway import BinanceSpotHttp, BinanceFutureHttp, OrderSide, OrderType, Order, RateLimiter, \
+    SymbolFilterCache
+from gateway.rate_limiter import (SPOT_RATE_LIMITS, SPOT_ENDPOINT_WEIGHTS, SPOT_ORDER_ENDPOINTS, FUTURE_RATE_LIMITS,
+                                  FUTURE_ENDPOINT_WEIGHTS, FUTURE_ORDER_ENDPOINTS)
+from simulator import SimulatedExchange, connect
+from trader.binance_spot_trader import BinanceSpotTrader
+from trader.binance_future_trader import BinanceFutureTrader
+from trader.order_book import OrderBook
+from trader.order_journal import OrderJournal
+from utils import config, Precision, round_to, get_folder_path, get_file_path, save_json
+from utils.precision import to_gap_units
+
+ORDER_COUNTS = (1, 10, 100, 1000)  # 每一邊的掛單數量
+RECONCILE_MODES = ('open_orders', 'poll')
+SYMBOL = 'BTCUSDT'
+PRICE = 30000.0
+UNLIMITED = 10 ** 9  # 模擬交易所的頻率限制, 基準測試不要被限流
+
+
+def measure(func, number=1000, repeat=5):
+    """
+    :param number: 每次量測連續呼叫幾次
+    :param repeat: 量測幾次
+    :return: 每次呼叫的耗時(微秒) {'best', 'median', 'mean'}
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    return {'best': min(samples), 'median': statistics.median(samples), 'mean': statistics.fmean(samples),
+            'number': number, 'repeat': repeat, 'unit': 'us'}
+
+
+def create_exchange(futures):
+    return SimulatedExchange(symbols={SYMBOL: {'price': PRICE, 'tick_size': '0.01', 'step_size': '0.001',
+                                               'min_notional': 5.0, 'volatility': 0.0}},
+                             futures=futures, weight_limit=UNLIMITED, order_limit=UNLIMITED, seed=1)
+
+
+def create_rate_limiter(futures):
+    """
+    跟gateway預設的一樣有token bucket, 只是額度放大, 量到的是扣額度的成本而不是等待的時間.
+    """
+    if futures:
+        rate_limits, weights, order_endpoints = FUTURE_RATE_LIMITS, FUTURE_ENDPOINT_WEIGHTS, FUTURE_ORDER_ENDPOINTS
+    else:
+        rate_limits, weights, order_endpoints = SPOT_RATE_LIMITS, SPOT_ENDPOINT_WEIGHTS, SPOT_ORDER_ENDPOINTS
+    return RateLimiter([dict(item, limit=UNLIMITED) for item in rate_limits], weights, order_endpoints)
+
+
+def create_gateway(futures, exchange):
+    gateway_class = BinanceFutureHttp if futures else BinanceSpotHttp
+    http_client = gateway_class(api_key='benchmark', secret='benchmark', rate_limiter=create_rate_limiter(futures))
+    return connect(http_client, exchange)
+
+
+def bench_gateway(quick=False):
+    number = 200 if quick else 2000
+    results = {}
+    exchange = create_exchange(False)
+    http_client = create_gateway(False, exchange)
+    params = {'symbol': SYMBOL, 'side': OrderSide.BUY.value, 'type': OrderType.LIMIT.value, 'quantity': '0.001',
+              'price': '29990.00', 'recvWindow': 10000, 'timestamp': int(time.time() * 1000),
+              'newClientOrderId': http_client.get_client_order_id(), 'timeInForce': 'GTC'}
+    results['gateway.build_parameters'] = measure(lambda: http_client.build_parameters(params), number * 10)
+    results['gateway.sign'] = measure(lambda: http_client._sign(params), number * 10)
+
+    order = http_client.place_order(SYMBOL, OrderSide.BUY, OrderType.LIMIT, '0.001', '29990.00')
+    body = http_client.session.request('GET', http_client.host + '/api/v3/order?' + http_client._sign(
+        {'symbol': SYMBOL, 'timestamp': int(time.time() * 1000), 'origClientOrderId': order.client_order_id})).content
+    data = json.loads(body)
+    results['gateway.json_decode_order'] = measure(lambda: json.loads(body), number * 10)
+    results['gateway.order_from_dict'] = measure(lambda: Order.from_dict(data), number * 10)
+
+    limiter = create_rate_limiter(False)
+    results['gateway.rate_limiter_reserve'] = measure(lambda: limiter.reserve('POST', '/api/v3/order', params),
+                                                      number * 10)
+    # 完整的一次請求: 參數、簽名、頻率限制、模擬交易所處理、json解析、轉成Order
+    results['gateway.get_order_roundtrip'] = measure(
+        lambda: http_client.get_order(SYMBOL, order.client_order_id), number)
+    results['gateway.get_ticker_roundtrip'] = measure(lambda: http_client.get_ticker(SYMBOL), number)
+    return results
+
+
+def bench_precision(quick=False):
+    number = 2000 if quick else 20000
+    results = {}
+    precision = Precision('0.01', '0.001')
+    gap_units = to_gap_units(0.001)
+    results['precision.price_to_ticks'] = measure(lambda: precision.price_to_ticks(29990.123), number)
+    results['precision.qty_to_steps'] = measure(lambda: precision.qty_to_steps(0.0123), number)
+    results['precision.format_price'] = measure(lambda: precision.format_price(2999012), number)
+    results['precision.format_qty'] = measure(lambda: precision.format_qty(12), number)
+    results['precision.shift_ticks'] = measure(lambda: precision.shift_ticks(2999012, gap_units, 1), number)
+    results['utility.round_to'] = measure(lambda: round_to(29990.123, 0.01), number)
+    return results
+
+
+def bench_journal(quick=False, order_counts=ORDER_COUNTS):
+    """
+    每輪結束保存掛單: OrderJournal.record(只寫變化, fsync一次) 跟 save_json(整份重寫)比較, 每輪成交一張並補一張.
+    """
+    number = 20 if quick else 200
+    results = {}
+    for order_count in order_counts:
+        buy_orders, sell_orders = OrderBook(0.01), OrderBook(0.01)
+        sequence = iter(range(10 ** 9))
+
+        def new_order(order_side, price):
+            return Order(SYMBOL, f"bench{next(sequence)}", order_side.value, price, 0.01)
+
+        for level in range(1, order_count + 1):
+            buy_orders.add(new_order(OrderSide.BUY, PRICE - level * 10))
+            sell_orders.add(new_order(OrderSide.SELL, PRICE + level * 10))
+
+        def fill_one():
+            filled = buy_orders.highest()
+            buy_orders.remove(filled)
+            buy_orders.add(new_order(OrderSide.BUY, filled.price))
+
+        with tempfile.TemporaryDirectory() as folder:
+            journal = OrderJournal(os.path.join(folder, 'bench.jsonl'))
+            journal.load()
+            journal.record(buy_orders, sell_orders)
+
+            def record():
+                fill_one()
+                journal.record(buy_orders, sell_orders)
+
+            results[f"journal.record.{order_count}"] = measure(record, number, 3)
+            journal.close()
+
+        filename = f"benchmark_orders_{os.getpid()}.json"
+
+        def rewrite():
+            fill_one()
+            save_json(filename, {'buy_orders': [order.to_dict() for order in buy_orders],
+                                 'sell_orders': [order.to_dict() for order in sell_orders]})
+
+        try:
+            results[f"journal.save_json.{order_count}"] = measure(rewrite, number, 3)
+        finally:
+            os.remove(get_file_path(filename))
+    return results
+
+
+def seed_orders(trader, precision, order_count):
+    """
+    在買一/賣一外面每一邊掛order_count張單(間距要大於合約trader撤單的0.1%), 價格不會動, 每一輪都是「全部還掛著」的穩定狀態.
+    """
+    gap_units = to_gap_units(trader.config.gap_percent)
+    http_client = trader.http_client
+    bid_ticks, ask_ticks = (precision.price_to_ticks(price) for price in trader.get_bid_ask_price())
+    for level in range(1, order_count + 1):
+        for order_side, ticks, order_book in ((OrderSide.BUY, bid_ticks, trader.buy_orders),
+                                              (OrderSide.SELL, ask_ticks, trader.sell_orders)):
+            price = precision.format_price(precision.shift_ticks(ticks, gap_units, level if order_side == OrderSide.SELL
+                                                                 else -level))
+            order = http_client.place_order(SYMBOL, order_side, OrderType.LIMIT,
+                                            precision.format_qty(precision.qty_to_steps(trader.config.quantity)),
+                                            price)
+            if not order:
+                raise RuntimeError(f"seed order failed: {order}")
+            order_book.add(order)
+
+
+def bench_traders(quick=False, order_counts=ORDER_COUNTS):
+    results = {}
+    for futures, trader_class in ((False, BinanceSpotTrader), (True, BinanceFutureTrader)):
+        name = 'future' if futures else 'spot'
+        for order_count in order_counts:
+            for reconcile_mode in RECONCILE_MODES:
+                exchange = create_exchange(futures)
+                http_client = create_gateway(futures, exchange)
+                trader_config = config.copy(symbol=SYMBOL, quantity=0.01, gap_percent=0.002,
+                                            max_orders=order_count, reconcile_mode=reconcile_mode,
+                                            ladder_levels=1)
+                trader = trader_class(http_client, config=trader_config, symbol_cache=SymbolFilterCache(http_client))
+                precision = trader.symbol_cache.get_precision(SYMBOL)
+                seed_orders(trader, precision, order_count)
+
+                cycles = 3 if quick else max(5, min(50, 2000 // order_count))
+                samples = []
+                requests = []
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    trader.start()  # 暖身: 載入交易規則
+                    for _ in range(cycles):
+                        start = time.perf_counter()
+                        trader.start()
+                        samples.append((time.perf_counter() - start) * 1e3)
+                        requests.append(trader.cycle_request_count)
+                trader.executor.shutdown()
+
+                open_orders = len(trader.buy_orders) + len(trader.sell_orders)
+                if open_orders != order_count * 2:
+                    print(f"warning: {name} {order_count} orders ended with {open_orders} open orders")
+                results[f"trader.{name}.{reconcile_mode}.{order_count}"] = {
+                    'best': min(samples), 'median': statistics.median(samples), 'mean': statistics.fmean(samples),
+                    'number': 1, 'repeat': cycles, 'unit': 'ms',
+                    'requests_per_cycle': statistics.median(requests), 'open_orders': open_orders}
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: 變慢超過threshold(比例)的項目數量
+    """
+    regressions = 0
+    print(f"{'benchmark':45} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None or not old.get('median'):
+            print(f"{name:45} {'-':>12} {result['median']:>10.2f}{result['unit']:>2}")
+            continue
+        ratio = result['median'] / old['median']
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions += 1
+            flag = '  <-- slower'
+        print(f"{name:45} {old['median']:>10.2f}{old['unit']:>2} {result['median']:>10.2f}{result['unit']:>2} "
+              f"{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='grid trader benchmarks')
+    parser.add_argument('--quick', action='store_true', help='少跑幾次, 只看大概')
+    parser.add_argument('--output', help='結果json的路徑, 預設存在trader/benchmarks底下')
+    parser.add_argument('--compare', help='之前的結果json, 逐項比較中位數')
+    parser.add_argument('--threshold', type=float, default=0.2, help='中位數變慢超過這個比例算退步, 預設0.2')
+    parser.add_argument('--only', choices=('gateway', 'precision', 'trader', 'journal'), action='append',
+                        help='只跑某幾組, 可以重複指定')
+    parser.add_argument('--orders', type=int, action='append', help='trader的掛單數量, 預設1/10/100/1000')
+    args = parser.parse_args(argv)
+
+    groups = args.only or ['gateway', 'precision', 'trader', 'journal']
+    results = {}
+    if 'gateway' in groups:
+        results.update(bench_gateway(args.quick))
+    if 'precision' in groups:
+        results.update(bench_precision(args.quick))
+    if 'trader' in groups:
+        results.update(bench_traders(args.quick, args.orders or ORDER_COUNTS))
+    if 'journal' in groups:
+        results.update(bench_journal(args.quick, args.orders or ORDER_COUNTS))
+
+    commit = get_commit()
+    report = {'commit': commit, 'time': datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'platform': platform.platform(), 'quick': args.quick,
+              'results': results}
+    output = args.output or get_folder_path('benchmarks').joinpath(
+        f"{datetime.now():%Y%m%d_%H%M%S}_{commit or 'nocommit'}.json")
+    with open(output, mode='w', encoding='UTF-8') as f:
+        json.dump(report, f, indent=4)
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare, mode='r', encoding='UTF-8') as f:
+            regressions = compare(results, json.load(f)['results'], args.threshold)
+    else:
+        for name, result in results.items():
+            extra = f", {result['requests_per_cycle']:.0f} requests/cycle" if 'requests_per_cycle' in result else ''
+            print(f"{name:45} median {result['median']:>10.2f}{result['unit']}{extra}")
+    print(f"results saved to {output}, time: {datetime.now()}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
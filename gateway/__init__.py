@@ -1,3 +1,9 @@
 from .binance_future import BinanceFutureHttp
 from .binance_spot import BinanceSpotHttp, OrderType, OrderStatus, OrderSide
-
+from .symbol_filters import SymbolFilterCache, FILTER_ERROR_CODES
+from .binance_websocket import BinanceUserStream, BinanceBookTickerStream, SPOT_STREAM_HOST, FUTURE_STREAM_HOST
+from .binance_async import AsyncBinanceSpotHttp, AsyncBinanceFutureHttp, SyncHttpClient
+from .rate_limiter import RateLimiter
+from .retry_policy import RetryPolicy, RetryAction, GatewayError
+from .order import Order, to_orders
+from .kline_downloader import KlineDownloader
@@ -0,0 +1,250 @@
+# Binance asyncio http requests.
+
+import asyncio
+import inspect
+import logging
+import time
+from contextvars import ContextVar
+from threading import Thread, local
+from .binance_spot import BinanceSpotHttp, RequestMethod, Interval
+from .binance_future import BinanceFutureHttp, BATCH_ORDER_LIMIT, BATCH_CANCEL_LIMIT
+from .retry_policy import RetryAction, GatewayError, parse_error_body, get_retry_after, \
+    is_unknown_result, get_order_query
+from utils.metrics import observe_request, observe_error, count_request
+
+try:
+    import aiohttp  # pip install aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger('binance.gateway')
+
+
+class AsyncRequestMixin(object):
+    """
+    把request改成coroutine, 其他方法的名稱和參數都跟同步版本一樣.
+    大部分方法只是回傳self.request(...), request變成coroutine之後直接await就好,
+    只有拿到結果之後還要處理的方法(get_kline, 批次下單)才需要覆寫.
+    """
+
+    def _create_session(self):
+        return None  # aiohttp的session要在event loop裡面建立
+
+    async def _get_session(self):
+        if self.session is None or self.session.closed:
+            api_key = getattr(self, 'api_key', None) or getattr(self, 'key', None)
+            connector = aiohttp.TCPConnector(limit=self.pool_connections * self.pool_maxsize,
+                                             limit_per_host=self.pool_maxsize)
+            self.session = aiohttp.ClientSession(connector=connector, headers={"X-MBX-APIKEY": api_key},
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    @property
+    def last_error(self):
+        return self._get_last_error_var().get()
+
+    @last_error.setter
+    def last_error(self, error):
+        self._get_last_error_var().set(error)
+
+    def _get_last_error_var(self):
+        # 所有coroutine都在同一個執行緒, 用contextvars讓每個task各自保存, asyncio.gather同時送出的請求不會互相覆蓋
+        var = self.__dict__.get('_last_error_var')
+        if var is None:
+            var = self._last_error_var = ContextVar('last_error', default=None)
+        return var
+
+    def reset_session(self):
+        session, self.session = self.session, None
+        if session is not None and not session.closed:
+            asyncio.ensure_future(session.close())
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def request(self, req_method: RequestMethod, path: str, requery_dict=None, verify=False):
+        if aiohttp is None:
+            raise ImportError("async clients need the aiohttp package: pip install aiohttp")
+
+        proxy = self.proxies.get('https') if self.proxies else None
+        start_time = time.monotonic()
+        self.last_error = None
+        attempt = 0
+        maybe_sent = False  # 之前有一次送出後沒拿到明確的結果
+        while True:
+            url = self.host + path
+            if verify:
+                query_str = self._sign(requery_dict)
+                url += '?' + query_str
+            elif requery_dict:
+                url += '?' + self.build_parameters(requery_dict)
+
+            attempt += 1
+            retry_after = None
+            sent_time = None  # 送出的時間, 記錄完延遲之後清掉
+            costs = self.rate_limiter.get_costs(req_method.value, path, requery_dict)
+            try:
+                await self.rate_limiter.acquire_async(req_method.value, path, requery_dict, costs)
+                with self.request_count_lock:
+                    self.request_count += 1
+                count_request()
+                session = await self._get_session()
+                sent_time = time.perf_counter()
+                async with session.request(req_method.value, url, proxy=proxy) as response:
+                    elapsed = time.perf_counter() - sent_time
+                    sent_time = None
+                    used = self.rate_limiter.update_from_headers(response.headers)
+                    observe_request(req_method.value, path, elapsed, response.status, costs, used)
+                    if response.status == 200:
+                        return await response.json(content_type=None)
+
+                    try:
+                        code, msg = parse_error_body(await response.json(content_type=None))
+                    except ValueError:
+                        code, msg = None, (await response.text())[:200]
+                    if response.status in (418, 429):  # 超過頻率限制, 暫停到Retry-After之後
+                        retry_after = get_retry_after(response.headers) or 60
+                        self.rate_limiter.block(retry_after)
+                    error = GatewayError(path, response.status, code, msg)
+            except aiohttp.ClientConnectionError as e:
+                self.reset_session()  # 連線中斷, 重建連線池
+                error = GatewayError(path, msg=f"connection error: {e}")
+            except Exception as e:
+                error = GatewayError(path, msg=str(e))
+            if sent_time is not None:  # 送出之後連線中斷或逾時
+                observe_request(req_method.value, path, time.perf_counter() - sent_time, None, costs)
+            if is_unknown_result(error.status):
+                maybe_sent = True
+
+            error.action = self.retry_policy.classify(error.status, error.code)
+            error.attempts = attempt
+            self.last_error = error
+            delay = self.retry_policy.get_delay(attempt - 1, retry_after)
+            retry = self.retry_policy.should_retry(error.action, attempt, start_time, delay)
+            observe_error(req_method.value, path, error.code, error.action, retry)
+            if not retry:
+                query = get_order_query(req_method.value, requery_dict) if maybe_sent and verify else None
+                if query is not None:
+                    # 重送的下單回傳clientOrderId重複, 或一直沒拿到結果: 第一次送出的可能已經掛上了, 先查詢
+                    order = await self.request(RequestMethod.GET, path, query, verify=True)
+                    if order:
+                        logger.warning("下單%s的結果不確定(%s), 查到已經送出的訂單%s", path, error,
+                                       query['origClientOrderId'])
+                        return order
+                logger.warning("請求%s失敗: %s", path, error)
+                return error
+
+            logger.info("請求%s失敗: %s, %.2f秒後重試", path, error, delay)
+            if error.action == RetryAction.RESIGN and verify and 'timestamp' in requery_dict:
+                requery_dict['timestamp'] = int(time.time() * 1000)
+            await asyncio.sleep(delay)
+
+
+class AsyncBinanceSpotHttp(AsyncRequestMixin, BinanceSpotHttp):
+
+    async def get_kline(self, symbol, interval: Interval, start_time=None, end_time=None, limit=500, max_try_time=10):
+        path = "/api/v3/klines"
+        query_dict = {"symbol": symbol, "interval": interval.value, "limit": limit}
+        if start_time:
+            query_dict['startTime'] = start_time
+        if end_time:
+            query_dict['endTime'] = end_time
+
+        # 暫時性的錯誤已經由RetryPolicy重試過了, 不再外加一層重試
+        data = await self.request(RequestMethod.GET, path, query_dict)
+        return data if isinstance(data, list) else []  # 失敗時跟沒有資料一樣回傳空的列表, 錯誤在last_error
+
+
+class AsyncBinanceFutureHttp(AsyncRequestMixin, BinanceFutureHttp):
+
+    async def get_kline(self, symbol, interval: Interval, start_time=None, end_time=None, limit=500, max_try_time=10):
+        path = "/fapi/v1/klines"
+        query_dict = {"symbol": symbol, "interval": interval.value, "limit": limit}
+        if start_time:
+            query_dict['startTime'] = start_time
+        if end_time:
+            query_dict['endTime'] = end_time
+
+        # 暫時性的錯誤已經由RetryPolicy重試過了, 不再外加一層重試
+        data = await self.request(RequestMethod.GET, path, query_dict)
+        return data if isinstance(data, list) else []  # 失敗時跟沒有資料一樣回傳空的列表, 錯誤在last_error
+
+    async def place_batch_orders(self, orders: list):
+        """
+        批次下單, 每BATCH_ORDER_LIMIT張一個請求, 所有請求同時送出.
+        """
+        path = '/fapi/v1/batchOrders'
+        batches = [self._batch_order_params(orders[i:i + BATCH_ORDER_LIMIT])
+                   for i in range(0, len(orders), BATCH_ORDER_LIMIT)]
+        responses = await asyncio.gather(*[self.request(RequestMethod.POST, path, params, verify=True)
+                                           for _, params in batches])
+        results = {}
+        checks = []
+        for index, ((client_order_ids, _), data) in enumerate(zip(batches, responses)):
+            results.update(self._batch_results(client_order_ids, data))
+            checks.extend(self._orders_to_check(orders[index * BATCH_ORDER_LIMIT:(index + 1) * BATCH_ORDER_LIMIT],
+                                                client_order_ids, results))
+        checked = await asyncio.gather(*[self.get_order(symbol, client_order_id)
+                                         for symbol, client_order_id in checks])
+        for (_, client_order_id), order in zip(checks, checked):
+            results[client_order_id] = order or results[client_order_id]
+        return results
+
+    async def cancel_batch_orders(self, symbol, client_order_ids: list):
+        """
+        批次撤單, 每BATCH_CANCEL_LIMIT張一個請求, 所有請求同時送出.
+        """
+        path = '/fapi/v1/batchOrders'
+        batches = [client_order_ids[i:i + BATCH_CANCEL_LIMIT]
+                   for i in range(0, len(client_order_ids), BATCH_CANCEL_LIMIT)]
+        responses = await asyncio.gather(*[self.request(RequestMethod.DELETE, path,
+                                                        self._batch_cancel_params(symbol, batch), verify=True)
+                                           for batch in batches])
+        results = {}
+        for batch, data in zip(batches, responses):
+            results.update(self._batch_results(batch, data))
+        return results
+
+
+class SyncHttpClient(object):
+
+    def __init__(self, async_client, loop=None):
+        """
+        把async client包成同步介面, 讓現有的trader不用改就能使用.
+        coroutine丟到背景執行緒的event loop執行, 多個trader可以共用同一個loop和連線池.
+        :param async_client: AsyncBinanceSpotHttp or AsyncBinanceFutureHttp
+        :param loop: 已經在執行的event loop, None的話自己開一個背景執行緒
+        """
+        self.async_client = async_client
+        self.local = local()  # 每個呼叫端執行緒自己的last_error
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            Thread(target=loop.run_forever, daemon=True).start()
+        self.loop = loop
+
+    @property
+    def last_error(self):
+        """
+        這個執行緒最近一次呼叫的錯誤, 跟同步版本的gateway一樣, 成功時是None.
+        """
+        return getattr(self.local, 'last_error', None)
+
+    def __getattr__(self, name):
+        attr = getattr(self.async_client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result, self.local.last_error = asyncio.run_coroutine_threadsafe(self._run(result),
+                                                                                 self.loop).result()
+            return result
+
+        return call
+
+    async def _run(self, coroutine):
+        # last_error存在這個task的context裡, 要在同一個task裡讀出來
+        result = await coroutine
+        return result, self.async_client.last_error
@@ -1,19 +1,18 @@
 # Binance Future http requests.
 
-import requests, time, hmac, hashlib
+import logging
+import requests, time, hmac, hashlib, json
+from requests.adapters import HTTPAdapter
 from enum import Enum
-from threading import Lock
-from datetime import datetime
+from threading import Lock, local
+from .rate_limiter import RateLimiter, FUTURE_RATE_LIMITS, FUTURE_ENDPOINT_WEIGHTS, FUTURE_ORDER_ENDPOINTS
+from .order import OrderStatus, to_orders
+from .retry_policy import RetryPolicy, RetryAction, GatewayError, parse_error_body, get_retry_after, \
+    is_unknown_result, is_duplicate_order, get_order_query
+from utils.metrics import observe_request, observe_error, count_request
+from urllib.parse import quote
 
-
-class OrderStatus(object):  # 訂單狀態:新訂單、部分完成、已完成、取消、待取消、訂單被拒絕、訂單過期
-    NEW = 'NEW'
-    PARTIALLY_FILLED = 'PARTIALLY_FILLED'
-    FILLED = 'FILLED'
-    CANCELED = 'CANCELED'
-    PENDING_CANCEL = 'PENDING_CANCEL'
-    REJECTED = 'REJECTED'
-    EXPIRED = 'EXPIRED'
+logger = logging.getLogger('binance.gateway')
 
 
 class OrderType(Enum):  # 限價單、市價單、停損單(也是按市價)
@@ -52,9 +51,17 @@ class OrderSide(Enum):
     SELL = "SELL"
 
 
+BATCH_ORDER_LIMIT = 5  # batchOrders每次最多下5張單
+BATCH_CANCEL_LIMIT = 10  # 批次撤單每次最多10張
+# clientOrderId最長36字元, 前綴10 + 時間戳13 + 序號7 = 30, 剩下6個字元給多個process區分
+CLIENT_ORDER_PREFIX_MAX_LENGTH = 6
+
+
 class BinanceFutureHttp(object):
 
-    def __init__(self, api_key=None, secret=None, host=None, proxy_host='', proxy_port=0, timeout=5, try_counts=5):
+    def __init__(self, api_key=None, secret=None, host=None, proxy_host='', proxy_port=0, timeout=5, try_counts=5,
+                 pool_connections=10, pool_maxsize=10, rate_limiter=None, retry_policy=None,
+                 client_order_prefix='', keep_raw=False):
         self.key = api_key
         self.secret = secret
         self.host = host if host else 'https://fapi.binance.com'
@@ -62,43 +69,157 @@ class BinanceFutureHttp(object):
         self.timeout = timeout
         self.order_count_lock = Lock()
         self.order_count = 1_000_000
+        if client_order_prefix and (len(client_order_prefix) > CLIENT_ORDER_PREFIX_MAX_LENGTH
+                                    or not client_order_prefix.isalnum()):
+            raise ValueError(f"client_order_prefix must be at most {CLIENT_ORDER_PREFIX_MAX_LENGTH} letters/digits")
+        self.client_order_tag = "x-cLbi5uMH" + client_order_prefix  # 多個process同時下單時用前綴區分是誰的單
+        self.keep_raw = keep_raw  # 訂單記錄是否保留原始json
         self.try_counts = try_counts  # 嘗試失敗次數
         self.proxy_host = proxy_host
         self.proxy_port = proxy_port
+        self.pool_connections = pool_connections  # 連線池數量(每個host一個)
+        self.pool_maxsize = pool_maxsize  # 每個host最多保持的連線數
+        self._proxies = self._build_proxies()
+        self.session_lock = Lock()
+        self.session = self._create_session()
+        self.local = local()
+        self.last_error = None  # 最近一次失敗請求的錯誤內容
+        self.request_count = 0  # 發出去的http請求數量(包含重試)
+        self.request_count_lock = Lock()
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(FUTURE_RATE_LIMITS, FUTURE_ENDPOINT_WEIGHTS, FUTURE_ORDER_ENDPOINTS)
+        self.rate_limiter = rate_limiter  # 同一個帳號的gateway可以共用
+        if retry_policy is None:
+            retry_policy = RetryPolicy(try_counts=try_counts)
+        self.retry_policy = retry_policy  # 決定哪些錯誤要重試, 重試前等多久
+
+    @property
+    def last_error(self):
+        """
+        最近一次失敗請求的錯誤內容, 每個執行緒各自一份, 同時下單時不會互相覆蓋.
+        """
+        return getattr(self.local, 'last_error', None)
+
+    @last_error.setter
+    def last_error(self, error):
+        self.local.last_error = error
 
     @property
     def proxies(self):
+        return self._proxies
+
+    def _build_proxies(self):
         if self.proxy_host and self.proxy_port:
             proxy = f"http://{self.proxy_host}:{self.proxy_port}"
             return {"http": proxy, "https": proxy}
         return {}
 
+    def _create_session(self):
+        """
+        建立keep-alive的連線池， 所有請求共用同一個session, 不用每次都重新TCP/TLS握手.
+        :return: requests.Session
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({"X-MBX-APIKEY": self.key})
+        if self._proxies:
+            session.proxies.update(self._proxies)
+        return session
+
+    def reset_session(self):
+        """
+        連線出錯時重建連線池， 避免壞掉的連線一直留在池裡.
+        """
+        with self.session_lock:
+            old_session = self.session
+            self.session = self._create_session()
+        old_session.close()
+
+    def close(self):
+        self.session.close()
+
     def build_parameters(self, params: dict):
         keys = list(params.keys())
         keys.sort()
         return '&'.join([f"{k}={params[k]}" for k in params.keys()])
 
     def request(self, req_method: RequestMethod, path: str, requery_dict=None, verify=False):
-        url = self.host + path
-
-        if verify:
-            query_str = self._sign(requery_dict)
-            url += '?' + query_str
-        elif requery_dict:
-            url += '?' + self.build_parameters(requery_dict)
-        headers = {"X-MBX-APIKEY": self.key}
-
-        for i in range(0, self.try_counts):
+        """
+        送出請求, 依照錯誤類型決定重試/重新簽名/直接放棄.
+        :return: 成功時回傳交易所的json, 失敗時回傳GatewayError(bool值是False)
+        """
+        start_time = time.monotonic()
+        self.last_error = None
+        attempt = 0
+        maybe_sent = False  # 之前有一次送出後沒拿到明確的結果
+        while True:
+            url = self.host + path
+            if verify:
+                query_str = self._sign(requery_dict)
+                url += '?' + query_str
+            elif requery_dict:
+                url += '?' + self.build_parameters(requery_dict)
+
+            attempt += 1
+            retry_after = None
+            sent_time = None  # 送出的時間, 記錄完延遲之後清掉
+            costs = self.rate_limiter.get_costs(req_method.value, path, requery_dict)
             try:
-                response = requests.request(req_method.value, url=url, headers=headers, timeout=self.timeout,
-                                            proxies=self.proxies)
+                self.rate_limiter.acquire(req_method.value, path, requery_dict, costs)
+                with self.request_count_lock:
+                    self.request_count += 1
+                count_request()
+                sent_time = time.perf_counter()
+                response = self.session.request(req_method.value, url=url, timeout=self.timeout)
+                elapsed = time.perf_counter() - sent_time
+                sent_time = None
+                used = self.rate_limiter.update_from_headers(response.headers)
+                observe_request(req_method.value, path, elapsed, response.status_code, costs, used)
                 if response.status_code == 200:
                     return response.json()
-                else:
-                    print(f"請求失敗: {response.status_code}, 繼續嘗試請求")
-            except Exception as error:
-                print(f"請求{path}時發生了錯誤: {error}, 時間: {datetime.now()}")
-                time.sleep(3)
+
+                try:
+                    code, msg = parse_error_body(response.json())
+                except ValueError:
+                    code, msg = None, response.text[:200]
+                if response.status_code in (418, 429):  # 超過頻率限制, 暫停到Retry-After之後
+                    retry_after = get_retry_after(response.headers) or 60
+                    self.rate_limiter.block(retry_after)
+                error = GatewayError(path, response.status_code, code, msg)
+            except requests.exceptions.ConnectionError as e:
+                self.reset_session()  # 連線中斷, 重建連線池
+                error = GatewayError(path, msg=f"connection error: {e}")
+            except Exception as e:
+                error = GatewayError(path, msg=str(e))
+            if sent_time is not None:  # 送出之後連線中斷或逾時
+                observe_request(req_method.value, path, time.perf_counter() - sent_time, None, costs)
+            if is_unknown_result(error.status):
+                maybe_sent = True
+
+            error.action = self.retry_policy.classify(error.status, error.code)
+            error.attempts = attempt
+            self.last_error = error
+            delay = self.retry_policy.get_delay(attempt - 1, retry_after)
+            retry = self.retry_policy.should_retry(error.action, attempt, start_time, delay)
+            observe_error(req_method.value, path, error.code, error.action, retry)
+            if not retry:
+                query = get_order_query(req_method.value, requery_dict) if maybe_sent and verify else None
+                if query is not None:
+                    # 重送的下單回傳clientOrderId重複, 或一直沒拿到結果: 第一次送出的可能已經掛上了, 先查詢
+                    order = self.request(RequestMethod.GET, path, query, verify=True)
+                    if order:
+                        logger.warning("下單%s的結果不確定(%s), 查到已經送出的訂單%s", path, error,
+                                       query['origClientOrderId'])
+                        return order
+                logger.warning("請求%s失敗: %s", path, error)
+                return error
+
+            logger.info("請求%s失敗: %s, %.2f秒後重試", path, error, delay)
+            if error.action == RetryAction.RESIGN and verify and 'timestamp' in requery_dict:
+                requery_dict['timestamp'] = int(time.time() * 1000)
+            time.sleep(delay)
 
     def server_time(self):
         path = '/fapi/v1/time'
@@ -126,6 +247,12 @@ class BinanceFutureHttp(object):
         path = '/fapi/v1/exchangeInfo'
         return self.request(req_method=RequestMethod.GET, path=path)
 
+    def get_exchange_info(self, symbol=None):
+        """
+        合約的exchangeInfo不支援symbol參數, 只能整包下載, symbol參數只是為了跟現貨介面一致.
+        """
+        return self.exchangeInfo()
+
     def order_book(self, symbol, limit=5):
         limits = [5, 10, 20, 50, 100, 500, 1000] # limit=0 返回全部orderbook，但数据量会非常非常非常非常大！
         if limit not in limits:
@@ -169,11 +296,9 @@ class BinanceFutureHttp(object):
         if end_time:
             query_dict['endTime'] = end_time
 
-        for _ in range(max_try_time):
-            data = self.request(RequestMethod.GET, path, query_dict)
-            if isinstance(data, list) and len(data):
-                return data
-        return []
+        # 暫時性的錯誤已經由RetryPolicy重試過了, 不再外加一層重試
+        data = self.request(RequestMethod.GET, path, query_dict)
+        return data if isinstance(data, list) else []  # 失敗時跟沒有資料一樣回傳空的列表, 錯誤在last_error
 
     def get_latest_price(self, symbol):
         path = "/fapi/v1/ticker/price"
@@ -189,6 +314,25 @@ class BinanceFutureHttp(object):
         path = "/fapi/v1/ticker/bookTicker"
         return self.request(RequestMethod.GET, path)
 
+    def create_listen_key(self):
+        """
+        申請user data stream的listenKey, 只需要api key, 不用簽名.
+        :return: {'listenKey': 'pqia91ma19a5s61cv6a81va65sdf19v8a65a1a5s61cv6a81va65sdf19v8a65a1'}
+        """
+        path = "/fapi/v1/listenKey"
+        return self.request(RequestMethod.POST, path)
+
+    def keep_alive_listen_key(self, listen_key=None):
+        """
+        延長listenKey的有效時間60分鐘, 合約一個帳號只有一個listenKey, 不需要帶參數.
+        """
+        path = "/fapi/v1/listenKey"
+        return self.request(RequestMethod.PUT, path)
+
+    def close_listen_key(self, listen_key=None):
+        path = "/fapi/v1/listenKey"
+        return self.request(RequestMethod.DELETE, path)
+
     ########################### the following request is for private data ########################
 
     def _timestamp(self):
@@ -206,7 +350,13 @@ class BinanceFutureHttp(object):
         """
         with self.order_count_lock:
             self.order_count += 1
-            return "x-cLbi5uMH" + str(self._timestamp()) + str(self.order_count)
+            return self.client_order_tag + str(self._timestamp()) + str(self.order_count)
+
+    def is_own_order(self, client_order_id):
+        """
+        是不是這個gateway(同樣的client_order_prefix)下的單.
+        """
+        return bool(client_order_id) and client_order_id.startswith(self.client_order_tag)
 
     def place_order(self, symbol: str, order_side: OrderSide, order_type: OrderType, quantity, price,
                     time_inforce="GTC", client_order_id=None, recvWindow=5000, stop_price=0):
@@ -228,6 +378,7 @@ class BinanceFutureHttp(object):
         """
 
         path = '/fapi/v1/order'
+        order_type = OrderType(order_type.value)  # trader用的是gateway.OrderType(現貨的enum), 轉成這裡的才比較得到
 
         if client_order_id is None:
             client_order_id = self.get_client_order_id()
@@ -256,7 +407,7 @@ class BinanceFutureHttp(object):
             else:
                 raise ValueError("stopPrice must greater than 0")
 
-        return self.request(RequestMethod.POST, path=path, requery_dict=params, verify=True)
+        return to_orders(self.request(RequestMethod.POST, path=path, requery_dict=params, verify=True), self.keep_raw)
 
     def get_order(self, symbol, client_order_id=None):
         path = "/fapi/v1/order"
@@ -264,7 +415,7 @@ class BinanceFutureHttp(object):
         if client_order_id:
             query_dict["origClientOrderId"] = client_order_id
 
-        return self.request(RequestMethod.GET, path, query_dict, verify=True)
+        return to_orders(self.request(RequestMethod.GET, path, query_dict, verify=True), self.keep_raw)
 
     def cancel_order(self, symbol, client_order_id=None):
         path = "/fapi/v1/order"
@@ -272,7 +423,101 @@ class BinanceFutureHttp(object):
         if client_order_id:
             params["origClientOrderId"] = client_order_id
 
-        return self.request(RequestMethod.DELETE, path, params, verify=True)
+        return to_orders(self.request(RequestMethod.DELETE, path, params, verify=True), self.keep_raw)
+
+    def place_batch_orders(self, orders: list):
+        """
+        批次下單, 每BATCH_ORDER_LIMIT張一個請求.
+        :param orders: [{'symbol': 'BTCUSDT', 'order_side': OrderSide.BUY, 'order_type': OrderType.LIMIT,
+                         'quantity': 0.001, 'price': 8000, 'client_order_id': None, 'time_inforce': 'GTC'}]
+        :return: {clientOrderId: order}, 失敗的訂單對應交易所的錯誤 {'code': -2019, 'msg': 'Margin is insufficient.'}
+        """
+        path = '/fapi/v1/batchOrders'
+        results = {}
+
+        for i in range(0, len(orders), BATCH_ORDER_LIMIT):
+            client_order_ids, params = self._batch_order_params(orders[i:i + BATCH_ORDER_LIMIT])
+            data = self.request(RequestMethod.POST, path, params, verify=True)
+            results.update(self._batch_results(client_order_ids, data))
+            for symbol, client_order_id in self._orders_to_check(orders[i:i + BATCH_ORDER_LIMIT], client_order_ids,
+                                                                 results):
+                results[client_order_id] = self.get_order(symbol, client_order_id) or results[client_order_id]
+        return results
+
+    def cancel_batch_orders(self, symbol, client_order_ids: list):
+        """
+        批次撤單, 每BATCH_CANCEL_LIMIT張一個請求.
+        :return: {clientOrderId: order}, 失敗的訂單對應交易所的錯誤 {'code': -2011, 'msg': 'Unknown order sent.'}
+        """
+        path = '/fapi/v1/batchOrders'
+        results = {}
+
+        for i in range(0, len(client_order_ids), BATCH_CANCEL_LIMIT):
+            batch = client_order_ids[i:i + BATCH_CANCEL_LIMIT]
+            data = self.request(RequestMethod.DELETE, path, self._batch_cancel_params(symbol, batch), verify=True)
+            results.update(self._batch_results(batch, data))
+        return results
+
+    def _batch_order_params(self, orders: list):
+        batch = []
+        for order in orders:
+            order_type = OrderType(order.get('order_type', OrderType.LIMIT).value)
+            item = {
+                "symbol": order['symbol'],
+                "side": order['order_side'].value,
+                "type": order_type.value,
+                "quantity": str(order['quantity']),
+                "newClientOrderId": order.get('client_order_id') or self.get_client_order_id()
+            }
+            if order_type != OrderType.MARKET:
+                item['price'] = str(order['price'])
+            if order_type == OrderType.LIMIT:
+                item['timeInForce'] = order.get('time_inforce', 'GTC')
+            batch.append(item)
+
+        params = {
+            "batchOrders": quote(json.dumps(batch, separators=(',', ':'))),
+            "recvWindow": self.recv_window,
+            "timestamp": self._timestamp()
+        }
+        return [item['newClientOrderId'] for item in batch], params
+
+    def _batch_cancel_params(self, symbol, client_order_ids: list):
+        return {
+            "symbol": symbol,
+            "origClientOrderIdList": quote(json.dumps(client_order_ids, separators=(',', ':'))),
+            "recvWindow": self.recv_window,
+            "timestamp": self._timestamp()
+        }
+
+    @staticmethod
+    def _orders_to_check(orders: list, client_order_ids: list, results: dict):
+        """
+        要用get_order確認的訂單:
+        - 批次下單逾時後重送, 第一次已經下成功的單會回傳clientOrderId重複, 要查詢才拿得到訂單
+        - 重試完還是沒拿到明確的結果(逾時, 5xx), 交易所可能已經掛上了, 不查詢的話下一輪會重複掛單
+        :return: [(symbol, clientOrderId)]
+        """
+        checks = []
+        for order, client_order_id in zip(orders, client_order_ids):
+            result = results.get(client_order_id)
+            if is_duplicate_order(result) or (isinstance(result, GatewayError) and is_unknown_result(result.status)):
+                checks.append((order['symbol'], client_order_id))
+        return checks
+
+    def _batch_results(self, client_order_ids: list, data):
+        """
+        批次請求回傳的順序跟送出的順序一樣, 依位置對應回clientOrderId.
+        """
+        results = {}
+        for index, client_order_id in enumerate(client_order_ids):
+            if isinstance(data, list) and index < len(data):
+                results[client_order_id] = to_orders(data[index], self.keep_raw)  # 錯誤的那幾筆還是dict
+            elif isinstance(data, GatewayError):
+                results[client_order_id] = data  # 整個請求失敗, 每張單都回傳同一個錯誤
+            else:
+                results[client_order_id] = GatewayError('/fapi/v1/batchOrders', msg=f"missing result: {data}")
+        return results
 
     def get_open_orders(self, symbol=None):
         path = "/fapi/v1/openOrders"
@@ -281,7 +526,7 @@ class BinanceFutureHttp(object):
         if symbol:
             params["symbol"] = symbol
 
-        return self.request(RequestMethod.GET, path, params, verify=True)
+        return to_orders(self.request(RequestMethod.GET, path, params, verify=True), self.keep_raw)
 
     def cancel_open_orders(self, symbol):
         """
@@ -295,7 +540,7 @@ class BinanceFutureHttp(object):
                   "recvWindow": self.recv_window,
                   "symbol": symbol}
 
-        return self.request(RequestMethod.DELETE, path, params, verify=True)
+        return to_orders(self.request(RequestMethod.DELETE, path, params, verify=True), self.keep_raw)
 
     def get_balance(self):
         """
@@ -1,18 +1,17 @@
 # Binance Spot http requests.
 
+import logging
 import requests, time, hmac, hashlib
+from requests.adapters import HTTPAdapter
 from enum import Enum
-from threading import Lock
+from threading import Lock, local
+from .rate_limiter import RateLimiter, SPOT_RATE_LIMITS, SPOT_ENDPOINT_WEIGHTS, SPOT_ORDER_ENDPOINTS
+from .order import OrderStatus, to_orders
+from .retry_policy import RetryPolicy, RetryAction, GatewayError, parse_error_body, get_retry_after, \
+    is_unknown_result, get_order_query
+from utils.metrics import observe_request, observe_error, count_request
 
-
-class OrderStatus(Enum): # 訂單狀態:新訂單、部分完成、已完成、取消、待取消、訂單被拒絕、訂單過期
-    NEW = 'NEW'
-    PARTIALLY_FILLED = 'PARTIALLY_FILLED'
-    FILLED = 'FILLED'
-    CANCELED = 'CANCELED'
-    PENDING_CANCEL = 'PENDING_CANCEL'
-    REJECTED = 'REJECTED'
-    EXPIRED = 'EXPIRED'
+logger = logging.getLogger('binance.gateway')
 
 
 class OrderType(Enum):
@@ -51,9 +50,15 @@ class OrderSide(Enum):
     SELL = "SELL"
 
 
+# clientOrderId最長36字元, 前綴10 + 時間戳13 + 序號7 = 30, 剩下6個字元給多個process區分
+CLIENT_ORDER_PREFIX_MAX_LENGTH = 6
+
+
 class BinanceSpotHttp(object):
 
-    def __init__(self, api_key=None, secret=None, host=None, proxy_host=None, proxy_port=0, timeout=5, try_counts=5):
+    def __init__(self, api_key=None, secret=None, host=None, proxy_host=None, proxy_port=0, timeout=5, try_counts=5,
+                 pool_connections=10, pool_maxsize=10, rate_limiter=None, retry_policy=None,
+                 client_order_prefix='', keep_raw=False):
         self.api_key = api_key
         self.secret = secret
         self.host = host if host else "https://api.binance.com"
@@ -61,51 +66,167 @@ class BinanceSpotHttp(object):
         self.timeout = timeout
         self.order_count_lock = Lock()
         self.order_count = 1_000_000
+        if client_order_prefix and (len(client_order_prefix) > CLIENT_ORDER_PREFIX_MAX_LENGTH
+                                    or not client_order_prefix.isalnum()):
+            raise ValueError(f"client_order_prefix must be at most {CLIENT_ORDER_PREFIX_MAX_LENGTH} letters/digits")
+        self.client_order_tag = "x-A6SIDXVS" + client_order_prefix  # 多個process同時下單時用前綴區分是誰的單
+        self.keep_raw = keep_raw  # 訂單記錄是否保留原始json
         self.try_counts = try_counts  # 嘗試失敗次數
         self.proxy_host = proxy_host
         self.proxy_port = proxy_port
+        self.pool_connections = pool_connections  # 連線池數量(每個host一個)
+        self.pool_maxsize = pool_maxsize  # 每個host最多保持的連線數
+        self._proxies = self._build_proxies()
+        self.session_lock = Lock()
+        self.session = self._create_session()
+        self.local = local()
+        self.last_error = None  # 最近一次失敗請求的錯誤內容
+        self.request_count = 0  # 發出去的http請求數量(包含重試)
+        self.request_count_lock = Lock()
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(SPOT_RATE_LIMITS, SPOT_ENDPOINT_WEIGHTS, SPOT_ORDER_ENDPOINTS)
+        self.rate_limiter = rate_limiter  # 同一個帳號的gateway可以共用
+        if retry_policy is None:
+            retry_policy = RetryPolicy(try_counts=try_counts)
+        self.retry_policy = retry_policy  # 決定哪些錯誤要重試, 重試前等多久
+
+    @property
+    def last_error(self):
+        """
+        最近一次失敗請求的錯誤內容, 每個執行緒各自一份, 同時下單時不會互相覆蓋.
+        """
+        return getattr(self.local, 'last_error', None)
+
+    @last_error.setter
+    def last_error(self, error):
+        self.local.last_error = error
 
     @property
     def proxies(self):
+        return self._proxies
+
+    def _build_proxies(self):
         if self.proxy_host and self.proxy_port:
             proxy = f"http://{self.proxy_host}:{self.proxy_port}"
             return {"http": proxy, "https": proxy}
 
         return None
 
+    def _create_session(self):
+        """
+        建立keep-alive的連線池， 所有請求共用同一個session, 不用每次都重新TCP/TLS握手.
+        :return: requests.Session
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({"X-MBX-APIKEY": self.api_key})
+        if self._proxies:
+            session.proxies.update(self._proxies)
+        return session
+
+    def reset_session(self):
+        """
+        連線出錯時重建連線池， 避免壞掉的連線一直留在池裡.
+        """
+        with self.session_lock:
+            old_session = self.session
+            self.session = self._create_session()
+        old_session.close()
+
+    def close(self):
+        self.session.close()
+
     def build_parameters(self, params: dict):
         keys = list(params.keys())
         keys.sort()
         return '&'.join([f"{k}={params[k]}" for k in params.keys()])
 
     def request(self, req_method: RequestMethod, path: str, requery_dict=None, verify=False):
-        url = self.host + path
-
-        if verify:
-            query_str = self._sign(requery_dict)
-            url += '?' + query_str
-        elif requery_dict:
-            url += '?' + self.build_parameters(requery_dict)
-        headers = {"X-MBX-APIKEY": self.api_key}
-        for i in range(0, self.try_counts):
+        """
+        送出請求, 依照錯誤類型決定重試/重新簽名/直接放棄.
+        :return: 成功時回傳交易所的json, 失敗時回傳GatewayError(bool值是False)
+        """
+        start_time = time.monotonic()
+        self.last_error = None
+        attempt = 0
+        maybe_sent = False  # 之前有一次送出後沒拿到明確的結果
+        while True:
+            url = self.host + path
+            if verify:
+                query_str = self._sign(requery_dict)
+                url += '?' + query_str
+            elif requery_dict:
+                url += '?' + self.build_parameters(requery_dict)
+
+            attempt += 1
+            retry_after = None
+            sent_time = None  # 送出的時間, 記錄完延遲之後清掉
+            costs = self.rate_limiter.get_costs(req_method.value, path, requery_dict)
             try:
-                response = requests.request(req_method.value, url=url, headers=headers, timeout=self.timeout, proxies=self.proxies)
+                self.rate_limiter.acquire(req_method.value, path, requery_dict, costs)
+                with self.request_count_lock:
+                    self.request_count += 1
+                count_request()
+                sent_time = time.perf_counter()
+                response = self.session.request(req_method.value, url=url, timeout=self.timeout)
+                elapsed = time.perf_counter() - sent_time
+                sent_time = None
+                used = self.rate_limiter.update_from_headers(response.headers)
+                observe_request(req_method.value, path, elapsed, response.status_code, costs, used)
                 if response.status_code == 200:
                     return response.json()
-                else:
-                    print(response.json(), response.status_code)
-            except Exception as error:
-                print(f"請求{path}時發生了錯誤: {error}")
-                time.sleep(3)
-        return None
+
+                try:
+                    code, msg = parse_error_body(response.json())
+                except ValueError:
+                    code, msg = None, response.text[:200]
+                if response.status_code in (418, 429):  # 超過頻率限制, 暫停到Retry-After之後
+                    retry_after = get_retry_after(response.headers) or 60
+                    self.rate_limiter.block(retry_after)
+                error = GatewayError(path, response.status_code, code, msg)
+            except requests.exceptions.ConnectionError as e:
+                self.reset_session()  # 連線中斷, 重建連線池
+                error = GatewayError(path, msg=f"connection error: {e}")
+            except Exception as e:
+                error = GatewayError(path, msg=str(e))
+            if sent_time is not None:  # 送出之後連線中斷或逾時
+                observe_request(req_method.value, path, time.perf_counter() - sent_time, None, costs)
+            if is_unknown_result(error.status):
+                maybe_sent = True
+
+            error.action = self.retry_policy.classify(error.status, error.code)
+            error.attempts = attempt
+            self.last_error = error
+            delay = self.retry_policy.get_delay(attempt - 1, retry_after)
+            retry = self.retry_policy.should_retry(error.action, attempt, start_time, delay)
+            observe_error(req_method.value, path, error.code, error.action, retry)
+            if not retry:
+                query = get_order_query(req_method.value, requery_dict) if maybe_sent and verify else None
+                if query is not None:
+                    # 重送的下單回傳clientOrderId重複, 或一直沒拿到結果: 第一次送出的可能已經掛上了, 先查詢
+                    order = self.request(RequestMethod.GET, path, query, verify=True)
+                    if order:
+                        logger.warning("下單%s的結果不確定(%s), 查到已經送出的訂單%s", path, error,
+                                       query['origClientOrderId'])
+                        return order
+                logger.warning("請求%s失敗: %s", path, error)
+                return error
+
+            logger.info("請求%s失敗: %s, %.2f秒後重試", path, error, delay)
+            if error.action == RetryAction.RESIGN and verify and 'timestamp' in requery_dict:
+                requery_dict['timestamp'] = int(time.time() * 1000)
+            time.sleep(delay)
 
     def get_server_time(self):
         path = '/api/v3/time'
         return self.request(req_method=RequestMethod.GET, path=path)
 
-    def get_exchange_info(self):
+    def get_exchange_info(self, symbol=None):
 
         """
+        :param symbol: 只查詢單一交易對, 不傳則回傳全部交易對
         return:
          the exchange info in json format:
         {'timezone': 'UTC',
@@ -134,7 +255,8 @@ class BinanceSpotHttp(object):
         """
 
         path = '/api/v3/exchangeInfo'
-        return self.request(req_method=RequestMethod.GET, path=path)
+        query_dict = {"symbol": symbol} if symbol else None
+        return self.request(req_method=RequestMethod.GET, path=path, requery_dict=query_dict)
 
     def get_order_book(self, symbol, limit=5):
         """
@@ -160,8 +282,8 @@ class BinanceSpotHttp(object):
         :param start_time:
         :param end_time:
         :param limit:
-        :param max_try_time:
-        :return:
+        :param max_try_time: 已經不使用, 重試改由RetryPolicy處理, 保留參數給舊的呼叫端
+        :return: K線列表, 請求失敗時是空的列表
         """
 
         path = "/api/v3/klines"
@@ -178,10 +300,9 @@ class BinanceSpotHttp(object):
         if end_time:
             query_dict['endTime'] = end_time
 
-        for i in range(max_try_time):
-            data = self.request(RequestMethod.GET, path, query_dict)
-            if isinstance(data, list) and len(data):
-                return data
+        # 暫時性的錯誤已經由RetryPolicy重試過了, 不再外加一層重試
+        data = self.request(RequestMethod.GET, path, query_dict)
+        return data if isinstance(data, list) else []  # 失敗時跟沒有資料一樣回傳空的列表, 錯誤在last_error
 
     def get_latest_price(self, symbol):
         """
@@ -217,6 +338,26 @@ class BinanceSpotHttp(object):
         path = "/api/v3/ticker/bookTicker"
         return self.request(RequestMethod.GET, path)
 
+    def create_listen_key(self):
+        """
+        申請user data stream的listenKey, 只需要api key, 不用簽名.
+        :return: {'listenKey': 'pqia91ma19a5s61cv6a81va65sdf19v8a65a1a5s61cv6a81va65sdf19v8a65a1'}
+        """
+        path = "/api/v3/userDataStream"
+        return self.request(RequestMethod.POST, path)
+
+    def keep_alive_listen_key(self, listen_key):
+        """
+        延長listenKey的有效時間60分鐘.
+        :return: {}
+        """
+        path = "/api/v3/userDataStream"
+        return self.request(RequestMethod.PUT, path, {"listenKey": listen_key})
+
+    def close_listen_key(self, listen_key):
+        path = "/api/v3/userDataStream"
+        return self.request(RequestMethod.DELETE, path, {"listenKey": listen_key})
+
     def get_client_order_id(self):
         """
         generate the client_order_id for user.
@@ -224,7 +365,13 @@ class BinanceSpotHttp(object):
         """
         with self.order_count_lock:
             self.order_count += 1
-            return "x-A6SIDXVS" + str(self.get_current_timestamp()) + str(self.order_count)
+            return self.client_order_tag + str(self.get_current_timestamp()) + str(self.order_count)
+
+    def is_own_order(self, client_order_id):
+        """
+        是不是這個gateway(同樣的client_order_prefix)下的單.
+        """
+        return bool(client_order_id) and client_order_id.startswith(self.client_order_tag)
 
     def get_current_timestamp(self):
         """
@@ -287,7 +434,7 @@ class BinanceSpotHttp(object):
             else:
                 raise ValueError("stopPrice must greater than 0")
 
-        return self.request(RequestMethod.POST, path=path, requery_dict=params, verify=True)
+        return to_orders(self.request(RequestMethod.POST, path=path, requery_dict=params, verify=True), self.keep_raw)
 
     def get_order(self, symbol: str, client_order_id: str):
         """
@@ -299,7 +446,7 @@ class BinanceSpotHttp(object):
         path = "/api/v3/order"
         prams = {"symbol": symbol, "timestamp": self.get_current_timestamp(), "origClientOrderId": client_order_id}
 
-        return self.request(RequestMethod.GET, path, prams, verify=True)
+        return to_orders(self.request(RequestMethod.GET, path, prams, verify=True), self.keep_raw)
 
     def cancel_order(self, symbol, client_order_id):
         """
@@ -316,9 +463,9 @@ class BinanceSpotHttp(object):
         for i in range(0, 3):
             try:
                 order = self.request(RequestMethod.DELETE, path, params, verify=True)
-                return order
+                return to_orders(order, self.keep_raw)
             except Exception as error:
-                print(f'cancel order error:{error}')
+                logger.warning("cancel order error: %s", error)
         return
 
     def get_open_orders(self, symbol=None):
@@ -333,7 +480,7 @@ class BinanceSpotHttp(object):
         if symbol:
             params["symbol"] = symbol
 
-        return self.request(RequestMethod.GET, path, params, verify=True)
+        return to_orders(self.request(RequestMethod.GET, path, params, verify=True), self.keep_raw)
 
     def cancel_open_orders(self, symbol):
         """
@@ -348,7 +495,7 @@ class BinanceSpotHttp(object):
                   "symbol": symbol
                   }
 
-        return self.request(RequestMethod.DELETE, path, params, verify=True)
+        return to_orders(self.request(RequestMethod.DELETE, path, params, verify=True), self.keep_raw)
 
     def get_account_info(self):
         """
@@ -0,0 +1,253 @@
+# Binance websocket streams.
+
+import json
+import logging
+import time
+from threading import Thread, Event, Lock
+from .order import Order
+from .retry_policy import GatewayError
+
+try:
+    import websocket  # pip install websocket-client
+except ImportError:
+    websocket = None
+
+logger = logging.getLogger('binance.stream')
+
+SPOT_STREAM_HOST = 'wss://stream.binance.com:9443'
+FUTURE_STREAM_HOST = 'wss://fstream.binance.com'
+
+
+def parse_execution_report(data: dict):
+    """
+    現貨的executionReport事件轉成跟REST get_order一樣的Order.
+    取消訂單時c是取消請求的id, C才是原本訂單的clientOrderId.
+    """
+    return Order.from_dict({
+        'symbol': data['s'],
+        'orderId': data['i'],
+        'clientOrderId': data.get('C') or data['c'],
+        'side': data['S'],
+        'type': data['o'],
+        'status': data['X'],
+        'price': data['p'],
+        'origQty': data['q'],
+        'executedQty': data['z'],
+        'updateTime': data['E']
+    })
+
+
+def parse_order_trade_update(data: dict):
+    """
+    合約的ORDER_TRADE_UPDATE事件轉成跟REST get_order一樣的Order.
+    """
+    order = data['o']
+    return Order.from_dict({
+        'symbol': order['s'],
+        'orderId': order['i'],
+        'clientOrderId': order['c'],
+        'side': order['S'],
+        'type': order['o'],
+        'status': order['X'],
+        'price': order['p'],
+        'origQty': order['q'],
+        'executedQty': order['z'],
+        'updateTime': data['E']
+    })
+
+
+class BinanceWebsocket(object):
+
+    def __init__(self, reconnect_delay=5, ping_interval=60):
+        """
+        websocket連線的基本類別, 斷線會自動重連, 子類別實作get_url和on_data.
+        :param reconnect_delay: 斷線後多久重新連線(秒)
+        :param ping_interval: 多久送一次ping(秒)
+        """
+        if websocket is None:
+            raise ImportError("websocket streams need the websocket-client package: pip install websocket-client")
+
+        self.reconnect_delay = reconnect_delay
+        self.ping_interval = ping_interval
+        self.ws = None
+        self.connected = False
+        self.connect_count = 0
+        self.stop_event = Event()
+        self.thread = None
+
+    def get_url(self):
+        raise NotImplementedError
+
+    def on_data(self, data: dict):
+        raise NotImplementedError
+
+    def on_connected(self):
+        """
+        每次連線(包含重連)成功後呼叫.
+        """
+        pass
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.ws:
+            self.ws.close()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            url = self.get_url()
+            if url:
+                self.ws = websocket.WebSocketApp(url, on_open=self._on_open, on_message=self._on_message,
+                                                 on_error=self._on_error, on_close=self._on_close)
+                self.ws.run_forever(ping_interval=self.ping_interval, ping_timeout=10)
+            self.connected = False
+            self.stop_event.wait(self.reconnect_delay)
+
+    def _on_open(self, ws):
+        self.connected = True
+        self.connect_count += 1
+        self.on_connected()
+
+    def _on_message(self, ws, message):
+        data = json.loads(message)
+        if isinstance(data, dict) and 'stream' in data and 'data' in data:  # combined stream
+            data = data['data']
+        self.on_data(data)
+
+    def _on_error(self, ws, error):
+        logger.warning("websocket error: %s", error)
+
+    def _on_close(self, ws, close_status_code, close_msg):
+        self.connected = False
+
+
+class BinanceUserStream(BinanceWebsocket):
+
+    def __init__(self, http_client, ws_host, on_order=None, on_connected=None, keepalive_interval=30 * 60, **kwargs):
+        """
+        帳戶資料推送(user data stream), 管理listenKey的建立/延長/關閉, 把訂單更新推給交易程式.
+        :param http_client: BinanceSpotHttp or BinanceFutureHttp, 用來申請listenKey
+        :param ws_host: SPOT_STREAM_HOST or FUTURE_STREAM_HOST, 測試時可以換成本地的websocket server
+        :param on_order: callback(order), order格式跟REST get_order的回傳一樣
+        :param on_connected: callback(), 每次(重新)連線成功時呼叫, 用來補斷線期間漏掉的訂單狀態
+        :param keepalive_interval: 多久延長一次listenKey(秒), listenKey 60分鐘沒延長就失效
+        """
+        super().__init__(**kwargs)
+        self.http_client = http_client
+        self.ws_host = ws_host
+        self.on_order = on_order
+        self.on_connected_callback = on_connected
+        self.keepalive_interval = keepalive_interval
+        self.listen_key = None
+        self.listen_key_lock = Lock()
+        self.keepalive_thread = None
+
+    def start(self):
+        super().start()
+        self.keepalive_thread = Thread(target=self.keepalive, daemon=True)
+        self.keepalive_thread.start()
+
+    def stop(self):
+        super().stop()
+        with self.listen_key_lock:
+            if self.listen_key:
+                self.http_client.close_listen_key(self.listen_key)
+                self.listen_key = None
+
+    def get_url(self):
+        data = self.http_client.create_listen_key()
+        if not data or not data.get('listenKey'):
+            logger.warning("create listenKey failed: %s", data)
+            return None
+
+        with self.listen_key_lock:
+            self.listen_key = data['listenKey']
+        return f"{self.ws_host}/ws/{self.listen_key}"
+
+    def keepalive(self):
+        while not self.stop_event.wait(self.keepalive_interval):
+            with self.listen_key_lock:
+                listen_key = self.listen_key
+            if not listen_key:
+                continue
+
+            if isinstance(self.http_client.keep_alive_listen_key(listen_key), GatewayError):
+                # 延長失敗, 關掉連線重新申請listenKey
+                logger.warning("keepalive listenKey failed, reconnect")
+                if self.ws:
+                    self.ws.close()
+
+    def on_connected(self):
+        if self.on_connected_callback:
+            self.on_connected_callback()
+
+    def on_data(self, data: dict):
+        event = data.get('e')
+        if event == 'executionReport':
+            order = parse_execution_report(data)
+        elif event == 'ORDER_TRADE_UPDATE':
+            order = parse_order_trade_update(data)
+        elif event == 'listenKeyExpired':
+            logger.info("listenKey expired, reconnect")
+            if self.ws:
+                self.ws.close()
+            return
+        else:
+            return
+
+        if self.on_order:
+            self.on_order(order)
+
+
+class BinanceBookTickerStream(BinanceWebsocket):
+
+    def __init__(self, ws_host, symbols, stale_seconds=10, on_ticker=None, **kwargs):
+        """
+        最優買賣價推送(bookTicker), 在記憶體保存每個交易對最新的買一/賣一價.
+        :param ws_host: SPOT_STREAM_HOST or FUTURE_STREAM_HOST
+        :param symbols: 交易對列表, 例如 ['BTCUSDT']
+        :param stale_seconds: 超過幾秒沒更新就當作過期, 讓呼叫端改用REST查詢
+        :param on_ticker: callback(symbol, bid_price, ask_price), 每次買一/賣一價更新時呼叫
+        """
+        super().__init__(**kwargs)
+        self.ws_host = ws_host
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.stale_seconds = stale_seconds
+        self.tickers = {}  # symbol -> (bid_price, ask_price, update_id, receive_time)
+        self.on_ticker = on_ticker
+
+    def get_url(self):
+        streams = [f"{symbol.lower()}@bookTicker" for symbol in self.symbols]
+        return f"{self.ws_host}/stream?streams={'/'.join(streams)}"
+
+    def on_connected(self):
+        # 重新連線後舊的報價可能已經過時
+        self.tickers = {}
+
+    def on_data(self, data: dict):
+        if 'b' in data and 'a' in data and 'u' in data:  # bookTicker, 現貨沒有e欄位
+            symbol = data['s']
+            update_id = data['u']
+            ticker = self.tickers.get(symbol)
+            if ticker and update_id <= ticker[2]:
+                return  # 重複或亂序的推送
+            bid_price, ask_price = float(data['b']), float(data['a'])
+            self.tickers[symbol] = (bid_price, ask_price, update_id, time.monotonic())
+            if self.on_ticker:
+                self.on_ticker(symbol, bid_price, ask_price)
+
+    def is_stale(self, receive_time):
+        return not self.connected or time.monotonic() - receive_time > self.stale_seconds
+
+    def get_bid_ask(self, symbol):
+        """
+        :return: (bid_price, ask_price), 沒有資料或已經過期時回傳None
+        """
+        ticker = self.tickers.get(symbol)
+        if ticker is None or self.is_stale(ticker[3]):
+            return None
+        return ticker[0], ticker[1]
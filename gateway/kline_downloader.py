@@ -0,0 +1,169 @@
+# Paginated, parallel historical kline downloader with a local cache.
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.kline_store import KlineStore, klines_to_columns
+from .binance_spot import Interval
+
+try:
+    import numpy as np  # pip install numpy
+except ImportError:
+    np = None
+
+logger = logging.getLogger('binance.kline')
+
+INTERVAL_MILLISECONDS = {
+    Interval.MINUTE_1: 60 * 1000,
+    Interval.MINUTE_3: 3 * 60 * 1000,
+    Interval.MINUTE_5: 5 * 60 * 1000,
+    Interval.MINUTE_15: 15 * 60 * 1000,
+    Interval.MINUTE_30: 30 * 60 * 1000,
+    Interval.HOUR_1: 3600 * 1000,
+    Interval.HOUR_2: 2 * 3600 * 1000,
+    Interval.HOUR_4: 4 * 3600 * 1000,
+    Interval.HOUR_6: 6 * 3600 * 1000,
+    Interval.HOUR_8: 8 * 3600 * 1000,
+    Interval.HOUR_12: 12 * 3600 * 1000,
+    Interval.DAY_1: 86400 * 1000,
+    Interval.DAY_3: 3 * 86400 * 1000,
+    Interval.WEEK_1: 7 * 86400 * 1000,
+}
+
+
+def merge_ranges(ranges, step):
+    """
+    合併重疊或相鄰(差一根K線)的 [start, end] 區間, 區間含頭尾的開盤時間.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + step:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(covered, start, end, step):
+    """
+    :param covered: 已經下載過的區間(merge_ranges的結果)
+    :return: [start, end] 之中還沒下載過的區間, 邊界對齊K線週期
+    """
+    missing = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_end < cursor:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > cursor:
+            missing.append([cursor, min(covered_start - step, end)])
+        cursor = max(cursor, covered_end + step)
+    if cursor <= end:
+        missing.append([cursor, end])
+    return missing
+
+
+def split_pages(ranges, step, limit):
+    """
+    每個區間切成最多limit根K線的分頁.
+    """
+    pages = []
+    for start, end in ranges:
+        for page_start in range(start, end + 1, step * limit):
+            pages.append((page_start, min(page_start + step * (limit - 1), end)))
+    return pages
+
+
+def find_gaps(open_times, start, end, step):
+    """
+    :param open_times: 排序好的開盤時間陣列
+    :return: 區間內缺少的K線 [(start, end)], 例如交易所維護期間
+    """
+    if not len(open_times):
+        return [(start, end)]
+
+    gaps = []
+    if open_times[0] > start:
+        gaps.append((start, int(open_times[0]) - step))
+    for i in np.flatnonzero(np.diff(open_times) > step):
+        gaps.append((int(open_times[i]) + step, int(open_times[i + 1]) - step))
+    if open_times[-1] < end:
+        gaps.append((int(open_times[-1]) + step, end))
+    return gaps
+
+
+class KlineDownloader(object):
+
+    def __init__(self, http_client, max_workers=4, limit=1000, store=None):
+        """
+        把一段時間切成多頁同時下載K線, 每個請求一樣經過gateway的頻率限制, 不會超出額度.
+        下載過的K線和區間存在KlineStore(每個交易對/週期一份), 之後只下載缺少的部分.
+        :param http_client: BinanceSpotHttp or BinanceFutureHttp
+        :param max_workers: 同時下載的分頁數量
+        :param limit: 每頁K線數量, 現貨最多1000, 合約最多1500
+        :param store: utils.kline_store.KlineStore, None表示用預設的資料夾
+        """
+        if np is None:
+            raise ImportError("kline downloader needs the numpy package: pip install numpy")
+        self.http_client = http_client
+        self.max_workers = max_workers
+        self.limit = limit
+        self.store = store if store is not None else KlineStore()
+        self.gaps = {}  # (symbol, interval) -> 最近一次下載範圍內缺少的K線
+
+    def fetch_page(self, symbol, interval: Interval, start_time, end_time):
+        """
+        :return: K線列表, 這段時間沒有資料時是空的列表, 請求失敗時回傳None
+        """
+        # 沒有資料是正常的(例如上架之前); 請求失敗已經由RetryPolicy重試過了
+        data = self.http_client.get_kline(symbol, interval, start_time=start_time, end_time=end_time,
+                                          limit=self.limit)
+        if isinstance(data, list) and data:
+            return data
+        if getattr(self.http_client, 'last_error', None) is not None:  # GatewayError的bool值是False
+            return None
+        return []
+
+    def download(self, symbol, interval: Interval, start_time, end_time=None):
+        """
+        :param start_time: 開始時間(毫秒)
+        :param end_time: 結束時間(毫秒), None表示現在; 還沒收盤的K線不會快取也不會回傳
+        :return: 依開盤時間排序、去除重複的K線, {欄位名稱: memmap陣列}, 可以直接交給GridBacktester.run
+        """
+        step = INTERVAL_MILLISECONDS.get(interval)
+        if step is None:
+            raise ValueError(f"interval {interval.value} has no fixed length, can not be paginated")
+
+        last_closed = (int(time.time() * 1000) // step - 1) * step  # 最後一根已收盤K線的開盤時間
+        start_time = -(-int(start_time) // step) * step
+        end_time = min(int(end_time) // step * step if end_time else last_closed, last_closed)
+        if start_time > end_time:
+            return self.store.read(symbol, interval, start_time, end_time)  # 空的欄位
+
+        ranges = self.store.get_ranges(symbol, interval)
+        pages = split_pages(missing_ranges(merge_ranges(ranges, step), start_time, end_time, step), step, self.limit)
+        if pages:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='kline') as pool:
+                results = list(pool.map(lambda page: self.fetch_page(symbol, interval, *page), pages))
+
+            failed_pages = 0
+            klines = []
+            for (page_start, page_end), data in zip(pages, results):
+                if data is None:
+                    failed_pages += 1
+                    continue
+                klines.extend(kline for kline in data if page_start <= kline[0] <= last_closed)
+                ranges.append([page_start, page_end])
+            self.store.append(symbol, interval, klines_to_columns(klines))  # 頁與頁重疊的K線用開盤時間去重
+            self.store.set_ranges(symbol, interval, merge_ranges(ranges, step))
+            if failed_pages:
+                logger.warning("download %s %s klines: %d/%d pages failed", symbol, interval.value, failed_pages,
+                               len(pages))
+
+        columns = self.store.read(symbol, interval, start_time, end_time)
+        gaps = find_gaps(columns['open_time'], start_time, end_time, step)
+        self.gaps[(symbol, interval)] = gaps
+        if gaps:
+            logger.info("%s %s klines have %d gaps, first: %s", symbol, interval.value, len(gaps), gaps[0])
+        return columns
@@ -0,0 +1,142 @@
+# Compact order records parsed once from the exchange json.
+
+import inspect
+import sys
+from enum import Enum
+
+
+class OrderStatus(str, Enum):  # 訂單狀態:新訂單、部分完成、已完成、取消、待取消、訂單被拒絕、訂單過期
+    NEW = 'NEW'
+    PARTIALLY_FILLED = 'PARTIALLY_FILLED'
+    FILLED = 'FILLED'
+    CANCELED = 'CANCELED'
+    PENDING_CANCEL = 'PENDING_CANCEL'
+    REJECTED = 'REJECTED'
+    EXPIRED = 'EXPIRED'
+    EXPIRED_IN_MATCH = 'EXPIRED_IN_MATCH'
+
+    def __str__(self):
+        return self.value
+
+
+OPEN_STATUSES = (OrderStatus.NEW, OrderStatus.PARTIALLY_FILLED)
+
+
+def parse_status(status):
+    """
+    轉成OrderStatus, 不認識的狀態保留字串(intern過, 比較時不用逐字元比).
+    """
+    try:
+        return OrderStatus(status)
+    except ValueError:
+        return sys.intern(status) if isinstance(status, str) else status
+
+
+class Order(object):
+    """
+    訂單記錄, 價格/數量在建立時就轉成float, 之後不用每次都從字串解析.
+    get()/[] 用交易所的欄位名稱(clientOrderId, price...)讀取, 跟原本的dict用法相容.
+    """
+    __slots__ = ('symbol', 'order_id', 'client_order_id', 'side', 'order_type', 'status', 'price', 'orig_qty',
+                 'executed_qty', 'update_time', 'raw')
+
+    # 交易所的欄位名稱 -> 屬性名稱
+    FIELDS = {
+        'symbol': 'symbol',
+        'orderId': 'order_id',
+        'clientOrderId': 'client_order_id',
+        'side': 'side',
+        'type': 'order_type',
+        'status': 'status',
+        'price': 'price',
+        'origQty': 'orig_qty',
+        'executedQty': 'executed_qty',
+        'updateTime': 'update_time',
+    }
+
+    def __init__(self, symbol, client_order_id, side, price, orig_qty, status=OrderStatus.NEW, order_id=None,
+                 order_type='LIMIT', executed_qty=0.0, update_time=0, raw=None):
+        self.symbol = symbol
+        self.order_id = order_id
+        self.client_order_id = client_order_id
+        self.side = side
+        self.order_type = order_type
+        self.status = status
+        self.price = price
+        self.orig_qty = orig_qty
+        self.executed_qty = executed_qty
+        self.update_time = update_time
+        self.raw = raw  # 原始的json, 只有keep_raw時才保留
+
+    @classmethod
+    def from_dict(cls, data: dict, keep_raw=False):
+        """
+        :param data: REST或推送的訂單json
+        :param keep_raw: 是否保留原始json, 需要用到其他欄位(例如avgPrice)時才開
+        """
+        side = data.get('side')
+        order_type = data.get('type')
+        # 現貨撤單回傳的clientOrderId是撤單請求的id, origClientOrderId才是訂單的
+        return cls(symbol=sys.intern(data['symbol']) if data.get('symbol') else data.get('symbol'),
+                   client_order_id=data.get('origClientOrderId') or data.get('clientOrderId'),
+                   side=sys.intern(side) if side else side,
+                   price=float(data.get('price') or 0),
+                   orig_qty=float(data.get('origQty') or 0),
+                   status=parse_status(data.get('status')),
+                   order_id=data.get('orderId'),
+                   order_type=sys.intern(order_type) if order_type else order_type,
+                   executed_qty=float(data.get('executedQty') or 0),
+                   update_time=data.get('updateTime') or data.get('transactTime') or data.get('time') or 0,
+                   raw=data if keep_raw else None)
+
+    @property
+    def is_open(self):
+        return self.status in OPEN_STATUSES
+
+    def get(self, key, default=None):
+        attr = self.FIELDS.get(key)
+        if attr is not None:
+            value = getattr(self, attr)
+            return default if value is None else value
+        if self.raw is not None:
+            return self.raw.get(key, default)
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.FIELDS or (self.raw is not None and key in self.raw)
+
+    def to_dict(self):
+        """
+        :return: 交易所欄位名稱的dict, 狀態是字串, 可以直接存成json
+        """
+        data = {key: getattr(self, attr) for key, attr in self.FIELDS.items()}
+        data['status'] = getattr(self.status, 'value', self.status)
+        return data
+
+    def __repr__(self):
+        status = getattr(self.status, 'value', self.status)
+        return f"Order({self.symbol} {self.side} {self.orig_qty}@{self.price} {status} {self.client_order_id})"
+
+
+def to_orders(data, keep_raw=False):
+    """
+    把gateway回傳的json轉成Order: 訂單dict -> Order, list -> 逐筆轉換, 其他(錯誤, GatewayError)原樣回傳.
+    async gateway回傳coroutine時, 包成await之後再轉換的coroutine.
+    """
+    if inspect.isawaitable(data):
+        return _to_orders_async(data, keep_raw)
+    if isinstance(data, dict) and data.get('clientOrderId') and data.get('symbol'):
+        return Order.from_dict(data, keep_raw)
+    if isinstance(data, list):
+        return [to_orders(item, keep_raw) for item in data]
+    return data
+
+
+async def _to_orders_async(coroutine, keep_raw=False):
+    return to_orders(await coroutine, keep_raw)
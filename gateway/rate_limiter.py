@@ -0,0 +1,207 @@
+# Client side rate limiter for Binance REQUEST_WEIGHT / ORDERS limits.
+
+import asyncio
+import json
+import time
+from threading import Lock
+from urllib.parse import unquote
+
+INTERVAL_SECONDS = {'SECOND': 1, 'MINUTE': 60, 'HOUR': 3600, 'DAY': 86400}
+HEADER_INTERVALS = {'S': 'SECOND', 'M': 'MINUTE', 'H': 'HOUR', 'D': 'DAY'}
+
+# 交易所沒回傳exchangeInfo之前先用的預設限制, 拿到exchangeInfo的rateLimits之後會覆蓋
+SPOT_RATE_LIMITS = [
+    {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 1200},
+    {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': 50},
+    {'rateLimitType': 'ORDERS', 'interval': 'DAY', 'intervalNum': 1, 'limit': 160000},
+]
+FUTURE_RATE_LIMITS = [
+    {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 2400},
+    {'rateLimitType': 'ORDERS', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 1200},
+    {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': 300},
+]
+
+# (method, path) -> (帶symbol時的權重, 不帶symbol時的權重)
+SPOT_ENDPOINT_WEIGHTS = {
+    ('GET', '/api/v3/time'): (1, 1),
+    ('GET', '/api/v3/exchangeInfo'): (20, 20),
+    ('GET', '/api/v3/depth'): (5, 5),
+    ('GET', '/api/v3/klines'): (2, 2),
+    ('GET', '/api/v3/ticker/price'): (2, 4),
+    ('GET', '/api/v3/ticker/bookTicker'): (2, 4),
+    ('POST', '/api/v3/order'): (1, 1),
+    ('GET', '/api/v3/order'): (4, 4),
+    ('DELETE', '/api/v3/order'): (1, 1),
+    ('GET', '/api/v3/openOrders'): (6, 80),
+    ('DELETE', '/api/v3/openOrders'): (1, 1),
+    ('GET', '/api/v3/account'): (20, 20),
+    ('POST', '/api/v3/userDataStream'): (2, 2),
+    ('PUT', '/api/v3/userDataStream'): (2, 2),
+    ('DELETE', '/api/v3/userDataStream'): (2, 2),
+}
+FUTURE_ENDPOINT_WEIGHTS = {
+    ('GET', '/fapi/v1/time'): (1, 1),
+    ('GET', '/fapi/v1/exchangeInfo'): (1, 1),
+    ('GET', '/fapi/v1/depth'): (2, 2),
+    ('GET', '/fapi/v1/klines'): (5, 5),
+    ('GET', '/fapi/v1/ticker/price'): (1, 2),
+    ('GET', '/fapi/v1/ticker/bookTicker'): (2, 5),
+    ('POST', '/fapi/v1/order'): (0, 0),
+    ('GET', '/fapi/v1/order'): (1, 1),
+    ('DELETE', '/fapi/v1/order'): (1, 1),
+    ('POST', '/fapi/v1/batchOrders'): (5, 5),
+    ('DELETE', '/fapi/v1/batchOrders'): (1, 1),
+    ('GET', '/fapi/v1/openOrders'): (1, 40),
+    ('DELETE', '/fapi/v1/allOpenOrders'): (1, 1),
+    ('GET', '/fapi/v1/balance'): (5, 5),
+    ('GET', '/fapi/v1/account'): (5, 5),
+    ('GET', '/fapi/v1/positionRisk'): (5, 5),
+    ('POST', '/fapi/v1/listenKey'): (1, 1),
+    ('PUT', '/fapi/v1/listenKey'): (1, 1),
+    ('DELETE', '/fapi/v1/listenKey'): (1, 1),
+}
+
+# 會計入ORDERS限制的請求
+SPOT_ORDER_ENDPOINTS = {('POST', '/api/v3/order')}
+FUTURE_ORDER_ENDPOINTS = {('POST', '/fapi/v1/order'), ('POST', '/fapi/v1/batchOrders')}
+
+
+class TokenBucket(object):
+
+    def __init__(self, limit, seconds):
+        self.capacity = limit
+        self.rate = limit / seconds  # 每秒補充的額度
+        self.tokens = limit
+        self.update_time = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.update_time) * self.rate)
+        self.update_time = now
+
+    def sync(self, used):
+        """
+        用交易所回傳的已使用量校正, 只往保守的方向調整, 因為還在路上的請求沒有算進去.
+        """
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RateLimiter(object):
+
+    def __init__(self, rate_limits=None, weights=None, order_endpoints=None, share=1.0, shared_block=None):
+        """
+        依照exchangeInfo的rateLimits建立token bucket, 在送出請求之前先扣額度, 額度不夠時排隊等待,
+        不要等交易所回429/418才停.
+        多個gateway(同一個帳號/IP)可以共用同一個RateLimiter.
+        :param rate_limits: exchangeInfo['rateLimits']格式
+        :param weights: SPOT_ENDPOINT_WEIGHTS or FUTURE_ENDPOINT_WEIGHTS
+        :param order_endpoints: SPOT_ORDER_ENDPOINTS or FUTURE_ORDER_ENDPOINTS
+        :param share: 只使用額度的幾成, 多個process共用同一個帳號時可以分配額度
+        :param shared_block: multiprocessing.Value('d'), 多個process共用的暫停期限(time.time()),
+                             任何一個process收到429/418, 所有process都一起暫停
+        """
+        self.weights = weights or {}
+        self.order_endpoints = order_endpoints or set()
+        self.share = share
+        self.lock = Lock()
+        self.buckets = {}  # (rateLimitType, interval, intervalNum) -> TokenBucket
+        self.blocked_until = 0
+        self.shared_block = shared_block
+        self.configure(rate_limits or [])
+
+    def configure(self, rate_limits: list):
+        """
+        用exchangeInfo回傳的rateLimits更新限制.
+        """
+        with self.lock:
+            buckets = {}
+            for item in rate_limits:
+                key = (item['rateLimitType'], item['interval'], item['intervalNum'])
+                seconds = INTERVAL_SECONDS[item['interval']] * item['intervalNum']
+                bucket = TokenBucket(item['limit'] * self.share, seconds)
+                previous = self.buckets.get(key)
+                if previous is not None:
+                    bucket.tokens = min(bucket.capacity, previous.tokens)
+                    bucket.update_time = previous.update_time
+                buckets[key] = bucket
+            self.buckets = buckets
+
+    def get_costs(self, method, path, params=None):
+        """
+        :return: {rateLimitType: 這個請求要花的額度}
+        """
+        with_symbol, without_symbol = self.weights.get((method, path), (1, 1))
+        costs = {'REQUEST_WEIGHT': with_symbol if params and 'symbol' in params else without_symbol}
+        if params is not None and (method, path) in self.order_endpoints:
+            if 'batchOrders' in params:
+                costs['ORDERS'] = len(json.loads(unquote(params['batchOrders'])))
+            else:
+                costs['ORDERS'] = 1
+        return costs
+
+    def reserve(self, method, path, params=None, costs=None):
+        """
+        先扣掉額度(可以扣到負的), 回傳要等多久才能送出, 先來的先排.
+        :param costs: 已經算好的get_costs結果, None時重新計算
+        :return: 等待秒數
+        """
+        if costs is None:
+            costs = self.get_costs(method, path, params)
+        now = time.monotonic()
+        wait = 0
+        with self.lock:
+            for (limit_type, _, _), bucket in self.buckets.items():
+                cost = costs.get(limit_type, 0)
+                if cost <= 0:
+                    continue
+                bucket.refill(now)
+                bucket.tokens -= cost
+                if bucket.tokens < 0:
+                    wait = max(wait, -bucket.tokens / bucket.rate)
+            wait = max(wait, self.blocked_until - now)
+        if self.shared_block is not None:
+            wait = max(wait, self.shared_block.value - time.time())
+        return wait
+
+    def acquire(self, method, path, params=None, costs=None):
+        wait = self.reserve(method, path, params, costs)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, method, path, params=None, costs=None):
+        wait = self.reserve(method, path, params, costs)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """
+        用回應的X-MBX-USED-WEIGHT-1M, X-MBX-ORDER-COUNT-10S等header校正已使用量.
+        :return: {header名稱(大寫): 交易所回報的已使用量}
+        """
+        used = {}
+        with self.lock:
+            for name, value in headers.items():
+                name = name.upper()
+                if name.startswith('X-MBX-USED-WEIGHT-'):
+                    limit_type, interval = 'REQUEST_WEIGHT', name[len('X-MBX-USED-WEIGHT-'):]
+                elif name.startswith('X-MBX-ORDER-COUNT-'):
+                    limit_type, interval = 'ORDERS', name[len('X-MBX-ORDER-COUNT-'):]
+                else:
+                    continue
+
+                used[name] = int(value)
+                key = (limit_type, HEADER_INTERVALS.get(interval[-1:]), int(interval[:-1] or 1))
+                bucket = self.buckets.get(key)
+                if bucket is not None:
+                    bucket.refill(time.monotonic())
+                    bucket.sync(used[name] * self.share)  # 額度按比例分配時, 已使用量也按比例算
+        return used
+
+    def block(self, seconds):
+        """
+        收到429/418之後, 在Retry-After秒內所有請求都先暫停.
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        if self.shared_block is not None:
+            with self.shared_block.get_lock():
+                self.shared_block.value = max(self.shared_block.value, time.time() + seconds)
@@ -0,0 +1,159 @@
+# Retry policy for Binance http requests.
+
+import random
+import time
+from enum import Enum
+
+
+class RetryAction(Enum):
+    RETRY = 'RETRY'  # 等一下再送一次
+    RESIGN = 'RESIGN'  # 更新timestamp重新簽名後再送
+    FATAL = 'FATAL'  # 再送也一樣會失敗, 直接回傳錯誤
+
+
+# 交易所內部錯誤或忙碌, 稍後重送可能成功
+RETRYABLE_CODES = {
+    -1000,  # UNKNOWN
+    -1001,  # DISCONNECTED
+    -1003,  # TOO_MANY_REQUESTS
+    -1006,  # UNEXPECTED_RESP
+    -1007,  # TIMEOUT
+    -1008,  # SERVER_BUSY
+    -1015,  # TOO_MANY_ORDERS
+}
+
+# 本機時間跟交易所時間差太多, 重新取時間簽名就好
+RESIGN_CODES = {
+    -1021,  # Timestamp for this request is outside of the recvWindow.
+}
+
+RETRYABLE_STATUS = {408, 418, 429, 500, 502, 503, 504}
+
+# 用過的clientOrderId再下單: 合約是-4116, 現貨是-2010(NEW_ORDER_REJECTED)加上 "Duplicate order sent."
+DUPLICATE_ORDER_CODES = {-4116}
+
+
+class GatewayError(object):
+    """
+    請求失敗時回傳的錯誤, bool值是False, 原本 `if order:` 的判斷不用改.
+    也支援dict的get, 可以跟交易所回傳的 {'code': -1013, 'msg': '...'} 一樣使用.
+    """
+
+    def __init__(self, path, status=None, code=None, msg=None, action=RetryAction.RETRY, attempts=0):
+        self.path = path
+        self.status = status  # http狀態碼, 連線錯誤時是None
+        self.code = code  # 交易所的錯誤碼
+        self.msg = msg
+        self.action = action
+        self.attempts = attempts  # 總共送了幾次
+
+    def __bool__(self):
+        return False
+
+    def get(self, key, default=None):
+        return self.to_dict().get(key, default)
+
+    def to_dict(self):
+        return {'code': self.code, 'msg': self.msg, 'status': self.status, 'path': self.path,
+                'attempts': self.attempts}
+
+    def __repr__(self):
+        return f"GatewayError(path={self.path}, status={self.status}, code={self.code}, msg={self.msg}, " \
+               f"attempts={self.attempts})"
+
+
+class RetryPolicy(object):
+
+    def __init__(self, try_counts=5, base_delay=0.5, max_delay=10, deadline=30):
+        """
+        依照錯誤類型決定要不要重試, 重試時用指數退避加上隨機抖動, 避免多個請求同時重送.
+        :param try_counts: 最多送幾次
+        :param base_delay: 第一次重試前等待的秒數上限, 之後每次加倍
+        :param max_delay: 單次等待的秒數上限
+        :param deadline: 一次呼叫(包含所有重試)最多花幾秒, 超過就不再重試
+        """
+        self.try_counts = try_counts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def classify(self, status, code=None):
+        """
+        :param status: http狀態碼, 連線錯誤或逾時的時候是None
+        :param code: 交易所回傳的錯誤碼
+        :return: RetryAction
+        """
+        if code in RESIGN_CODES:
+            return RetryAction.RESIGN
+        if code in RETRYABLE_CODES:
+            return RetryAction.RETRY
+        if status is None or status in RETRYABLE_STATUS:
+            return RetryAction.RETRY
+        # 其他4xx: 餘額不足(-2010), 交易規則(-1013), 參數錯誤, 簽名錯誤... 重送也沒用
+        return RetryAction.FATAL
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        full jitter: 在0到base_delay * 2^attempt之間隨機等待.
+        :param attempt: 第幾次重試, 從0開始
+        :param retry_after: 交易所回傳的Retry-After(秒), 至少要等這麼久
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def should_retry(self, action, attempt, start_time, delay):
+        """
+        :param attempt: 已經送了幾次
+        :param start_time: 呼叫開始的time.monotonic()
+        :param delay: 下一次重試前要等的秒數
+        """
+        if action == RetryAction.FATAL or attempt >= self.try_counts:
+            return False
+        return time.monotonic() - start_time + delay <= self.deadline
+
+
+def parse_error_body(data):
+    """
+    :return: (code, msg), 回傳的內容不是交易所的錯誤格式時code是None
+    """
+    if isinstance(data, dict):
+        return data.get('code'), data.get('msg', data)
+    return None, data
+
+
+def get_retry_after(headers):
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_unknown_result(status):
+    """
+    送出之後沒有拿到明確的結果(連線中斷/逾時, 408, 5xx), 交易所可能已經處理了這個請求.
+    """
+    return status is None or status == 408 or status >= 500
+
+
+def is_duplicate_order(error):
+    """
+    :param error: GatewayError或交易所回傳的錯誤dict
+    """
+    if not isinstance(error, (dict, GatewayError)):
+        return False
+    code = error.get('code')
+    return code in DUPLICATE_ORDER_CODES or (code == -2010 and 'duplicate' in str(error.get('msg')).lower())
+
+
+def get_order_query(req_method, params):
+    """
+    下單(POST)送出後逾時, 重送時同一個clientOrderId被當成重複, 或者一直沒拿到結果, 訂單可能已經在交易所上了.
+    這時用同一個clientOrderId查詢, 查得到就當作下單成功, 不會留下沒有追蹤的掛單.
+    :return: 查詢訂單的參數, 不是帶newClientOrderId的下單請求時回傳None
+    """
+    if req_method != 'POST' or not params or not params.get('newClientOrderId') or not params.get('symbol'):
+        return None
+    return {'symbol': params['symbol'], 'origClientOrderId': params['newClientOrderId'],
+            'timestamp': int(time.time() * 1000)}
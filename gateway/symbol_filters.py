@@ -0,0 +1,151 @@
+# Symbol filter cache for exchangeInfo.
+
+import time
+from threading import Lock
+from utils import load_json, save_json, Precision
+
+# 下單時因為價格/數量/名義價值不符合交易規則而被拒絕的錯誤碼, 遇到時要重新下載交易規則
+FILTER_ERROR_CODES = {
+    -1013,  # Filter failure: PRICE_FILTER / LOT_SIZE / MIN_NOTIONAL ...
+    -1111,  # Precision is over the maximum defined for this asset.
+    -4014,  # 合約: Price not increased by tick size.
+    -4023,  # 合約: Qty not increased by step size.
+    -4164,  # 合約: Order's notional must be no smaller than ...
+}
+
+
+def parse_symbol_filters(item: dict):
+    """
+    把exchangeInfo中單一交易對的資料解析成網格需要的欄位.
+    :param item: exchangeInfo['symbols']中的一筆
+    :return: {'symbol': 'BTCUSDT', 'min_price': 0.01, 'min_qty': 0.001, 'min_notional': 10.0,
+              'tick_size': '0.01', 'step_size': '0.001'}
+    """
+    symbol_data = {'symbol': item['symbol']}
+    for filters in item.get('filters', []):
+        if filters['filterType'] == 'PRICE_FILTER':
+            symbol_data['min_price'] = float(filters['tickSize'])
+            symbol_data['tick_size'] = filters['tickSize']
+        elif filters['filterType'] == 'LOT_SIZE':
+            symbol_data['min_qty'] = float(filters['stepSize'])
+            symbol_data['step_size'] = filters['stepSize']
+        elif filters['filterType'] in ('MIN_NOTIONAL', 'NOTIONAL'):
+            # 現貨的欄位是minNotional, 合約的欄位是notional
+            min_notional = filters.get('minNotional', filters.get('notional'))
+            if min_notional is not None:
+                symbol_data['min_notional'] = float(min_notional)
+    return symbol_data
+
+
+class SymbolFilterCache(object):
+
+    def __init__(self, http_client, ttl=3600, snapshot_name=None):
+        """
+        交易規則(tickSize, stepSize, minNotional)的快取, 按交易對建立索引.
+        只有在過期或者下單因為交易規則被拒絕時才重新下載, 重新啟動時從磁碟快照讀取.
+        :param http_client: BinanceSpotHttp or BinanceFutureHttp
+        :param ttl: 快取有效時間(秒)
+        :param snapshot_name: 快照檔名, 存在utils.utility的TEMP_DIR底下, None表示不存檔
+        """
+        self.http_client = http_client
+        self.ttl = ttl
+        self.snapshot_name = snapshot_name
+        self.lock = Lock()
+        self.refresh_lock = Lock()  # 多個網格同時發現過期時只下載一次
+        self.symbols = {}  # symbol -> symbol_data
+        self.watch_symbols = set()  # 呼叫過get的交易對
+        self.update_times = {}  # symbol -> 最後更新時間
+        self.precisions = {}  # symbol -> Precision, tickSize/stepSize沒變時重複使用
+        self.load_snapshot()
+
+    def load_snapshot(self):
+        if not self.snapshot_name:
+            return
+
+        data = load_json(self.snapshot_name)
+        for symbol, symbol_data in data.get('symbols', {}).items():
+            self.symbols[symbol] = symbol_data
+            self.update_times[symbol] = data.get('update_times', {}).get(symbol, 0)
+
+    def save_snapshot(self):
+        if not self.snapshot_name:
+            return
+
+        with self.lock:
+            data = {'symbols': dict(self.symbols), 'update_times': dict(self.update_times)}
+        save_json(self.snapshot_name, data)
+
+    def is_expired(self, symbol):
+        return time.time() - self.update_times.get(symbol, 0) > self.ttl
+
+    def get(self, symbol):
+        """
+        取得交易對的交易規則, 過期時才會向交易所請求.
+        多個交易對共用快取時整包下載, 一個請求就更新所有交易對.
+        :return: symbol_data or None
+        """
+        self.watch_symbols.add(symbol)
+        if symbol not in self.symbols or self.is_expired(symbol):
+            with self.refresh_lock:
+                if symbol not in self.symbols or self.is_expired(symbol):  # 可能已經被其他執行緒更新了
+                    self.refresh(symbol if len(self.watch_symbols) <= 1 else None)
+        return self.symbols.get(symbol)
+
+    def get_precision(self, symbol):
+        """
+        取得交易對的整數精度引擎, 交易規則更新後tickSize/stepSize有變才重新建立.
+        :return: Precision or None
+        """
+        symbol_data = self.get(symbol)
+        if not symbol_data or symbol_data.get('min_price', 0) <= 0 or symbol_data.get('min_qty', 0) <= 0:
+            return None
+
+        # 舊的快照沒有字串欄位時用float轉回來
+        tick_size = symbol_data.get('tick_size') or str(symbol_data['min_price'])
+        step_size = symbol_data.get('step_size') or str(symbol_data['min_qty'])
+        precision = self.precisions.get(symbol)
+        if precision is None or precision.tick_size != tick_size or precision.step_size != step_size:
+            precision = Precision(tick_size, step_size)
+            self.precisions[symbol] = precision
+        return precision
+
+    def refresh(self, symbol=None):
+        """
+        重新下載交易規則, 現貨支援只下載單一交易對, 合約只能整包下載.
+        :return: True if updated.
+        """
+        data = self.http_client.get_exchange_info(symbol)
+        if not isinstance(data, dict):
+            return False  # 請求失敗時繼續用舊的資料
+
+        rate_limiter = getattr(self.http_client, 'rate_limiter', None)
+        if rate_limiter is not None and data.get('rateLimits'):
+            rate_limiter.configure(data['rateLimits'])  # 用交易所實際的頻率限制
+
+        now = time.time()
+        with self.lock:
+            for item in data.get('symbols', []):
+                if item.get('status') == 'TRADING':
+                    self.symbols[item['symbol']] = parse_symbol_filters(item)
+                    self.update_times[item['symbol']] = now
+                else:
+                    self.symbols.pop(item['symbol'], None)
+                    self.update_times.pop(item['symbol'], None)
+
+        self.save_snapshot()
+        return True
+
+    def invalidate(self, symbol):
+        with self.lock:
+            self.update_times[symbol] = 0
+
+    def check_rejection(self, symbol, error):
+        """
+        下單失敗時檢查是不是交易規則的問題, 是的話讓快取過期, 下一輪重新下載.
+        :param error: GatewayError或交易所回傳的錯誤, 例如 {'code': -1013, 'msg': 'Filter failure: PRICE_FILTER'}
+        :return: True if the cache was invalidated.
+        """
+        if error is not None and hasattr(error, 'get') and error.get('code') in FILTER_ERROR_CODES:
+            self.invalidate(symbol)
+            return True
+        return False
@@ -1,31 +1,35 @@
-import logging
 from utils import config
-from time import sleep
-from trader.binance_spot_trader import BinanceSpotTrader
-from trader.binance_future_trader import BinanceFutureTrader
+from trader.grid_runner import GridRunner
+from trader.supervisor import Supervisor
+from utils.log import setup_logging
+from utils.metrics import MetricsServer
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    filename='log.txt')
-logger = logging.getLogger('binance')
 
 if __name__ == '__main__':
     config.loads('./config.json')  # 載入主配置
+    setup_logging(config)  # 日誌在背景執行緒寫出, 不會卡住網格
 
-    if config.platform == 'binance_spot':
-        trader = BinanceSpotTrader()
-    elif config.platform == 'binance_future':
-        trader = BinanceFutureTrader()
-    else:
+    if config.platform not in ('binance_spot', 'binance_future'):
         print('輸入錯誤')
+        exit(0)
+
+    if config.processes != 1:
+        Supervisor(config).run()  # 交易對分給多個process, 每個process只撤銷/管理自己的單
+        exit(0)
+
+    if config.metrics_port:
+        MetricsServer(port=config.metrics_port).start()  # 給Prometheus抓取 /metrics
+
+    runner = GridRunner(config)  # config.grids設定多個交易對
+    if config.order_journal:
+        runner.resume_orders()  # 從journal接回上次的網格
+    else:
+        runner.cancel_open_orders()
 
-    orders = trader.http_client.cancel_open_orders(config.symbol)
-    print(f"cancel orders: {orders}")
+    if config.user_stream:
+        runner.start_user_stream()  # 訂單成交改由推送通知
 
-    while True:
-        try:
-            trader.start()
-            sleep(20)
+    if config.market_stream:
+        runner.start_market_stream()  # 買一賣一價改由推送更新
 
-        except Exception as error:
-            print(f"catch error: {error}")
-            sleep(5)
+    runner.run()
@@ -0,0 +1,6 @@
+from .matching_engine import MatchingEngine, SimOrder, SimulatorError
+from .price_feed import PriceFeed
+from .exchange import SimulatedExchange, DEFAULT_SYMBOLS
+from .server import ExchangeServer
+from .session import SimulatedSession, connect
+from .stream_server import StreamServer
@@ -0,0 +1,604 @@
+import json
+import random
+import time
+from threading import Lock
+from gateway import OrderSide, OrderStatus
+from gateway.rate_limiter import (RateLimiter, SPOT_ENDPOINT_WEIGHTS, FUTURE_ENDPOINT_WEIGHTS, SPOT_ORDER_ENDPOINTS,
+                                  FUTURE_ORDER_ENDPOINTS)
+from utils import Precision
+from .matching_engine import MatchingEngine, SimulatorError
+from .price_feed import PriceFeed
+
+BAR_MILLISECONDS = 60 * 1000  # 模擬的K線固定是1分鐘
+KLINE_HISTORY = 100_000  # 每個交易對最多保留幾根K線
+LISTEN_KEY_MILLISECONDS = 60 * 60 * 1000  # listenKey 60分鐘沒延長就失效
+
+# 預設的交易對, 交易規則跟交易所差不多
+DEFAULT_SYMBOLS = {
+    'BTCUSDT': {'price': 30000.0, 'tick_size': '0.01', 'step_size': '0.00001', 'min_notional': 5.0},
+    'ETHUSDT': {'price': 2000.0, 'tick_size': '0.01', 'step_size': '0.0001', 'min_notional': 5.0},
+}
+
+SIGNED_ENDPOINTS = {'order', 'openOrders', 'allOpenOrders', 'batchOrders'}  # 要帶timestamp的接口
+INTERNAL_ERROR = {'code': -1001, 'msg': 'Internal error; unable to process your request. Please try again.'}
+
+
+class SimSymbol(object):
+
+    def __init__(self, symbol, price, tick_size, step_size, min_notional=0.0, volatility=0.001, spread_ticks=1,
+                 seed=None, columns=None):
+        """
+        一個交易對的狀態: 交易規則、撮合引擎、行情來源和已經產生的K線.
+        """
+        self.symbol = symbol
+        self.base_asset = symbol[:-4] if symbol.endswith('USDT') else symbol[:-3]
+        self.quote_asset = symbol[len(self.base_asset):]
+        self.tick_size = tick_size
+        self.step_size = step_size
+        self.min_notional = float(min_notional)
+        self.precision = Precision(tick_size, step_size)
+        self.engine = MatchingEngine(symbol, self.precision)
+        self.feed = PriceFeed(price, volatility=volatility, seed=seed, columns=columns)
+        self.spread_ticks = spread_ticks
+        self.klines = []
+        self.quote(price)
+
+    def quote(self, price):
+        """
+        用最新價格設定外部報價, 買一/賣一之間差spread_ticks.
+        """
+        mid = self.precision.price_to_ticks(price)
+        bid = max(mid - self.spread_ticks // 2, 1)
+        self.engine.set_reference(bid, bid + max(self.spread_ticks, 1))
+        if not self.engine.last_price:
+            self.engine.last_price = mid
+
+
+class SimulatedExchange(object):
+
+    def __init__(self, symbols=None, futures=False, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+                 error_statuses=(500, 503), disconnect_rate=0.0, throttle_rate=0.0, weight_limit=None,
+                 order_limit=None, ban_seconds=120, clock_skew_ms=0, depth_qty=1000.0, volume_limit=None,
+                 history_bars=0, seed=None):
+        """
+        本機模擬的幣安現貨/合約交易所, 實作BinanceSpotHttp和BinanceFutureHttp用到的REST接口, 不需要API key和網路.
+        handle()處理一個請求, 回傳 (HTTP狀態碼, header, json), 可以在同一個process直接呼叫,
+        或者用simulator.server.ExchangeServer開一個本機的HTTP服務, 把gateway的host指過來.
+        簽名不會檢查, timestamp和recvWindow會檢查.
+        訂單和最優買賣價的變化會交給subscribers, simulator.stream_server.StreamServer用它來模擬websocket推送.
+        :param symbols: {symbol: {'price': 30000, 'tick_size': '0.01', 'step_size': '0.00001', 'min_notional': 5,
+                        'volatility': 0.001, 'spread_ticks': 1, 'columns': 回放的K線欄位}}, None表示DEFAULT_SYMBOLS
+        :param futures: True模擬合約(/fapi/v1), False模擬現貨(/api/v3), 回傳格式和錯誤碼跟著改
+        :param latency: 每個請求固定的延遲(秒)
+        :param latency_jitter: 再加上 0 ~ latency_jitter 秒的隨機延遲
+        :param error_rate: 隨機回傳error_statuses錯誤的機率, 請求不會被處理
+        :param error_statuses: 隨機錯誤的HTTP狀態碼
+        :param disconnect_rate: 隨機直接斷線(不回應)的機率, 只有透過ExchangeServer才有效
+        :param throttle_rate: 隨機回傳429(Retry-After: 1)的機率, 不管實際用量
+        :param weight_limit: 每分鐘的REQUEST_WEIGHT限制, None表示交易所的預設值
+        :param order_limit: 每10秒(現貨)/每分鐘(合約)的下單數量限制, None表示交易所的預設值
+        :param ban_seconds: 收到429之後在Retry-After之前還繼續送請求, 回傳418並且封鎖這麼多秒, 封鎖期間的請求不會延長封鎖
+        :param clock_skew_ms: 伺服器時間比本機快多少毫秒, 用來測試-1021
+        :param depth_qty: 外部報價那一檔顯示的數量
+        :param volume_limit: 每根K線外部最多成交的數量, None表示掃過的掛單全部成交
+        :param history_bars: 啟動時先產生多少根已收盤的K線(最後一根是上一分鐘), 給klines接口用
+        :param seed: 亂數種子
+        """
+        self.futures = futures
+        self.prefix = '/fapi/v1' if futures else '/api/v3'
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.disconnect_rate = disconnect_rate
+        self.throttle_rate = throttle_rate
+        self.ban_seconds = ban_seconds
+        self.clock_skew_ms = clock_skew_ms
+        self.depth_qty = float(depth_qty)
+        self.volume_limit = volume_limit
+        self.random = random.Random(seed)
+        self.lock = Lock()
+
+        # self.costs只用RateLimiter.get_costs計算每個請求的權重, 跟gateway用同一張表
+        if futures:
+            self.rate_limits = [
+                {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1,
+                 'limit': weight_limit or 2400},
+                {'rateLimitType': 'ORDERS', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': order_limit or 1200},
+            ]
+            self.costs = RateLimiter(weights=FUTURE_ENDPOINT_WEIGHTS, order_endpoints=FUTURE_ORDER_ENDPOINTS)
+        else:
+            self.rate_limits = [
+                {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1,
+                 'limit': weight_limit or 1200},
+                {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': order_limit or 50},
+            ]
+            self.costs = RateLimiter(weights=SPOT_ENDPOINT_WEIGHTS, order_endpoints=SPOT_ORDER_ENDPOINTS)
+        self.order_window = 60 if futures else 10
+        self.order_header = 'X-MBX-ORDER-COUNT-1M' if futures else 'X-MBX-ORDER-COUNT-10S'
+        self.windows = {}  # rateLimitType -> [視窗開始的時間, 已使用量], 跟交易所一樣是固定的時間視窗
+        self.blocked_until = 0
+        self.banned = False
+
+        self.symbols = {}
+        for index, (symbol, spec) in enumerate((symbols or DEFAULT_SYMBOLS).items()):
+            spec = dict(spec)
+            self.symbols[symbol] = SimSymbol(symbol, spec.pop('price', 100.0), spec.pop('tick_size', '0.01'),
+                                             spec.pop('step_size', '0.001'),
+                                             seed=None if seed is None else seed + index, **spec)
+        self.bar_time = (self.now() // BAR_MILLISECONDS - history_bars) * BAR_MILLISECONDS
+
+        self.routes = {
+            ('GET', 'time'): self.get_time,
+            ('GET', 'exchangeInfo'): self.get_exchange_info,
+            ('GET', 'depth'): self.get_depth,
+            ('GET', 'klines'): self.get_klines,
+            ('GET', 'ticker/price'): self.get_price,
+            ('GET', 'ticker/bookTicker'): self.get_book_ticker,
+            ('POST', 'order'): self.new_order,
+            ('GET', 'order'): self.query_order,
+            ('DELETE', 'order'): self.cancel_order,
+            ('GET', 'openOrders'): self.get_open_orders,
+            ('DELETE', 'openOrders' if not futures else 'allOpenOrders'): self.cancel_open_orders,
+        }
+        if futures:
+            self.routes[('POST', 'batchOrders')] = self.new_batch_orders
+            self.routes[('DELETE', 'batchOrders')] = self.cancel_batch_orders
+        stream_path = 'listenKey' if futures else 'userDataStream'
+        self.routes[('POST', stream_path)] = self.create_listen_key
+        self.routes[('PUT', stream_path)] = self.keep_alive_listen_key
+        self.routes[('DELETE', stream_path)] = self.close_listen_key
+        self.listen_keys = {}  # listenKey -> 到期時間(毫秒)
+        self.subscribers = []  # callback(stream, event), 訂單或最優買賣價有變化時呼叫, 例如StreamServer
+        self.ticker_update_id = 0
+        self.request_count = 0
+        self.status_counts = {}  # HTTP狀態碼 -> 次數
+        for _ in range(history_bars):  # step()會用到subscribers, 要在最後才產生歷史K線
+            self.step()
+
+    def now(self):
+        return int(time.time() * 1000) + self.clock_skew_ms
+
+    def step(self, bars=1):
+        """
+        行情往前走幾根1分鐘K線: 用K線的最高/最低價撮合掛單, 再用收盤價更新外部報價.
+        :return: 這幾根K線成交的訂單數量
+        """
+        filled = 0
+        with self.lock:
+            for _ in range(bars):
+                open_time = self.bar_time
+                self.bar_time += BAR_MILLISECONDS
+                for item in self.symbols.values():
+                    open_price, high, low, close, volume = item.feed.next_bar()
+                    precision = item.precision
+                    volume_steps = None if self.volume_limit is None else precision.qty_to_steps(self.volume_limit)
+                    before = item.engine.trade_count
+                    orders = item.engine.sweep(precision.price_to_ticks(low), precision.price_to_ticks(high),
+                                               open_time + BAR_MILLISECONDS - 1, volume_steps)
+                    filled += len(orders)
+                    item.quote(close)
+                    if self.subscribers:
+                        for order in orders:
+                            self.publish('user', self.order_event(item, order))
+                        self.publish(f"{item.symbol.lower()}@bookTicker", self.book_ticker_event(item))
+                    item.klines.append([open_time, precision.round_price(open_price), precision.round_price(high),
+                                        precision.round_price(low), precision.round_price(close), volume,
+                                        open_time + BAR_MILLISECONDS - 1, volume * close,
+                                        item.engine.trade_count - before])
+                    if len(item.klines) > KLINE_HISTORY:
+                        del item.klines[:len(item.klines) - KLINE_HISTORY]
+        return filled
+
+    def handle(self, method, path, params=None):
+        """
+        處理一個請求.
+        :param params: query string解析出來的 {name: value}, 值都是字串
+        :return: (status, headers, body), 要模擬斷線時回傳None
+        """
+        params = params or {}
+        delay = self.latency + (self.random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+        with self.lock:
+            self.request_count += 1
+            response = self.dispatch(method, path, params)
+            if response is not None:
+                self.status_counts[response[0]] = self.status_counts.get(response[0], 0) + 1
+            return response
+
+    def dispatch(self, method, path, params):
+        if not path.startswith(self.prefix + '/'):
+            return 404, {}, {'code': -1, 'msg': f'Unknown path {path}'}
+        route = self.routes.get((method, path[len(self.prefix) + 1:]))
+        if route is None:
+            return 404, {}, {'code': -1, 'msg': f'Unknown path {method} {path}'}
+
+        if self.random.random() < self.disconnect_rate:
+            return None
+        if self.random.random() < self.error_rate:
+            return self.random.choice(self.error_statuses), {}, INTERNAL_ERROR
+
+        now = time.time()
+        if now < self.blocked_until:
+            if not self.banned:
+                # 回了429叫你等, 還在Retry-After之前繼續送, 交易所會封鎖IP
+                self.banned = True
+                self.blocked_until = now + self.ban_seconds
+            return 418, {'Retry-After': str(max(int(self.blocked_until - now + 0.999), 1))}, \
+                {'code': -1003, 'msg': f'Way too many requests; IP banned until {int(self.blocked_until * 1000)}.'}
+        self.banned = False
+
+        costs = self.costs.get_costs(method, path, params)
+        headers = {}
+        rejected = None
+        for limit_type, window_seconds, header in (('REQUEST_WEIGHT', 60, 'X-MBX-USED-WEIGHT-1M'),
+                                                   ('ORDERS', self.order_window, self.order_header)):
+            cost = costs.get(limit_type, 0)
+            window = self.windows.get(limit_type)
+            window_start = now // window_seconds * window_seconds
+            if window is None or window[0] != window_start:
+                window = self.windows[limit_type] = [window_start, 0]
+            window[1] += cost
+            if cost or limit_type == 'REQUEST_WEIGHT':
+                headers[header] = str(window[1])
+            if window[1] > self.get_limit(limit_type) and rejected is None:
+                rejected = limit_type, window_start + window_seconds - now
+        if rejected is not None:
+            limit_type, retry_after = rejected
+            if limit_type == 'REQUEST_WEIGHT':
+                self.blocked_until = now + retry_after
+                body = {'code': -1003, 'msg': f'Too many requests; current limit of IP is '
+                                              f'{self.get_limit(limit_type)} requests per minute.'}
+            else:
+                body = {'code': -1015, 'msg': f'Too many new orders; current limit is '
+                                              f'{self.get_limit(limit_type)} orders.'}
+            headers['Retry-After'] = str(max(int(retry_after + 0.999), 1))
+            return 429, headers, body
+        if self.random.random() < self.throttle_rate:
+            # 注入的429不會封鎖之後的請求
+            headers['Retry-After'] = '1'
+            return 429, headers, {'code': -1003, 'msg': 'Too many requests; please use the websocket for live updates '
+                                                        'to avoid polling the API.'}
+
+        try:
+            if path[len(self.prefix) + 1:] in SIGNED_ENDPOINTS:
+                self.check_timestamp(params)
+            return 200, headers, route(params)
+        except SimulatorError as e:
+            return e.status, headers, e.to_dict()
+
+    def get_limit(self, limit_type):
+        return next(item['limit'] for item in self.rate_limits if item['rateLimitType'] == limit_type)
+
+    def check_timestamp(self, params):
+        timestamp = self.parse_int(params, 'timestamp')
+        recv_window = int(params.get('recvWindow') or 5000)
+        now = self.now()
+        if timestamp > now + 1000 or now - timestamp > recv_window:
+            raise SimulatorError(-1021, 'Timestamp for this request is outside of the recvWindow.')
+
+    @staticmethod
+    def require(params, name):
+        value = params.get(name)
+        if value is None or value == '':
+            raise SimulatorError(-1102, f"Mandatory parameter '{name}' was not sent, was empty/null, or malformed.")
+        return value
+
+    def parse_int(self, params, name):
+        try:
+            return int(self.require(params, name))
+        except ValueError:
+            raise SimulatorError(-1100, f"Illegal characters found in parameter '{name}'; legal range is '^[0-9]+$'.")
+
+    def get_symbol(self, params, required=True):
+        if not required and not params.get('symbol'):
+            return None
+        item = self.symbols.get(self.require(params, 'symbol'))
+        if item is None:
+            raise SimulatorError(-1121, 'Invalid symbol.')
+        return item
+
+    # 行情接口
+
+    def get_time(self, params):
+        return {'serverTime': self.now()}
+
+    def get_exchange_info(self, params):
+        symbols = [self.get_symbol(params)] if params.get('symbol') else self.symbols.values()
+        items = []
+        for item in symbols:
+            if self.futures:
+                notional_filter = {'filterType': 'MIN_NOTIONAL', 'notional': str(item.min_notional)}
+            else:
+                notional_filter = {'filterType': 'NOTIONAL', 'minNotional': str(item.min_notional),
+                                   'applyMinToMarket': True, 'maxNotional': '9000000.00000000',
+                                   'applyMaxToMarket': False, 'avgPriceMins': 5}
+            items.append({
+                'symbol': item.symbol, 'status': 'TRADING', 'baseAsset': item.base_asset,
+                'quoteAsset': item.quote_asset, 'pricePrecision': item.precision.price_decimals,
+                'quantityPrecision': item.precision.qty_decimals,
+                'orderTypes': ['LIMIT', 'MARKET'], 'timeInForce': ['GTC', 'IOC', 'FOK'],
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'minPrice': item.tick_size, 'maxPrice': '1000000',
+                     'tickSize': item.tick_size},
+                    {'filterType': 'LOT_SIZE', 'minQty': item.step_size, 'maxQty': '9000',
+                     'stepSize': item.step_size},
+                    notional_filter,
+                ],
+            })
+        return {'timezone': 'UTC', 'serverTime': self.now(), 'rateLimits': self.rate_limits, 'exchangeFilters': [],
+                'symbols': items}
+
+    def get_depth(self, params):
+        item = self.get_symbol(params)
+        limit = int(params.get('limit') or 100)
+        depth_steps = item.precision.qty_to_steps(self.depth_qty)
+        bids, asks = item.engine.depth(limit, depth_steps)
+        precision = item.precision
+        return {'lastUpdateId': item.engine.trade_count,
+                'bids': [[precision.format_price(price), precision.format_qty(qty)] for price, qty in bids],
+                'asks': [[precision.format_price(price), precision.format_qty(qty)] for price, qty in asks]}
+
+    def get_klines(self, params):
+        item = self.get_symbol(params)
+        if self.require(params, 'interval') != '1m':
+            raise SimulatorError(-1120, 'Invalid interval.')
+        start_time = int(params.get('startTime') or 0)
+        end_time = int(params.get('endTime') or 0)
+        limit = int(params.get('limit') or 500)
+        klines = [kline for kline in item.klines
+                  if kline[0] >= start_time and (not end_time or kline[0] <= end_time)]
+        klines = klines[:limit] if start_time else klines[-limit:]
+        precision = item.precision
+        return [[kline[0], precision.format_price(precision.price_to_ticks(kline[1])),
+                 precision.format_price(precision.price_to_ticks(kline[2])),
+                 precision.format_price(precision.price_to_ticks(kline[3])),
+                 precision.format_price(precision.price_to_ticks(kline[4])), f"{kline[5]:.8f}", kline[6],
+                 f"{kline[7]:.8f}", kline[8], '0', '0', '0'] for kline in klines]
+
+    def get_price(self, params):
+        item = self.get_symbol(params, required=False)
+        items = [item] if item else self.symbols.values()
+        prices = [{'symbol': item.symbol, 'price': item.precision.format_price(item.engine.last_price)}
+                  for item in items]
+        return prices[0] if item else prices
+
+    def get_book_ticker(self, params):
+        item = self.get_symbol(params, required=False)
+        items = [item] if item else self.symbols.values()
+        tickers = []
+        for item in items:
+            precision = item.precision
+            bids, asks = item.engine.depth(1, precision.qty_to_steps(self.depth_qty))
+            bid_price, bid_qty = bids[0] if bids else (0, 0)
+            ask_price, ask_qty = asks[0] if asks else (0, 0)
+            ticker = {'symbol': item.symbol, 'bidPrice': precision.format_price(bid_price),
+                      'bidQty': precision.format_qty(bid_qty), 'askPrice': precision.format_price(ask_price),
+                      'askQty': precision.format_qty(ask_qty)}
+            if self.futures:
+                ticker['time'] = self.now()
+            tickers.append(ticker)
+        return tickers[0] if item else tickers
+
+    # 交易接口
+
+    def parse_order(self, item, order: dict):
+        """
+        檢查交易規則, 把價格/數量轉成tick/step.
+        :return: (side, order_type, quantity, price, time_in_force)
+        """
+        side = self.require(order, 'side')
+        order_type = self.require(order, 'type')
+        if side not in (OrderSide.BUY.value, OrderSide.SELL.value):
+            raise SimulatorError(-1117, 'Invalid side.')
+        if order_type not in ('LIMIT', 'MARKET'):
+            raise SimulatorError(-1116, 'Invalid orderType.')
+
+        precision = item.precision
+        raw_quantity = float(self.require(order, 'quantity'))
+        quantity = precision.qty_to_steps(raw_quantity)
+        if quantity <= 0 or abs(raw_quantity / precision.step - quantity) > 1e-6:
+            raise SimulatorError(-4023, 'Quantity not increased by step size.') if self.futures else \
+                SimulatorError(-1013, 'Filter failure: LOT_SIZE')
+
+        price = 0
+        time_in_force = None
+        if order_type == 'LIMIT':
+            raw_price = float(self.require(order, 'price'))
+            price = precision.price_to_ticks(raw_price)
+            if price <= 0 or abs(raw_price / precision.tick - price) > 1e-6:
+                raise SimulatorError(-4014, 'Price not increased by tick size.') if self.futures else \
+                    SimulatorError(-1013, 'Filter failure: PRICE_FILTER')
+            time_in_force = self.require(order, 'timeInForce')
+            if time_in_force not in ('GTC', 'IOC', 'FOK'):
+                raise SimulatorError(-1115, 'Invalid timeInForce.')
+
+        notional_price = price or (item.engine.best_ask() if side == OrderSide.BUY.value else item.engine.best_bid())
+        if precision.ticks_to_price(notional_price) * precision.steps_to_qty(quantity) < item.min_notional:
+            raise SimulatorError(-4164, f"Order's notional must be no smaller than {item.min_notional} "
+                                        f"(unless you choose reduce only).") if self.futures else \
+                SimulatorError(-1013, 'Filter failure: NOTIONAL')
+        return side, order_type, quantity, price, time_in_force
+
+    def place(self, item, order: dict):
+        side, order_type, quantity, price, time_in_force = self.parse_order(item, order)
+        client_order_id = order.get('newClientOrderId') or f"sim{self.random.getrandbits(48):x}"
+        sim_order = item.engine.place(side, order_type, quantity, price, client_order_id, time_in_force, self.now())
+        self.publish_order(item, sim_order)
+        return self.order_response(item, sim_order)
+
+    def new_order(self, params):
+        return self.place(self.get_symbol(params), params)
+
+    def new_batch_orders(self, params):
+        orders = json.loads(self.require(params, 'batchOrders'))
+        if len(orders) > 5:
+            raise SimulatorError(-1130, 'Data sent for parameter \'batchOrders\' is not valid.')
+        results = []
+        for order in orders:
+            try:
+                results.append(self.place(self.get_symbol(order), order))
+            except SimulatorError as e:
+                results.append(e.to_dict())
+        return results
+
+    def query_order(self, params):
+        item = self.get_symbol(params)
+        if params.get('origClientOrderId'):
+            order = item.engine.get(client_order_id=params['origClientOrderId'])
+        else:
+            order = item.engine.get(order_id=self.parse_int(params, 'orderId'))
+        return self.order_response(item, order, query=True)
+
+    def cancel_order(self, params):
+        item = self.get_symbol(params)
+        client_order_id = params.get('origClientOrderId')
+        if not client_order_id:
+            try:
+                client_order_id = item.engine.get(order_id=self.parse_int(params, 'orderId')).client_order_id
+            except SimulatorError:
+                raise SimulatorError(-2011, 'Unknown order sent.')
+        return self.cancel_response(item, self.cancel(item, client_order_id))
+
+    def cancel_batch_orders(self, params):
+        item = self.get_symbol(params)
+        results = []
+        for client_order_id in json.loads(self.require(params, 'origClientOrderIdList')):
+            try:
+                results.append(self.cancel_response(item, self.cancel(item, client_order_id)))
+            except SimulatorError as e:
+                results.append(e.to_dict())
+        return results
+
+    def get_open_orders(self, params):
+        item = self.get_symbol(params, required=False)
+        items = [item] if item else self.symbols.values()
+        return [self.order_response(item, order, query=True) for item in items for order in item.engine.open_orders()]
+
+    def cancel_open_orders(self, params):
+        item = self.get_symbol(params)
+        orders = item.engine.cancel_all(self.now())
+        for order in orders:
+            self.publish_order(item, order)
+        if self.futures:
+            return {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+        if not orders:
+            raise SimulatorError(-2011, 'Unknown order sent.')
+        return [self.cancel_response(item, order) for order in orders]
+
+    def cancel(self, item, client_order_id):
+        order = item.engine.cancel(client_order_id, self.now())
+        self.publish_order(item, order)
+        return order
+
+    # 帳戶資料推送
+
+    def create_listen_key(self, params):
+        """
+        跟交易所一樣, 還有效的listenKey會重複使用並延長.
+        """
+        now = self.now()
+        listen_key = next((key for key, expire_time in self.listen_keys.items() if expire_time > now), None)
+        if listen_key is None:
+            listen_key = f"{self.random.getrandbits(256):064x}"
+        self.listen_keys[listen_key] = now + LISTEN_KEY_MILLISECONDS
+        return {'listenKey': listen_key}
+
+    def get_listen_key(self, params):
+        # 合約一個帳號只有一個listenKey, 延長/關閉時不用帶參數
+        listen_key = self.require(params, 'listenKey') if not self.futures else \
+            params.get('listenKey') or next(iter(self.listen_keys), None)
+        if not self.is_listen_key_valid(listen_key):
+            raise SimulatorError(-1125, 'This listenKey does not exist.')
+        return listen_key
+
+    def keep_alive_listen_key(self, params):
+        listen_key = self.get_listen_key(params)
+        self.listen_keys[listen_key] = self.now() + LISTEN_KEY_MILLISECONDS
+        return {'listenKey': listen_key} if self.futures else {}
+
+    def close_listen_key(self, params):
+        self.listen_keys.pop(self.get_listen_key(params), None)
+        return {}
+
+    def is_listen_key_valid(self, listen_key):
+        return self.listen_keys.get(listen_key, 0) > self.now()
+
+    def publish(self, stream, event):
+        for callback in self.subscribers:
+            callback(stream, event)
+
+    def publish_order(self, item, order):
+        if self.subscribers:
+            self.publish('user', self.order_event(item, order))
+
+    def order_event(self, item, order):
+        """
+        訂單的變化轉成推送事件: 現貨是executionReport, 合約是ORDER_TRADE_UPDATE.
+        """
+        data = self.order_response(item, order)
+        fields = {'s': data['symbol'], 'c': data['clientOrderId'], 'S': data['side'], 'o': data['type'],
+                  'f': data['timeInForce'], 'q': data['origQty'], 'p': data['price'], 'X': data['status'],
+                  'i': data['orderId'], 'z': data['executedQty'], 'T': order.update_time}
+        if self.futures:
+            return {'e': 'ORDER_TRADE_UPDATE', 'E': order.update_time, 'T': order.update_time, 'o': fields}
+
+        fields.update({'e': 'executionReport', 'E': order.update_time, 'C': ''})
+        if order.status == OrderStatus.CANCELED:
+            # 現貨撤單時c是撤單請求的id, C才是原本訂單的clientOrderId
+            fields['C'], fields['c'] = fields['c'], f"cancel{self.random.getrandbits(48):x}"
+        return fields
+
+    def book_ticker_event(self, item):
+        ticker = self.get_book_ticker({'symbol': item.symbol})
+        self.ticker_update_id += 1
+        event = {'u': self.ticker_update_id, 's': item.symbol, 'b': ticker['bidPrice'], 'B': ticker['bidQty'],
+                 'a': ticker['askPrice'], 'A': ticker['askQty']}
+        if self.futures:
+            event.update({'e': 'bookTicker', 'E': self.now(), 'T': self.now()})
+        return event
+
+    # 回傳格式
+
+    def order_response(self, item, order, query=False):
+        precision = item.precision
+        executed = precision.format_qty(order.executed)
+        quote = f"{order.quote * precision.tick * precision.step:.8f}"
+        data = {
+            'symbol': order.symbol,
+            'orderId': order.order_id,
+            'clientOrderId': order.client_order_id,
+            'price': precision.format_price(order.price),
+            'origQty': precision.format_qty(order.quantity),
+            'executedQty': executed,
+            'status': order.status.value,
+            'timeInForce': order.time_in_force or 'GTC',
+            'type': order.order_type,
+            'side': order.side,
+        }
+        if self.futures:
+            average = order.quote / order.executed * precision.tick if order.executed else 0
+            data.update({'cumQty': executed, 'cumQuote': quote, 'avgPrice': f"{average:.8f}", 'reduceOnly': False,
+                         'positionSide': 'BOTH', 'stopPrice': '0', 'closePosition': False, 'origType': order.order_type,
+                         'workingType': 'CONTRACT_PRICE', 'priceProtect': False, 'updateTime': order.update_time})
+            if query:
+                data['time'] = order.time
+        else:
+            data.update({'orderListId': -1, 'cummulativeQuoteQty': quote, 'selfTradePreventionMode': 'NONE'})
+            if query:
+                data.update({'stopPrice': '0.00000000', 'icebergQty': '0.00000000', 'time': order.time,
+                             'updateTime': order.update_time, 'isWorking': True, 'workingTime': order.time,
+                             'origQuoteOrderQty': '0.00000000'})
+            else:
+                data.update({'transactTime': order.update_time, 'workingTime': order.time})
+        return data
+
+    def cancel_response(self, item, order):
+        data = self.order_response(item, order)
+        if not self.futures:
+            # 現貨撤單回傳的clientOrderId是撤單請求的id
+            data['origClientOrderId'] = order.client_order_id
+            data['clientOrderId'] = f"cancel{self.random.getrandbits(48):x}"
+        return data
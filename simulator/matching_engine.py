@@ -0,0 +1,268 @@
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from itertools import count
+from gateway import OrderSide, OrderStatus
+
+ORDER_HISTORY = 100_000  # 已結束的訂單最多保留幾張, 給查單用
+
+
+class SimulatorError(Exception):
+
+    def __init__(self, code, msg, status=400):
+        """
+        交易所會回傳的錯誤, 例如 {'code': -2011, 'msg': 'Unknown order sent.'}
+        """
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+    def to_dict(self):
+        return {'code': self.code, 'msg': self.msg}
+
+
+class SimOrder(object):
+    __slots__ = ('order_id', 'client_order_id', 'symbol', 'side', 'order_type', 'time_in_force', 'price', 'quantity',
+                 'executed', 'quote', 'status', 'time', 'update_time')
+
+    def __init__(self, order_id, client_order_id, symbol, side, order_type, time_in_force, price, quantity, now):
+        """
+        價格是tick數, 數量是step數, 撮合時只用整數比較.
+        """
+        self.order_id = order_id
+        self.client_order_id = client_order_id
+        self.symbol = symbol
+        self.side = side
+        self.order_type = order_type
+        self.time_in_force = time_in_force
+        self.price = price
+        self.quantity = quantity
+        self.executed = 0
+        self.quote = 0  # 成交金額, 單位是 tick * step
+        self.status = OrderStatus.NEW
+        self.time = now
+        self.update_time = now
+
+    @property
+    def remaining(self):
+        return self.quantity - self.executed
+
+    @property
+    def is_open(self):
+        return self.status in (OrderStatus.NEW, OrderStatus.PARTIALLY_FILLED)
+
+
+class MatchingEngine(object):
+
+    def __init__(self, symbol, precision):
+        """
+        單一交易對的撮合引擎, 價格優先、時間優先.
+        除了帳戶自己的掛單之外, 還有一個外部報價(ref_bid/ref_ask)代表市場上其他人的流動性:
+        穿過外部報價的限價單直接以外部報價成交, K線的最高/最低價掃過掛單時依優先順序成交.
+        :param precision: utils.Precision
+        """
+        self.symbol = symbol
+        self.precision = precision
+        self.bids = {}  # 價格 -> deque(SimOrder), 先掛的在前面
+        self.asks = {}
+        self.bid_prices = []  # 由低到高
+        self.ask_prices = []
+        self.orders = OrderedDict()  # clientOrderId -> SimOrder
+        self.order_ids = count(1)
+        self.ref_bid = 0
+        self.ref_ask = 0
+        self.last_price = 0
+        self.trade_count = 0
+
+    def set_reference(self, bid, ask):
+        self.ref_bid = bid
+        self.ref_ask = ask
+
+    def best_bid(self):
+        book_bid = self.bid_prices[-1] if self.bid_prices else 0
+        return max(book_bid, self.ref_bid)
+
+    def best_ask(self):
+        book_ask = self.ask_prices[0] if self.ask_prices else 0
+        if book_ask and self.ref_ask:
+            return min(book_ask, self.ref_ask)
+        return book_ask or self.ref_ask
+
+    def depth(self, limit, ref_qty):
+        """
+        :param ref_qty: 外部報價那一檔要顯示的數量(step)
+        :return: (bids, asks), 每一檔是 (tick數, step數), 買方由高到低、賣方由低到高
+        """
+        sides = []
+        for levels, prices, ref, is_buy in ((self.bids, reversed(self.bid_prices), self.ref_bid, True),
+                                            (self.asks, self.ask_prices, self.ref_ask, False)):
+            book = {price: sum(order.remaining for order in levels[price]) for price in prices}
+            if ref:
+                book[ref] = book.get(ref, 0) + ref_qty
+            sides.append(sorted(book.items(), reverse=is_buy)[:limit])
+        return sides[0], sides[1]
+
+    def open_orders(self):
+        return [order for order in self.orders.values() if order.is_open]
+
+    def get(self, client_order_id=None, order_id=None):
+        if client_order_id is not None:
+            order = self.orders.get(client_order_id)
+        else:
+            order = next((order for order in self.orders.values() if order.order_id == order_id), None)
+        if order is None:
+            raise SimulatorError(-2013, 'Order does not exist.')
+        return order
+
+    def place(self, side, order_type, quantity, price, client_order_id, time_in_force, now):
+        """
+        交易規則(tickSize, stepSize, minNotional)由SimulatedExchange檢查, 這裡只撮合.
+        :param quantity: step數
+        :param price: tick數, 市價單是0
+        :return: SimOrder
+        """
+        existing = self.orders.get(client_order_id)
+        if existing is not None and existing.is_open:
+            raise SimulatorError(-2010, 'Duplicate order sent.')
+
+        order = SimOrder(next(self.order_ids), client_order_id, self.symbol, side, order_type, time_in_force, price,
+                         quantity, now)
+        if time_in_force == 'FOK' and self.available(order) < quantity:
+            order.status = OrderStatus.EXPIRED
+        else:
+            self.match(order, now)
+            if order.remaining > 0:
+                if order_type == 'MARKET' or time_in_force in ('IOC', 'FOK'):
+                    order.status = OrderStatus.EXPIRED
+                else:
+                    self.rest(order)
+        self.remember(order)
+        return order
+
+    def remember(self, order):
+        self.orders[order.client_order_id] = order
+        self.orders.move_to_end(order.client_order_id)
+        while len(self.orders) > ORDER_HISTORY:
+            oldest = next(iter(self.orders.values()))
+            if oldest.is_open:
+                break
+            self.orders.popitem(last=False)
+
+    def crosses(self, order, price):
+        if order.order_type == 'MARKET':
+            return True
+        return price <= order.price if order.side == OrderSide.BUY.value else price >= order.price
+
+    def available(self, order):
+        """
+        FOK用: 現在可以立即成交的數量, 外部報價視為無限流動性.
+        """
+        external = self.ref_ask if order.side == OrderSide.BUY.value else self.ref_bid
+        if external and self.crosses(order, external):
+            return order.quantity
+        levels, prices = (self.asks, self.ask_prices) if order.side == OrderSide.BUY.value else \
+            (self.bids, list(reversed(self.bid_prices)))
+        total = 0
+        for price in prices:
+            if not self.crosses(order, price):
+                break
+            total += sum(resting.remaining for resting in levels[price])
+        return total
+
+    def match(self, order, now):
+        """
+        新進的訂單先跟對手方的掛單撮合(價格較好的先), 再跟外部報價成交.
+        """
+        is_buy = order.side == OrderSide.BUY.value
+        levels, prices = (self.asks, self.ask_prices) if is_buy else (self.bids, self.bid_prices)
+        external = self.ref_ask if is_buy else self.ref_bid
+        while order.remaining > 0:
+            book_price = (prices[0] if is_buy else prices[-1]) if prices else None
+            if book_price is not None and self.crosses(order, book_price) and \
+                    (not external or (book_price <= external if is_buy else book_price >= external)):
+                queue = levels[book_price]
+                resting = queue[0]
+                quantity = min(order.remaining, resting.remaining)
+                self.fill(resting, quantity, book_price, now)
+                self.fill(order, quantity, book_price, now)
+                if not resting.remaining:
+                    queue.popleft()
+                    if not queue:
+                        del levels[book_price]
+                        prices.remove(book_price)
+            elif external and self.crosses(order, external):
+                self.fill(order, order.remaining, external, now)
+            else:
+                break
+
+    def rest(self, order):
+        levels, prices = (self.bids, self.bid_prices) if order.side == OrderSide.BUY.value else \
+            (self.asks, self.ask_prices)
+        queue = levels.get(order.price)
+        if queue is None:
+            queue = levels[order.price] = deque()
+            insort(prices, order.price)
+        queue.append(order)
+
+    def fill(self, order, quantity, price, now):
+        order.executed += quantity
+        order.quote += quantity * price
+        order.status = OrderStatus.FILLED if not order.remaining else OrderStatus.PARTIALLY_FILLED
+        order.update_time = now
+        self.last_price = price
+        self.trade_count += 1
+
+    def cancel(self, client_order_id, now):
+        order = self.orders.get(client_order_id)
+        if order is None or not order.is_open:
+            raise SimulatorError(-2011, 'Unknown order sent.')
+        self.unlink(order)
+        order.status = OrderStatus.CANCELED
+        order.update_time = now
+        return order
+
+    def cancel_all(self, now):
+        return [self.cancel(order.client_order_id, now) for order in self.open_orders()]
+
+    def unlink(self, order):
+        levels, prices = (self.bids, self.bid_prices) if order.side == OrderSide.BUY.value else \
+            (self.asks, self.ask_prices)
+        queue = levels.get(order.price)
+        if queue is None:
+            return
+        try:
+            queue.remove(order)
+        except ValueError:
+            return
+        if not queue:
+            del levels[order.price]
+            del prices[bisect_left(prices, order.price)]
+
+    def sweep(self, low, high, now, volume=None):
+        """
+        一根K線的最低/最高價掃過掛單: 價格 >= 最低價的買單、價格 <= 最高價的賣單依價格/時間優先成交.
+        :param volume: 這根K線外部可以成交的數量(step), None表示不限制, 有限制時後面的訂單會部分成交或不成交
+        :return: 成交的訂單
+        """
+        filled = []
+        for is_buy in (True, False):
+            levels, prices = (self.bids, self.bid_prices) if is_buy else (self.asks, self.ask_prices)
+            remaining = volume
+            while prices and (remaining is None or remaining > 0):
+                price = prices[-1] if is_buy else prices[0]
+                if (is_buy and price < low) or (not is_buy and price > high):
+                    break
+                queue = levels[price]
+                while queue and (remaining is None or remaining > 0):
+                    order = queue[0]
+                    quantity = order.remaining if remaining is None else min(order.remaining, remaining)
+                    self.fill(order, quantity, price, now)
+                    filled.append(order)
+                    if remaining is not None:
+                        remaining -= quantity
+                    if not order.remaining:
+                        queue.popleft()
+                if not queue:
+                    del levels[price]
+                    prices.remove(price)
+        return filled
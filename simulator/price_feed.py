@@ -0,0 +1,37 @@
+import math
+import random
+
+
+class PriceFeed(object):
+
+    def __init__(self, price=100.0, volatility=0.001, seed=None, columns=None):
+        """
+        模擬交易所的行情來源, 每次next_bar產生一根K線.
+        :param price: 起始價格(隨機漫步)
+        :param volatility: 每根K線收盤價的對數報酬標準差(隨機漫步)
+        :param seed: 亂數種子, 固定之後每次產生的行情都一樣
+        :param columns: 回放歷史K線, KlineStore.read或KlineDownloader.download的結果, 放完之後從最後的價格繼續隨機漫步
+        """
+        self.price = float(price)
+        self.volatility = volatility
+        self.random = random.Random(seed)
+        self.columns = columns
+        self.index = 0
+
+    def next_bar(self):
+        """
+        :return: (open, high, low, close, volume)
+        """
+        if self.columns is not None and self.index < len(self.columns['close']):
+            i = self.index
+            self.index += 1
+            bar = tuple(float(self.columns[name][i]) for name in ('open', 'high', 'low', 'close', 'volume'))
+            self.price = bar[3]
+            return bar
+
+        open_price = self.price
+        close_price = open_price * math.exp(self.random.gauss(0, self.volatility))
+        high = max(open_price, close_price) * (1 + abs(self.random.gauss(0, self.volatility / 2)))
+        low = min(open_price, close_price) * (1 - abs(self.random.gauss(0, self.volatility / 2)))
+        self.price = close_price
+        return open_price, high, low, close_price, 0.0
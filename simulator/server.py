@@ -0,0 +1,105 @@
+import json
+import logging
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from urllib.parse import urlsplit, parse_qsl
+
+logger = logging.getLogger('binance.simulator')
+
+
+class ExchangeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, gateway的requests.Session會重複使用連線
+
+    def handle_request(self, method):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update(parse_qsl(self.rfile.read(length).decode('utf-8'), keep_blank_values=True))
+
+        response = self.server.exchange.handle(method, url.path, params)
+        if response is None:
+            # 模擬斷線: 不回應直接關閉連線
+            self.close_connection = True
+            return
+
+        status, headers, body = response
+        data = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def log_message(self, format, *args):
+        pass  # 壓力測試時每個請求都印會拖慢速度
+
+
+class ExchangeServer(object):
+
+    def __init__(self, exchange, host='127.0.0.1', port=0, bar_seconds=0):
+        """
+        把SimulatedExchange包成本機的HTTP服務, 每個連線一個thread.
+        用法: BinanceSpotHttp(api_key='key', secret='secret', host=server.url)
+        :param exchange: simulator.exchange.SimulatedExchange
+        :param port: 0表示由系統分配, 啟動之後看self.url
+        :param bar_seconds: 每隔幾秒自動走一根K線, 0表示不自動走, 由呼叫exchange.step()控制
+        """
+        self.exchange = exchange
+        self.httpd = ThreadingHTTPServer((host, port), ExchangeRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.exchange = exchange
+        self.bar_seconds = bar_seconds
+        self.stopped = Event()
+        self.threads = []
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        server_thread = Thread(target=self.httpd.serve_forever, name='sim-exchange', daemon=True)
+        server_thread.start()
+        self.threads.append(server_thread)
+        if self.bar_seconds > 0:
+            clock_thread = Thread(target=self.run_clock, name='sim-clock', daemon=True)
+            clock_thread.start()
+            self.threads.append(clock_thread)
+        logger.info("simulated exchange listening on %s", self.url)
+        return self
+
+    def run_clock(self):
+        next_time = time.monotonic() + self.bar_seconds
+        while not self.stopped.wait(max(next_time - time.monotonic(), 0)):
+            self.exchange.step()
+            next_time += self.bar_seconds
+
+    def stop(self):
+        self.stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,58 @@
+import json
+from urllib.parse import urlsplit, parse_qsl
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class SimulatedResponse(object):
+
+    def __init__(self, status_code, headers, content: bytes):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class SimulatedSession(object):
+
+    def __init__(self, exchange):
+        """
+        跟requests.Session一樣的介面, 請求直接交給SimulatedExchange.handle, 不經過socket.
+        gateway的參數組合、簽名、頻率限制、重試和json解析都照常執行, 適合量測gateway和trader本身的耗時.
+        回應一樣先轉成json字串, 解析的成本跟真的請求一樣.
+        :param exchange: simulator.exchange.SimulatedExchange
+        """
+        self.exchange = exchange
+        self.headers = {}
+        self.proxies = {}
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def request(self, method, url, timeout=None, **kwargs):
+        parts = urlsplit(url)
+        response = self.exchange.handle(method, parts.path, dict(parse_qsl(parts.query, keep_blank_values=True)))
+        if response is None:
+            raise requests.exceptions.ConnectionError('Remote end closed connection without response')
+        status, headers, body = response
+        return SimulatedResponse(status, headers, json.dumps(body, separators=(',', ':')).encode('utf-8'))
+
+    def close(self):
+        pass
+
+
+def connect(http_client, exchange):
+    """
+    把gateway的連線換成SimulatedSession, 斷線重建連線(reset_session)之後也還是連到模擬交易所.
+    :param http_client: BinanceSpotHttp or BinanceFutureHttp
+    :return: http_client
+    """
+    http_client._create_session = lambda: SimulatedSession(exchange)
+    http_client.session = SimulatedSession(exchange)
+    return http_client
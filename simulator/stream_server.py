@@ -0,0 +1,196 @@
+import base64
+import hashlib
+import json
+import logging
+import socket
+import struct
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Lock, Thread
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger('binance.simulator')
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OPCODE_TEXT, OPCODE_CLOSE, OPCODE_PING, OPCODE_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+def encode_frame(payload: bytes, opcode=OPCODE_TEXT):
+    """
+    server送出的frame不用mask.
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def read_frame(rfile):
+    """
+    :return: (opcode, payload), 連線關閉時回傳 (None, None)
+    """
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None, None
+    opcode, length = head[0] & 0x0F, head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else None
+    payload = rfile.read(length)
+    if mask:
+        payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    return opcode, payload
+
+
+class StreamConnection(object):
+
+    def __init__(self, sock, streams, combined):
+        """
+        :param streams: 這條連線訂閱的stream名稱, 帳戶資料推送是 'user'
+        :param combined: /stream?streams=... 的連線, 推送的內容包成 {'stream': ..., 'data': ...}
+        """
+        self.sock = sock
+        self.streams = streams
+        self.combined = combined
+        self.lock = Lock()
+
+    def send(self, data: bytes, opcode=OPCODE_TEXT):
+        with self.lock:
+            self.sock.sendall(encode_frame(data, opcode))
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class WebsocketRequestHandler(StreamRequestHandler):
+
+    def handle(self):
+        request_line = self.rfile.readline().decode('latin-1').split()
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if len(request_line) < 2 or 'sec-websocket-key' not in headers:
+            self.reply(400, 'Bad Request')
+            return
+
+        url = urlsplit(request_line[1])
+        if url.path.startswith('/ws/'):
+            if not self.server.stream_server.exchange.is_listen_key_valid(url.path[len('/ws/'):]):
+                self.reply(400, 'Invalid listenKey')
+                return
+            streams, combined = {'user'}, False
+        elif url.path == '/stream':
+            streams, combined = set(parse_qs(url.query).get('streams', [''])[0].split('/')), True
+        else:
+            self.reply(404, 'Not Found')
+            return
+
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WEBSOCKET_GUID).encode()).digest())
+        self.wfile.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                         b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        connection = StreamConnection(self.request, streams, combined)
+        self.server.stream_server.add(connection)
+        try:
+            while True:
+                opcode, payload = read_frame(self.rfile)
+                if opcode is None:
+                    break
+                if opcode == OPCODE_PING:
+                    connection.send(payload, OPCODE_PONG)
+                elif opcode == OPCODE_CLOSE:
+                    connection.send(payload[:2], OPCODE_CLOSE)
+                    break
+        except OSError:
+            pass
+        finally:
+            self.server.stream_server.remove(connection)
+
+    def reply(self, status, reason):
+        self.wfile.write(f"HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+
+
+class StreamServer(object):
+
+    def __init__(self, exchange, host='127.0.0.1', port=0):
+        """
+        本機的websocket服務, 代替stream.binance.com / fstream.binance.com, 推送SimulatedExchange的變化:
+        /ws/<listenKey> 是帳戶資料推送(訂單更新), /stream?streams=btcusdt@bookTicker/... 是最優買賣價.
+        只實作測試需要的部分(沒有分片、壓縮和子協定), 斷線後事件不會補送, 跟交易所一樣.
+        用法: trader.stream_host = server.url, BinanceUserStream(http_client, server.url)
+        :param exchange: simulator.exchange.SimulatedExchange
+        :param port: 0表示由系統分配, 啟動之後看self.url
+        """
+        self.exchange = exchange
+        self.tcp_server = ThreadingTCPServer((host, port), WebsocketRequestHandler, bind_and_activate=False)
+        self.tcp_server.daemon_threads = True
+        self.tcp_server.allow_reuse_address = True
+        self.tcp_server.server_bind()
+        self.tcp_server.server_activate()
+        self.tcp_server.stream_server = self
+        self.connections = []
+        self.lock = Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.tcp_server.server_address[:2]
+        return f"ws://{host}:{port}"
+
+    def start(self):
+        self.exchange.subscribers.append(self.on_event)
+        self.thread = Thread(target=self.tcp_server.serve_forever, name='sim-stream', daemon=True)
+        self.thread.start()
+        logger.info("simulated stream listening on %s", self.url)
+        return self
+
+    def stop(self):
+        if self.on_event in self.exchange.subscribers:
+            self.exchange.subscribers.remove(self.on_event)
+        self.tcp_server.shutdown()
+        self.disconnect()
+        self.tcp_server.server_close()
+
+    def add(self, connection):
+        with self.lock:
+            self.connections.append(connection)
+
+    def remove(self, connection):
+        with self.lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+
+    @property
+    def connection_count(self):
+        with self.lock:
+            return len(self.connections)
+
+    def disconnect(self):
+        """
+        關掉目前所有連線, 模擬網路中斷, 客戶端會自己重新連線.
+        """
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close()
+
+    def on_event(self, stream, event):
+        with self.lock:
+            connections = [connection for connection in self.connections if stream in connection.streams]
+        for connection in connections:
+            data = {'stream': stream, 'data': event} if connection.combined else event
+            try:
+                connection.send(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+            except OSError:
+                self.remove(connection)
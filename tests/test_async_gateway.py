@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+from gateway import AsyncBinanceSpotHttp, AsyncBinanceFutureHttp, BinanceSpotHttp, BinanceFutureHttp, SyncHttpClient, \
+    OrderSide, OrderType, OrderStatus, Order
+from gateway.binance_spot import Interval
+from gateway.retry_policy import RetryPolicy
+from simulator import SimulatedExchange, ExchangeServer
+from utils.metrics import RequestCounter
+
+pytest.importorskip('aiohttp')
+
+
+@pytest.fixture(params=[False, True], ids=['spot', 'futures'])
+def server(request):
+    with ExchangeServer(SimulatedExchange(futures=request.param, history_bars=10, seed=1)) as server:
+        server.futures = request.param
+        yield server
+
+
+def create_client(server, sync=False):
+    if sync:
+        http_class = BinanceFutureHttp if server.futures else BinanceSpotHttp
+    else:
+        http_class = AsyncBinanceFutureHttp if server.futures else AsyncBinanceSpotHttp
+    return http_class(api_key='key', secret='secret', host=server.url)
+
+
+def test_concurrent_requests(server):
+    async def run():
+        http_client = create_client(server)
+        try:
+            tickers = await asyncio.gather(*[http_client.get_ticker(symbol) for symbol in ('BTCUSDT', 'ETHUSDT') * 5])
+            order = await http_client.place_order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, '0.001', '29000.00')
+            check_order = await http_client.get_order('BTCUSDT', client_order_id=order.client_order_id)
+            return tickers, order, check_order, http_client.request_count
+        finally:
+            await http_client.close()
+
+    tickers, order, check_order, request_count = asyncio.run(run())
+    assert [ticker['symbol'] for ticker in tickers] == ['BTCUSDT', 'ETHUSDT'] * 5
+    assert isinstance(order, Order) and check_order.status == OrderStatus.NEW
+    assert request_count == 12
+
+
+def test_sync_wrapper_matches_sync_gateway(server):
+    http_client = SyncHttpClient(create_client(server))
+    sync_client = create_client(server, sync=True)
+    try:
+        with RequestCounter() as counter:
+            order = http_client.place_order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, '0.001', '29000.00')
+            assert http_client.cancel_order('BTCUSDT', order.client_order_id)
+        assert counter.count == 2  # 計數器透過run_coroutine_threadsafe帶到event loop
+
+        assert sync_client.get_order('BTCUSDT', order.client_order_id).status == OrderStatus.CANCELED
+        assert http_client.get_client_order_id().startswith(http_client.client_order_tag)  # 同步方法直接呼叫
+        klines = sync_client.get_kline('BTCUSDT', Interval.MINUTE_1, limit=3)
+        assert len(klines) == 3  # 有歷史K線, 比較的不是兩個空的列表
+        assert http_client.get_kline('BTCUSDT', Interval.MINUTE_1, limit=3) == klines
+    finally:
+        http_client.close()  # 包起來的coroutine會等到執行完
+
+
+def test_get_kline_returns_empty_list_on_failure(server):
+    sync_client = create_client(server, sync=True)
+    assert sync_client.get_kline('NOPEUSDT', Interval.MINUTE_1) == []
+    assert sync_client.last_error.status == 400
+
+    http_client = SyncHttpClient(create_client(server))
+    try:
+        assert http_client.get_kline('NOPEUSDT', Interval.MINUTE_1) == []
+        assert http_client.last_error.status == 400
+        assert http_client.get_kline('BTCUSDT', Interval.MINUTE_1, limit=3)
+        assert http_client.last_error is None  # 成功的呼叫不會留著上一次的錯誤
+    finally:
+        http_client.close()  # 包起來的coroutine會等到執行完
+
+
+def test_concurrent_requests_keep_their_own_error(server):
+    async def get_kline(http_client, symbol):
+        klines = await http_client.get_kline(symbol, Interval.MINUTE_1, limit=3)
+        return klines, http_client.last_error
+
+    async def run():
+        http_client = create_client(server)
+        try:
+            return await asyncio.gather(get_kline(http_client, 'NOPEUSDT'), get_kline(http_client, 'BTCUSDT'))
+        finally:
+            await http_client.close()
+
+    (failed, error), (klines, no_error) = asyncio.run(run())
+    assert failed == [] and error.code == -1121
+    assert len(klines) == 3 and no_error is None  # 同時送出的請求各自的錯誤, 不會互相覆蓋
+
+
+def drop_batch_responses(exchange):
+    """
+    交易所處理了批次下單, 但是ExchangeServer不回應直接斷線.
+    """
+    handle = exchange.handle
+
+    def lossy_handle(method, path, params=None):
+        response = handle(method, path, params)
+        return None if method == 'POST' and path.endswith('/batchOrders') else response
+
+    exchange.handle = lossy_handle
+    return exchange
+
+
+def test_unknown_batch_result_is_checked_order_by_order():
+    exchange = drop_batch_responses(SimulatedExchange(futures=True, seed=1))
+
+    async def run(url):
+        http_client = AsyncBinanceFutureHttp(api_key='key', secret='secret', host=url,
+                                             retry_policy=RetryPolicy(try_counts=1))
+        try:
+            orders = [{'symbol': 'BTCUSDT', 'order_side': OrderSide.BUY, 'order_type': OrderType.LIMIT,
+                       'quantity': '0.001', 'price': f"{29000 - i}.00"} for i in range(7)]
+            return await http_client.place_batch_orders(orders), await http_client.get_open_orders('BTCUSDT')
+        finally:
+            await http_client.close()
+
+    with ExchangeServer(exchange) as server:
+        results, open_orders = asyncio.run(run(server.url))
+    assert all(isinstance(result, Order) for result in results.values())  # 斷線前已經掛上的單用get_order找回來
+    assert {order.client_order_id for order in open_orders} == set(results)
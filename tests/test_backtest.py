@@ -0,0 +1,62 @@
+import random
+import pytest
+from utils import config
+
+np = pytest.importorskip('numpy')
+from trader.backtest import GridBacktester  # noqa: E402
+from utils.kline_store import klines_to_columns  # noqa: E402
+
+
+def kline(index, high, low, close):
+    return [index * 60000, str(close), str(high), str(low), str(close), '1.0']
+
+
+@pytest.fixture
+def grid_config():
+    return config.copy(gap_percent=0.01, quantity=1, max_orders=3, ladder_levels=1)
+
+
+def test_round_trip(grid_config):
+    klines = [kline(0, 100, 100, 100),  # 買單99.00, 賣單101.00
+              kline(1, 100.5, 99.5, 100),  # 沒有碰到掛單, 直接跳過
+              kline(2, 99.5, 98.9, 99),  # 買單99.00成交, 補賣單99.99和買單98.01
+              kline(3, 100, 99.5, 100)]  # 賣單99.99成交
+    result = GridBacktester(grid_config, fee_rate=0.001).run(klines)
+    assert (result.buy_fills, result.sell_fills, result.cycles) == (1, 1, 3)
+    assert result.inventory.tolist() == [0, 0, 1, 0]
+    assert result.cash.tolist() == pytest.approx([0, 0, -99 - 0.099, 0.99 - 0.19899])
+    assert result.pnl == pytest.approx(0.99 - 0.19899)
+    assert result.fees == pytest.approx(0.19899)
+    assert result.buy_orders == [98.01, 98.99] and result.sell_orders == [100.99, 101.0]
+    assert result.max_drawdown == pytest.approx(0.099)  # 第3根K線: 現金-99.099 + 持倉1 * 收盤99
+
+
+def test_columns_input_matches_rows(grid_config):
+    klines = [kline(index, 100 + index % 3, 99 - index % 2, 100) for index in range(10)]
+    assert GridBacktester(grid_config).run(klines_to_columns(klines)).summary()['pnl'] == \
+           GridBacktester(grid_config).run(klines).summary()['pnl']
+
+
+@pytest.mark.parametrize('ladder_levels', [1, 3])
+def test_skipping_quiet_bars_matches_bar_by_bar(grid_config, monkeypatch, ladder_levels):
+    grid_config.ladder_levels = ladder_levels
+    rng = random.Random(1)
+    price = 100.0
+    klines = []
+    for index in range(3000):
+        price *= 1 + rng.gauss(0, 0.002)
+        klines.append(kline(index, round(price * 1.002, 2), round(price * 0.998, 2), round(price, 2)))
+
+    fast = GridBacktester(grid_config).run(klines)
+    monkeypatch.setattr(GridBacktester, 'next_event', staticmethod(lambda highs, lows, index, *args: index))
+    slow = GridBacktester(grid_config).run(klines)
+
+    assert fast.cycles < slow.cycles == len(klines)
+    assert fast.buy_fills == slow.buy_fills > 0 and fast.sell_fills == slow.sell_fills
+    assert fast.equity.tolist() == pytest.approx(slow.equity.tolist())
+    assert (fast.buy_orders, fast.sell_orders) == (slow.buy_orders, slow.sell_orders)
+
+
+def test_empty_klines(grid_config):
+    result = GridBacktester(grid_config).run([])
+    assert result.pnl == 0.0 and result.max_drawdown == 0.0 and result.summary()['bars'] == 0
@@ -0,0 +1,114 @@
+import pytest
+from gateway import BinanceFutureHttp, GatewayError, Order, OrderSide, OrderType, SymbolFilterCache
+from gateway.retry_policy import RetryPolicy
+from simulator import SimulatedExchange, connect
+from trader.binance_future_trader import BinanceFutureTrader
+from utils import config
+
+
+@pytest.fixture
+def http_client():
+    return connect(BinanceFutureHttp(api_key='key', secret='secret'), SimulatedExchange(futures=True, seed=1))
+
+
+def order_item(price, quantity='0.001', side=OrderSide.BUY):
+    return {'symbol': 'BTCUSDT', 'order_side': side, 'order_type': OrderType.LIMIT, 'quantity': quantity,
+            'price': price}
+
+
+def test_batch_results_map_by_position():
+    http_client = BinanceFutureHttp()
+    data = [{'clientOrderId': 'a', 'symbol': 'BTCUSDT', 'status': 'NEW', 'price': '100', 'origQty': '1',
+             'side': 'BUY'},
+            {'code': -2019, 'msg': 'Margin is insufficient.'}]
+    results = http_client._batch_results(['a', 'b', 'c'], data)
+    assert isinstance(results['a'], Order) and results['a'].client_order_id == 'a'
+    assert results['b'] == {'code': -2019, 'msg': 'Margin is insufficient.'}  # 錯誤的那幾筆還是dict
+    assert not results['c'] and 'missing result' in results['c'].msg  # 回傳的筆數不夠
+
+    error = GatewayError('/fapi/v1/batchOrders', status=503)
+    assert http_client._batch_results(['a', 'b'], error) == {'a': error, 'b': error}
+
+
+def test_place_batch_orders_splits_and_maps_results(http_client):
+    orders = [order_item(f"{29000 - i}.00") for i in range(6)] + [order_item('29000.00', quantity='0.00001')]
+    for index, order in enumerate(orders):
+        order['client_order_id'] = f"grid{index}"
+
+    count = http_client.request_count
+    results = http_client.place_batch_orders(orders)
+    assert http_client.request_count - count == 2  # 每5張一個請求
+    assert list(results) == [f"grid{index}" for index in range(7)]
+    assert all(isinstance(results[f"grid{index}"], Order) for index in range(6))
+    assert results['grid1'].price == 28999.0
+    assert results['grid6']['code'] == -4164  # 名義價值太小, 只有這一張失敗
+
+
+def test_cancel_batch_orders(http_client):
+    results = http_client.place_batch_orders([order_item('29000.00'), order_item('28900.00')])
+    client_order_ids = list(results) + ['unknown']
+    canceled = http_client.cancel_batch_orders('BTCUSDT', client_order_ids)
+    assert [isinstance(canceled[client_order_id], Order) for client_order_id in client_order_ids] == \
+           [True, True, False]
+    assert canceled['unknown']['code'] == -2011
+
+
+@pytest.fixture
+def trader(http_client):
+    trader = BinanceFutureTrader(http_client, config=config.copy(symbol='BTCUSDT', order_workers=2),
+                                 symbol_cache=SymbolFilterCache(http_client))
+    yield trader
+    trader.executor.shutdown()
+
+
+def test_trader_place_orders_keeps_request_order(trader):
+    requests = [(OrderSide.BUY, '0.001', f"{29000 - i}.00") for i in range(7)]
+    requests[3] = (OrderSide.BUY, '0.00001', '28997.00')
+    count = trader.http_client.request_count
+    orders = trader.place_orders(requests)
+    assert trader.http_client.request_count - count == 2
+    assert [order.price if order else None for order in orders] == \
+           [29000.0, 28999.0, 28998.0, None, 28996.0, 28995.0, 28994.0]  # 失敗的位置是None
+
+
+def test_trader_cancel_orders_returns_only_canceled(trader):
+    orders = trader.place_orders([(OrderSide.SELL, '0.001', '31000.00'), (OrderSide.SELL, '0.001', '31100.00')])
+    assert trader.http_client.cancel_order('BTCUSDT', orders[0].client_order_id)
+    assert trader.cancel_orders(orders) == [orders[1]]
+
+
+def test_trader_keeps_orders_when_a_batch_raises(trader, monkeypatch):
+    place_batch_orders = trader.http_client.place_batch_orders
+
+    def flaky(orders):
+        if orders[0]['price'] == '28995.00':
+            raise ConnectionError('boom')  # 第二組丟出例外
+        return place_batch_orders(orders)
+
+    monkeypatch.setattr(trader.http_client, 'place_batch_orders', flaky)
+    orders = trader.place_orders([(OrderSide.BUY, '0.001', f"{29000 - i}.00") for i in range(7)])
+    assert [order.price if order else None for order in orders] == \
+           [29000.0, 28999.0, 28998.0, 28997.0, 28996.0, None, None]  # 第一組已經下成功的單還在
+
+
+def drop_batch_responses(exchange):
+    """
+    交易所處理了批次下單, 但是回應在路上遺失.
+    """
+    handle = exchange.handle
+
+    def lossy_handle(method, path, params=None):
+        response = handle(method, path, params)
+        return None if method == 'POST' and path.endswith('/batchOrders') else response
+
+    exchange.handle = lossy_handle
+    return exchange
+
+
+def test_unknown_batch_result_is_checked_order_by_order():
+    exchange = drop_batch_responses(SimulatedExchange(futures=True, seed=1))
+    http_client = connect(BinanceFutureHttp(api_key='key', secret='secret', retry_policy=RetryPolicy(try_counts=1)),
+                          exchange)
+    results = http_client.place_batch_orders([order_item(f"{29000 - i}.00") for i in range(7)])
+    assert all(isinstance(result, Order) for result in results.values())  # 已經掛上的單用get_order找回來
+    assert {order.client_order_id for order in http_client.get_open_orders('BTCUSDT')} == set(results)
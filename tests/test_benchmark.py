@@ -0,0 +1,70 @@
+import json
+import pytest
+import requests
+import benchmark
+import utils.utility
+from gateway import BinanceSpotHttp
+from simulator import SimulatedExchange, SimulatedSession, connect
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.utility, 'TEMP_DIR', tmp_path)
+    return tmp_path
+
+
+def test_measure():
+    calls = []
+    result = benchmark.measure(lambda: calls.append(1), number=10, repeat=3)
+    assert len(calls) == 30
+    assert result['best'] <= result['median'] and (result['number'], result['repeat'], result['unit']) == (10, 3, 'us')
+
+
+def test_compare_flags_regressions(capsys):
+    baseline = {'fast': {'median': 10.0, 'unit': 'us'}, 'slow': {'median': 10.0, 'unit': 'us'}}
+    results = {'fast': {'median': 11.0, 'unit': 'us'}, 'slow': {'median': 13.0, 'unit': 'us'},
+               'new': {'median': 1.0, 'unit': 'us'}}
+    assert benchmark.compare(results, baseline, 0.2) == 1
+    output = capsys.readouterr().out
+    assert 'slow' in output and output.count('<-- slower') == 1
+    assert benchmark.compare(results, baseline, 0.5) == 0
+
+
+def test_simulated_session_survives_reset_and_disconnects():
+    exchange = SimulatedExchange(disconnect_rate=1.0, seed=1)
+    http_client = connect(BinanceSpotHttp(api_key='key', secret='secret'), exchange)
+    http_client.reset_session()
+    assert isinstance(http_client.session, SimulatedSession)  # 重建連線之後還是連到模擬交易所
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_client.session.request('GET', 'https://api.binance.com/api/v3/time')
+
+
+def test_bench_traders_keeps_orders_steady():
+    results = benchmark.bench_traders(quick=True, order_counts=(2,))
+    assert set(results) == {f"trader.{name}.{mode}.2" for name in ('spot', 'future')
+                            for mode in benchmark.RECONCILE_MODES}
+    assert all(result['open_orders'] == 4 and result['repeat'] == 3 for result in results.values())
+    for name in ('spot', 'future'):
+        # 用掛單快照對帳, 每一輪的請求數比逐張查單少
+        assert results[f"trader.{name}.open_orders.2"]['requests_per_cycle'] < \
+               results[f"trader.{name}.poll.2"]['requests_per_cycle']
+
+
+def test_bench_journal_cleans_up(temp_dir):
+    results = benchmark.bench_journal(quick=True, order_counts=(1,))
+    assert set(results) == {'journal.record.1', 'journal.save_json.1'}
+    assert not list(temp_dir.glob('benchmark_orders_*.json'))
+
+
+def test_main_writes_report_and_compares(temp_dir):
+    output = temp_dir.joinpath('report.json')
+    assert benchmark.main(['--quick', '--only', 'precision', '--output', str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert report['quick'] and 'precision.price_to_ticks' in report['results']
+
+    baseline = temp_dir.joinpath('baseline.json')
+    for result in report['results'].values():
+        result['median'] /= 1000  # 假裝以前快很多
+    baseline.write_text(json.dumps(report))
+    assert benchmark.main(['--quick', '--only', 'precision', '--output', str(output),
+                           '--compare', str(baseline)]) == 1
@@ -0,0 +1,96 @@
+import json
+import pytest
+from gateway import BinanceSpotHttp, BinanceBookTickerStream, SymbolFilterCache
+from simulator import SimulatedExchange, connect
+from trader.binance_spot_trader import BinanceSpotTrader
+from utils import config
+
+
+def book_ticker(update_id, bid_price, ask_price, symbol='BTCUSDT'):
+    return {'u': update_id, 's': symbol, 'b': str(bid_price), 'B': '1.0', 'a': str(ask_price), 'A': '1.0'}
+
+
+@pytest.fixture
+def stream():
+    stream = BinanceBookTickerStream('ws://localhost', ['btcusdt'])
+    stream.connected = True  # 不連線, 直接餵推送的內容
+    return stream
+
+
+def test_get_url():
+    stream = BinanceBookTickerStream('wss://fstream.binance.com', ['BTCUSDT', 'ethusdt'])
+    assert stream.get_url() == 'wss://fstream.binance.com/stream?streams=btcusdt@bookTicker/ethusdt@bookTicker'
+
+
+def test_drops_duplicate_and_out_of_order_updates(stream):
+    tickers = []
+    stream.on_ticker = lambda *args: tickers.append(args)
+    stream._on_message(None, json.dumps({'stream': 'btcusdt@bookTicker', 'data': book_ticker(5, 100.0, 100.1)}))
+    stream.on_data(book_ticker(4, 99.0, 99.1))
+    stream.on_data(book_ticker(5, 98.0, 98.1))
+    assert stream.get_bid_ask('BTCUSDT') == (100.0, 100.1)
+    assert tickers == [('BTCUSDT', 100.0, 100.1)]
+
+    stream.on_data(book_ticker(6, 101.0, 101.1))
+    assert stream.get_bid_ask('BTCUSDT') == (101.0, 101.1)
+
+
+def test_stale_or_disconnected_returns_none(stream, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('gateway.binance_websocket.time.monotonic', lambda: now[0])
+    stream.on_data(book_ticker(1, 100.0, 100.1))
+    assert stream.get_bid_ask('ETHUSDT') is None
+
+    now[0] += stream.stale_seconds + 1
+    assert stream.get_bid_ask('BTCUSDT') is None
+
+    stream.on_data(book_ticker(2, 100.0, 100.1))
+    stream.connected = False
+    assert stream.get_bid_ask('BTCUSDT') is None
+
+
+def test_reconnect_clears_tickers(stream):
+    stream.on_data(book_ticker(10, 100.0, 100.1))
+    stream.on_connected()
+    stream.on_data(book_ticker(1, 99.0, 99.1))  # 重新連線之後update_id可能從比較小的數字開始
+    assert stream.get_bid_ask('BTCUSDT') == (99.0, 99.1)
+
+
+@pytest.fixture
+def trader():
+    exchange = SimulatedExchange(seed=1)
+    http_client = connect(BinanceSpotHttp(api_key='key', secret='secret'), exchange)
+    trader = BinanceSpotTrader(http_client, config=config.copy(symbol='BTCUSDT'),
+                               symbol_cache=SymbolFilterCache(http_client))
+    yield trader
+    trader.executor.shutdown()
+
+
+def test_trader_wakes_up_when_price_crosses_orders(trader):
+    reasons = []
+    trader.wakeup_callback = reasons.append
+    trader.buy_orders.add({'clientOrderId': 'buy', 'price': '99.0'})
+    trader.sell_orders.add({'clientOrderId': 'sell', 'price': '101.0'})
+    trader.update_trigger_levels()
+    assert trader.trigger_levels == (99.0, 101.0)
+
+    trader.on_ticker('BTCUSDT', 99.5, 100.5)
+    assert reasons == []
+    trader.on_ticker('BTCUSDT', 98.5, 99.0)  # 賣一價跌到買單價
+    trader.on_ticker('BTCUSDT', 101.0, 101.5)
+    assert reasons == ['ticker']  # 一輪只喚醒一次
+
+    trader.update_trigger_levels()
+    trader.on_ticker('BTCUSDT', 101.0, 101.5)  # 買一價漲到賣單價
+    assert reasons == ['ticker', 'ticker']
+
+
+def test_trader_falls_back_to_rest_when_stream_is_stale(trader):
+    trader.market_stream = BinanceBookTickerStream('ws://localhost', ['BTCUSDT'])
+    trader.market_stream.connected = True
+    trader.market_stream.on_data(book_ticker(1, 12.0, 13.0))
+    assert trader.get_bid_ask_price() == (12.0, 13.0)
+
+    trader.market_stream.connected = False
+    ticker = trader.http_client.get_ticker('BTCUSDT')
+    assert trader.get_bid_ask_price() == (float(ticker['bidPrice']), float(ticker['askPrice']))
@@ -0,0 +1,82 @@
+import pytest
+from gateway import BinanceSpotHttp, Order, OrderSide, OrderStatus, OrderType
+from simulator import SimulatedExchange, connect
+from trader.binance_spot_trader import BinanceSpotTrader
+from trader.grid_runner import GridRunner
+from utils import config
+import utils.utility
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.utility, 'TEMP_DIR', tmp_path)  # 交易規則快照和journal不寫進trader/
+    return tmp_path
+
+
+@pytest.fixture
+def exchange():
+    return SimulatedExchange(seed=1)
+
+
+def create_runner(exchange, order_id_prefix='', **overrides):
+    http_client = connect(BinanceSpotHttp(api_key='key', secret='secret', client_order_prefix=order_id_prefix),
+                          exchange)
+    overrides.setdefault('grids', [{'symbol': 'BTCUSDT'}, {'symbol': 'ETHUSDT', 'quantity': 0.1}])
+    runner_config = config.copy(platform='binance_spot', symbol='BTCUSDT', order_journal=False, order_workers=2,
+                                order_id_prefix=order_id_prefix, **overrides)
+    return GridRunner(runner_config, http_client=http_client)
+
+
+def test_traders_share_gateway_cache_and_executor(exchange):
+    runner = create_runner(exchange)
+    try:
+        btc, eth = runner.traders['BTCUSDT'], runner.traders['ETHUSDT']
+        assert isinstance(btc, BinanceSpotTrader)
+        assert btc.http_client is eth.http_client is runner.http_client
+        assert btc.symbol_cache is eth.symbol_cache and btc.executor is eth.executor
+        assert (btc.config.quantity, eth.config.quantity) == (config.quantity, 0.1)  # 每個網格各自的設定
+        assert set(runner.scheduler.tasks) == {'BTCUSDT', 'ETHUSDT', 'report'}
+    finally:
+        runner.executor.shutdown()
+
+
+def test_duplicate_symbol_is_rejected(exchange):
+    with pytest.raises(ValueError):
+        create_runner(exchange, grids=[{'symbol': 'BTCUSDT'}, {'symbol': 'BTCUSDT'}])
+
+
+def test_stream_events_are_routed_by_symbol(exchange):
+    runner = create_runner(exchange)
+    try:
+        order = Order('ETHUSDT', 'eth1', 'BUY', 1900.0, 0.1, status=OrderStatus.FILLED, update_time=1)
+        runner.on_order_update(order)
+        runner.on_order_update(Order('XRPUSDT', 'xrp1', 'BUY', 0.5, 10.0))  # 沒有網格的交易對直接忽略
+        assert runner.traders['ETHUSDT'].order_updates == {'eth1': order}
+        assert runner.traders['BTCUSDT'].order_updates == {}
+        # 只喚醒那個交易對的網格
+        assert runner.scheduler.tasks['ETHUSDT'].reasons == {'order'}
+        assert not runner.scheduler.tasks['BTCUSDT'].pending
+
+        btc = runner.traders['BTCUSDT']
+        btc.buy_orders.add({'clientOrderId': 'btc1', 'price': '29000.00'})
+        btc.update_trigger_levels()
+        runner.on_ticker('BTCUSDT', 28990.0, 28999.0)
+        assert runner.scheduler.tasks['BTCUSDT'].reasons == {'ticker'}
+    finally:
+        runner.executor.shutdown()
+
+
+def test_cancel_open_orders_only_cancels_own_prefix(exchange):
+    runner = create_runner(exchange, order_id_prefix='g1')
+    other = connect(BinanceSpotHttp(api_key='key', secret='secret'), exchange)
+    try:
+        own = [runner.http_client.place_order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, '0.001', price)
+               for price in ('29000.00', '28900.00')]
+        manual = other.place_order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, '0.001', '28800.00')
+        assert all(own) and manual
+
+        runner.cancel_open_orders()
+        open_orders = runner.http_client.get_open_orders('BTCUSDT')
+        assert [order.client_order_id for order in open_orders] == [manual.client_order_id]
+    finally:
+        runner.executor.shutdown()
@@ -0,0 +1,28 @@
+import pytest
+from gateway import BinanceSpotHttp, BinanceFutureHttp
+from simulator import SimulatedExchange, ExchangeServer
+
+
+@pytest.mark.parametrize('futures, http_class', [(False, BinanceSpotHttp), (True, BinanceFutureHttp)])
+def test_requests_reuse_one_connection(futures, http_class):
+    with ExchangeServer(SimulatedExchange(futures=futures, seed=1)) as server:
+        http_client = http_class(api_key='key', secret='secret', host=server.url)
+        for _ in range(5):
+            assert http_client.get_ticker('BTCUSDT')
+
+        pools = http_client.session.get_adapter(server.url).poolmanager.pools
+        assert [pools[key].num_connections for key in pools.keys()] == [1]  # keep-alive, 不用每次重新連線
+
+
+def test_session_settings():
+    http_client = BinanceSpotHttp(api_key='key', secret='secret', proxy_host='127.0.0.1', proxy_port=8080,
+                                  pool_connections=3, pool_maxsize=7)
+    session = http_client.session
+    adapter = session.get_adapter('https://api.binance.com')
+    assert adapter._pool_connections == 3 and adapter._pool_maxsize == 7
+    assert session.headers['X-MBX-APIKEY'] == 'key'
+    assert session.proxies['https'] == 'http://127.0.0.1:8080'
+
+    http_client.reset_session()
+    assert http_client.session is not session  # 連線出錯時整個連線池換掉
+    assert http_client.session.headers['X-MBX-APIKEY'] == 'key'
@@ -0,0 +1,125 @@
+from threading import Lock, local
+import pytest
+from gateway import GatewayError
+from gateway.binance_spot import Interval
+import utils.utility
+
+np = pytest.importorskip('numpy')
+from gateway.kline_downloader import KlineDownloader, merge_ranges, missing_ranges, split_pages, find_gaps  # noqa
+from utils.kline_store import KlineStore  # noqa: E402
+
+MINUTE = 60 * 1000
+START = 1_600_000_000_000 // MINUTE * MINUTE
+
+
+class FakeKlineHttp(object):
+    """
+    任何時間都有1分鐘K線, 除了missing裡的區間(例如交易所維護); fail_starts裡的分頁請求失敗.
+    """
+
+    def __init__(self, missing=(), fail_starts=()):
+        self.missing = missing
+        self.fail_starts = set(fail_starts)
+        self.pages = []
+        self.lock = Lock()
+        self.local = local()
+
+    @property
+    def last_error(self):
+        return getattr(self.local, 'last_error', None)
+
+    def get_kline(self, symbol, interval, start_time=None, end_time=None, limit=500, max_try_time=10):
+        self.local.last_error = None
+        with self.lock:
+            self.pages.append((start_time, end_time))
+        if start_time in self.fail_starts:
+            self.local.last_error = GatewayError('/api/v3/klines', status=503)
+            return []
+        klines = []
+        for open_time in range(start_time, end_time + 1, MINUTE):
+            if any(start <= open_time <= end for start, end in self.missing):
+                continue
+            price = str(100 + (open_time - START) // MINUTE)
+            klines.append([open_time, price, price, price, price, '1.0', open_time + MINUTE - 1, '100.0', 10,
+                           '0.5', '50.0', '0'])
+        return klines[:limit]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.utility, 'TEMP_DIR', tmp_path)
+    return KlineStore()
+
+
+def test_merge_ranges():
+    assert merge_ranges([[10, 20], [0, 5], [6, 8], [30, 40], [35, 50]], 1) == [[0, 8], [10, 20], [30, 50]]
+    assert merge_ranges([], 1) == []
+
+
+def test_missing_ranges():
+    covered = [[10, 20], [30, 40]]
+    assert missing_ranges(covered, 0, 50, 1) == [[0, 9], [21, 29], [41, 50]]
+    assert missing_ranges(covered, 12, 35, 1) == [[21, 29]]
+    assert missing_ranges(covered, 10, 20, 1) == []
+    assert missing_ranges([], 5, 8, 1) == [[5, 8]]
+
+
+def test_split_pages():
+    assert split_pages([[0, 9], [20, 22]], 1, 4) == [(0, 3), (4, 7), (8, 9), (20, 22)]
+
+
+def test_find_gaps():
+    assert find_gaps(np.array([2, 3, 6, 7]), 0, 9, 1) == [(0, 1), (4, 5), (8, 9)]
+    assert find_gaps(np.array([0, 1, 2]), 0, 2, 1) == []
+    assert find_gaps(np.array([], dtype=np.int64), 0, 2, 1) == [(0, 2)]
+
+
+def test_download_pages_in_parallel_and_caches(store):
+    http_client = FakeKlineHttp()
+    downloader = KlineDownloader(http_client, max_workers=3, limit=100, store=store)
+    end = START + 249 * MINUTE
+    columns = downloader.download('BTCUSDT', Interval.MINUTE_1, START + 1, end + 30 * 1000)  # 對齊到K線開盤時間
+    assert len(columns['open_time']) == 249 and columns['open_time'][0] == START + MINUTE
+    assert np.all(np.diff(columns['open_time']) == MINUTE)
+    assert len(http_client.pages) == 3
+    assert downloader.gaps[('BTCUSDT', Interval.MINUTE_1)] == []
+
+    # 已經下載過的部分不再下載, 只補後面多的100根
+    http_client.pages.clear()
+    columns = downloader.download('BTCUSDT', Interval.MINUTE_1, START, end + 100 * MINUTE)
+    assert http_client.pages == [(START, START), (end + MINUTE, end + 100 * MINUTE)]
+    assert len(columns['open_time']) == 350 and store.count('BTCUSDT', Interval.MINUTE_1) == 350
+
+
+def test_failed_pages_are_downloaded_again(store):
+    http_client = FakeKlineHttp(fail_starts=[START + 100 * MINUTE])
+    downloader = KlineDownloader(http_client, limit=100, store=store)
+    end = START + 299 * MINUTE
+    assert len(downloader.download('BTCUSDT', Interval.MINUTE_1, START, end)['open_time']) == 200
+    assert downloader.gaps[('BTCUSDT', Interval.MINUTE_1)] == [(START + 100 * MINUTE, START + 199 * MINUTE)]
+
+    http_client.fail_starts.clear()
+    http_client.pages.clear()
+    assert len(downloader.download('BTCUSDT', Interval.MINUTE_1, START, end)['open_time']) == 300
+    assert http_client.pages == [(START + 100 * MINUTE, START + 199 * MINUTE)]
+
+
+def test_exchange_gaps_are_reported_but_not_refetched(store):
+    maintenance = (START + 10 * MINUTE, START + 19 * MINUTE)
+    http_client = FakeKlineHttp(missing=[maintenance])
+    downloader = KlineDownloader(http_client, limit=100, store=store)
+    end = START + 49 * MINUTE
+    assert len(downloader.download('BTCUSDT', Interval.MINUTE_1, START, end)['open_time']) == 40
+    assert downloader.gaps[('BTCUSDT', Interval.MINUTE_1)] == [maintenance]
+
+    http_client.pages.clear()
+    downloader.download('BTCUSDT', Interval.MINUTE_1, START, end)
+    assert http_client.pages == []  # 交易所本來就沒有的K線, 區間已經記錄為下載過
+
+
+def test_empty_range_and_unsupported_interval(store):
+    downloader = KlineDownloader(FakeKlineHttp(), store=store)
+    columns = downloader.download('BTCUSDT', Interval.MINUTE_1, START + MINUTE, START)
+    assert set(columns) >= {'open_time', 'close'} and len(columns['close']) == 0
+    with pytest.raises(ValueError):
+        downloader.download('BTCUSDT', Interval.MONTH_1, START)
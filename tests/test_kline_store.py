@@ -0,0 +1,96 @@
+import pytest
+import utils.utility
+import utils.kline_store
+
+np = pytest.importorskip('numpy')
+from utils.kline_store import KlineStore, klines_to_columns, KLINE_FIELDS  # noqa: E402
+
+MINUTE = 60 * 1000
+START = 1_600_000_000_000 // MINUTE * MINUTE
+
+
+def klines(indexes):
+    return [[START + index * MINUTE, str(100 + index), str(101 + index), str(99 + index), str(100.5 + index), '2.5',
+             START + (index + 1) * MINUTE - 1, '250.0', 7, '1.0', '100.0', '0'] for index in indexes]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.utility, 'TEMP_DIR', tmp_path)
+    return KlineStore()
+
+
+def test_klines_to_columns():
+    columns = klines_to_columns(klines([0, 1]))
+    assert set(columns) == {name for name, _ in KLINE_FIELDS}
+    assert columns['open_time'].dtype == np.int64 and columns['open_time'][0] == START  # 毫秒時間不經過float
+    assert columns['close'].tolist() == [100.5, 101.5]
+    assert columns['trades'].tolist() == [7, 7]
+
+    columns = klines_to_columns([kline[:6] for kline in klines([0, 1])])
+    assert columns['volume'].tolist() == [2.5, 2.5] and columns['trades'].tolist() == [0, 0]  # 缺少的欄位補0
+    assert len(klines_to_columns([])['open_time']) == 0
+
+
+def test_append_and_read_by_time(store):
+    assert store.append('BTCUSDT', '1m', klines_to_columns(klines(range(10)))) == 10
+    assert store.append('BTCUSDT', '1m', klines_to_columns(klines(range(10, 15)))) == 5  # 附加在尾端
+    columns = store.read('BTCUSDT', '1m', START + 3 * MINUTE, START + 5 * MINUTE)
+    assert columns['open'].tolist() == [103.0, 104.0, 105.0]
+    assert isinstance(columns['close'], np.memmap)  # 直接memory-map, 不複製資料
+    assert store.read('BTCUSDT', '1m', fields=['close'])['close'].tolist() == [100.5 + i for i in range(15)]
+    assert len(store.read('ETHUSDT', '1m')['open_time']) == 0
+
+
+def test_append_dedupes_and_backfills(store):
+    store.append('BTCUSDT', '1m', klines_to_columns(klines([5, 6, 7])))
+    added = store.append('BTCUSDT', '1m', klines_to_columns(klines([7, 3, 4, 4, 8])))  # 補舊的資料, 重寫欄位
+    assert added == 3
+    columns = store.read('BTCUSDT', '1m')
+    assert ((columns['open_time'] - START) // MINUTE).tolist() == [3, 4, 5, 6, 7, 8]
+    assert columns['open'].tolist() == [103.0, 104.0, 105.0, 106.0, 107.0, 108.0]
+    assert store.append('BTCUSDT', '1m', klines_to_columns(klines([3, 8]))) == 0
+
+
+def test_torn_write_is_ignored(store):
+    store.append('BTCUSDT', '1m', klines_to_columns(klines(range(3))))
+    path = store.get_path('BTCUSDT', '1m')
+    with open(path.joinpath('close'), mode='ab') as f:
+        f.write(b'\x00' * 5)  # 寫到一半中斷, meta的筆數還沒更新
+    assert len(store.read('BTCUSDT', '1m')['close']) == 3
+
+    store.append('BTCUSDT', '1m', klines_to_columns(klines([3])))
+    assert store.read('BTCUSDT', '1m')['close'].tolist() == [100.5, 101.5, 102.5, 103.5]
+
+
+def test_ranges_are_persisted(store, tmp_path):
+    store.set_ranges('BTCUSDT', '1m', [[START, START + MINUTE]])
+    assert KlineStore().get_ranges('BTCUSDT', '1m') == [[START, START + MINUTE]]
+    assert tmp_path.joinpath('klines', 'BTCUSDT_1m', 'meta.json').exists()
+
+
+def test_interrupted_merge_keeps_columns_aligned(store, monkeypatch):
+    store.append('BTCUSDT', '1m', klines_to_columns(klines([5, 6, 7])))
+    path = store.get_path('BTCUSDT', '1m')
+    fsync = utils.kline_store.os.fsync
+    calls = []
+
+    def crash(fd):
+        calls.append(fd)
+        if len(calls) == 3:
+            raise OSError('disk full')  # 合併寫到第3個欄位時中斷
+        fsync(fd)
+
+    monkeypatch.setattr(utils.kline_store.os, 'fsync', crash)
+    with pytest.raises(OSError):
+        store.append('BTCUSDT', '1m', klines_to_columns(klines([3, 4])))
+    columns = store.read('BTCUSDT', '1m')
+    assert ((columns['open_time'] - START) // MINUTE).tolist() == [5, 6, 7]  # meta還是舊的版本, 欄位沒有錯開
+    assert columns['open'].tolist() == [105.0, 106.0, 107.0] and columns['high'].tolist() == [106.0, 107.0, 108.0]
+
+    monkeypatch.setattr(utils.kline_store.os, 'fsync', fsync)
+    assert store.append('BTCUSDT', '1m', klines_to_columns(klines([3, 4]))) == 2
+    columns = store.read('BTCUSDT', '1m')
+    assert columns['open'].tolist() == [103.0, 104.0, 105.0, 106.0, 107.0]
+    assert columns['volume'].tolist() == [2.5] * 5
+    assert not path.joinpath('open').exists() and path.joinpath('open.1').exists()  # 舊版本的檔案已經刪除
@@ -0,0 +1,71 @@
+import pytest
+from gateway import BinanceSpotHttp, OrderSide, SymbolFilterCache
+from simulator import SimulatedExchange, connect
+from trader.binance_spot_trader import BinanceSpotTrader
+from utils import Precision, config
+
+np = pytest.importorskip('numpy')
+from trader.ladder import build_ladder, GEOMETRIC, ARITHMETIC  # noqa: E402
+
+
+@pytest.fixture
+def precision():
+    return Precision('0.01', '0.001')
+
+
+def test_geometric_buy_ladder(precision):
+    ladder = build_ladder(precision, 100, 0.01, 3, 0.5, OrderSide.BUY)
+    assert ladder.order_requests() == [(OrderSide.BUY, '0.500', '99.00'), (OrderSide.BUY, '0.500', '98.01'),
+                                       (OrderSide.BUY, '0.500', '97.03')]
+    assert ladder.notionals.tolist() == pytest.approx([49.5, 49.005, 48.515])
+
+
+def test_arithmetic_sell_ladder(precision):
+    ladder = build_ladder(precision, 100, 0.01, 3, 0.5, OrderSide.SELL, mode=ARITHMETIC)
+    assert [price for _, _, price in ladder.order_requests()] == ['101.00', '102.00', '103.00']
+
+
+def test_matches_stepping_one_level_at_a_time(precision):
+    ladder = build_ladder(precision, 30000, 0.003, 20, 0.001, OrderSide.SELL, mode=GEOMETRIC)
+    price = 30000.0
+    expected = []
+    for _ in range(20):
+        price *= 1.003
+        expected.append(precision.format_price(precision.price_to_ticks(price)))
+    assert [price for _, _, price in ladder.order_requests()] == expected
+
+
+def test_per_level_quantities_and_min_notional(precision):
+    ladder = build_ladder(precision, 100, 0.01, 3, [0.2, 0.04, 0.5], OrderSide.BUY, min_notional=5)
+    assert ladder.order_requests() == [(OrderSide.BUY, '0.200', '99.00'), (OrderSide.BUY, '0.500', '97.03')]
+
+
+def test_levels_closer_than_a_tick_are_merged():
+    precision = Precision('1', '0.001')
+    ladder = build_ladder(precision, 100, 0.002, 5, 1, OrderSide.SELL)
+    assert ladder.price_ticks.tolist() == [100, 101]  # 100.2, 100.4 都落在100
+    assert len(ladder) == 2
+
+
+def test_non_positive_prices_are_dropped(precision):
+    ladder = build_ladder(precision, 1, 0.4, 5, 1, OrderSide.BUY, mode=ARITHMETIC)
+    assert ladder.prices.tolist() == [0.6, 0.2]
+
+
+def test_unknown_mode(precision):
+    with pytest.raises(ValueError):
+        build_ladder(precision, 100, 0.01, 3, 1, OrderSide.BUY, mode='fibonacci')
+
+
+def test_trader_fills_empty_side_with_a_ladder():
+    http_client = connect(BinanceSpotHttp(api_key='key', secret='secret'), SimulatedExchange(seed=1))
+    trader = BinanceSpotTrader(http_client, config=config.copy(symbol='BTCUSDT', quantity=0.001, gap_percent=0.002,
+                                                               ladder_levels=4, max_orders=3, order_workers=2),
+                               symbol_cache=SymbolFilterCache(http_client))
+    try:
+        trader.start()
+        assert (len(trader.buy_orders), len(trader.sell_orders)) == (3, 3)  # 不超過max_orders
+        buy_prices = [order.price for order in trader.buy_orders.descending()]
+        assert buy_prices[0] / buy_prices[1] == pytest.approx(1 / 0.998, rel=1e-5)
+    finally:
+        trader.executor.shutdown()
@@ -0,0 +1,101 @@
+import json
+import logging
+import queue
+import sys
+import pytest
+from utils import config
+from utils.log import (ConsoleFormatter, DroppingQueueHandler, JsonFormatter, LogPipeline, LOG_DROPPED, LOGGER_ROOT,
+                       setup_logging, stop_logging)
+
+
+def make_record(msg='placed %s', args=('grid1',), name='binance.trader.BTCUSDT', **fields):
+    return logging.makeLogRecord(dict(name=name, levelno=logging.INFO, levelname='INFO', msg=msg, args=args,
+                                      **fields))
+
+
+@pytest.fixture
+def restore_levels():
+    names = [LOGGER_ROOT, f"{LOGGER_ROOT}.gateway", f"{LOGGER_ROOT}.trader.BTCUSDT"]
+    levels = {name: logging.getLogger(name).level for name in names}
+    yield
+    stop_logging()
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def test_json_formatter():
+    data = json.loads(JsonFormatter().format(make_record(symbol='BTCUSDT', price=1.5, order=object())))
+    assert (data['level'], data['logger'], data['msg']) == ('INFO', 'binance.trader.BTCUSDT', 'placed grid1')
+    assert data['symbol'] == 'BTCUSDT' and data['price'] == 1.5
+    assert data['order'].startswith('<object')  # 不能轉成JSON的值用str()
+    assert 'args' not in data and 'exc' not in data
+
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = make_record(exc_info=sys.exc_info())
+    assert 'ValueError: boom' in json.loads(JsonFormatter().format(record))['exc']
+
+
+def test_console_formatter_appends_fields():
+    line = ConsoleFormatter().format(make_record(symbol='BTCUSDT'))
+    assert line.endswith('INFO binance.trader.BTCUSDT: placed grid1 symbol=BTCUSDT')
+
+
+def test_handler_drops_and_reports_when_queue_is_full():
+    log_queue = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(log_queue)
+    before = LOG_DROPPED.values.get(('binance.test.drop',), 0)
+    for index in range(5):
+        handler.handle(make_record(args=(index,), name='binance.test.drop'))
+    assert handler.dropped == 3 and handler.unreported == 3
+    assert LOG_DROPPED.values[('binance.test.drop',)] == before + 3
+
+    log_queue.get_nowait()
+    handler.handle(make_record(args=(5,)))  # 只剩一個空位, 放不下補充說明, 之後再補
+    assert handler.unreported == 3
+
+    while not log_queue.empty():
+        log_queue.get_nowait()
+    handler.handle(make_record(args=(6,)))
+    record, notice = log_queue.get_nowait(), log_queue.get_nowait()
+    assert record.getMessage() == 'placed 6'
+    assert notice.levelno == logging.WARNING and notice.dropped == 3 and notice.getMessage().endswith('3 records')
+    assert handler.unreported == 0 and handler.dropped == 3
+
+
+def test_handler_keeps_message_lazy_and_formats_traceback():
+    handler = DroppingQueueHandler(queue.Queue())
+    try:
+        raise RuntimeError('boom')
+    except RuntimeError:
+        record = make_record(exc_info=sys.exc_info())
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    assert queued.msg == 'placed %s' and queued.args == ('grid1',)  # 訊息字串留給背景執行緒組
+    assert queued.exc_info is None and 'RuntimeError: boom' in queued.exc_text
+
+
+def test_pipeline_writes_json_lines(tmp_path, restore_levels):
+    log_file = tmp_path.joinpath('log.txt')
+    pipeline = LogPipeline(log_file=str(log_file), level='INFO', levels={'gateway': 'WARNING'}, console=False).start()
+    logging.getLogger('binance.trader.BTCUSDT').info('filled %s', 'grid1', extra={'symbol': 'BTCUSDT'})
+    logging.getLogger('binance.gateway').info('not written')  # 分類的等級是WARNING
+    logging.getLogger('binance.gateway').warning('retry')
+    pipeline.stop()
+
+    lines = [json.loads(line) for line in log_file.read_text(encoding='UTF-8').splitlines()]
+    assert [(line['logger'], line['msg']) for line in lines] == [('binance.trader.BTCUSDT', 'filled grid1'),
+                                                                  ('binance.gateway', 'retry')]
+    assert lines[0]['symbol'] == 'BTCUSDT' and pipeline.dropped == 0
+    assert pipeline.handler not in logging.getLogger().handlers
+
+
+def test_setup_logging_adds_suffix_and_replaces_pipeline(tmp_path, restore_levels):
+    shard_config = config.copy(log_file=str(tmp_path.joinpath('log.txt')), log_console=False, log_levels={})
+    first = setup_logging(shard_config, suffix='s0')
+    second = setup_logging(shard_config, suffix='s0')  # 重複呼叫時停掉前一個
+    assert first.handler not in logging.getLogger().handlers and second.handler in logging.getLogger().handlers
+    logging.getLogger('binance.trader.BTCUSDT').info('started')
+    stop_logging()
+    assert 'started' in tmp_path.joinpath('log.s0.txt').read_text(encoding='UTF-8')
@@ -0,0 +1,91 @@
+import time
+import pytest
+import requests
+from gateway import BinanceSpotHttp
+from gateway.retry_policy import RetryAction
+from simulator import SimulatedExchange, connect
+from utils.metrics import (metrics, MetricsRegistry, MetricsServer, PhaseTimer, Counter, Histogram, REQUEST_ERRORS,
+                           REQUEST_RESPONSES, REQUEST_SECONDS, REQUEST_WEIGHT, TRADER_PHASE_SECONDS, USED_WEIGHT,
+                           observe_request, observe_error)
+
+
+def test_counter_and_gauge_render():
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Requests.', ('path',))
+    assert registry.counter('requests_total', 'Requests.', ('path',)) is counter  # 同名的只建立一次
+    counter.inc('/api/v3/order')
+    counter.inc('/api/v3/order', amount=2)
+    counter.inc('say "hi"\n')
+    registry.gauge('used', 'Used weight.').set(7)
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP requests_total Requests.', '# TYPE requests_total counter']
+    assert 'requests_total{path="/api/v3/order"} 3' in lines
+    assert 'requests_total{path="say \\"hi\\"\\n"} 1' in lines  # label值要escape
+    assert '# TYPE used gauge' in lines and 'used 7' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency', 'Latency.', ('path',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):  # 剛好等於分界的算進那一格, 超過全部分界的只算進+Inf
+        histogram.observe(value, '/a')
+    lines = histogram.render()
+    assert lines[2:] == ['latency_bucket{path="/a",le="0.1"} 2', 'latency_bucket{path="/a",le="1.0"} 3',
+                         'latency_bucket{path="/a",le="+Inf"} 4', 'latency_sum{path="/a"} 3.65',
+                         'latency_count{path="/a"} 4']
+
+
+def test_observe_request_and_error():
+    path = '/test/observe'
+    observe_request('GET', path, 0.02, 200, {'REQUEST_WEIGHT': 5, 'ORDERS': 0}, {'X-MBX-USED-WEIGHT-1M': 42})
+    observe_request('GET', path, 0.5, None, {'REQUEST_WEIGHT': 5})
+    observe_error('GET', path, -1003, RetryAction.RETRY, retry=True)
+    observe_error('GET', path, None)
+
+    assert REQUEST_RESPONSES.values[('GET', path, '200')] == 1
+    assert REQUEST_RESPONSES.values[('GET', path, 'error')] == 1  # 連線錯誤沒有狀態碼
+    assert REQUEST_WEIGHT.values[('GET', path, 'REQUEST_WEIGHT')] == 10
+    assert ('GET', path, 'ORDERS') not in REQUEST_WEIGHT.values
+    assert USED_WEIGHT.values[('X-MBX-USED-WEIGHT-1M',)] == 42
+    assert REQUEST_SECONDS.values[('GET', path)][2] == 2
+    assert REQUEST_ERRORS.values[('GET', path, '-1003')] == 1
+    assert 'binance_retries_total{method="GET",path="/test/observe",action="RETRY"} 1' in \
+           metrics.render().splitlines()  # 用RetryAction的值當label
+
+
+def test_gateway_records_each_request():
+    http_client = connect(BinanceSpotHttp(api_key='key', secret='secret'), SimulatedExchange(seed=1))
+    key = ('GET', '/api/v3/order')
+    before = REQUEST_RESPONSES.values.get(key + ('400',), 0), REQUEST_ERRORS.values.get(key + ('-2013',), 0)
+    http_client.get_order('BTCUSDT', 'missing')
+    assert REQUEST_RESPONSES.values[key + ('400',)] == before[0] + 1
+    assert REQUEST_ERRORS.values[key + ('-2013',)] == before[1] + 1
+    assert REQUEST_WEIGHT.values[key + ('REQUEST_WEIGHT',)] > 0
+    assert USED_WEIGHT.values[('X-MBX-USED-WEIGHT-1M',)] > 0
+
+
+def test_phase_timer_accumulates_phases():
+    timer = PhaseTimer('METRICSUSDT')
+    for _ in range(2):
+        with timer.measure('place'):
+            time.sleep(0.01)
+    assert timer.elapsed['place'] >= 0.02
+    timer.observe()
+    assert TRADER_PHASE_SECONDS.values[('METRICSUSDT', 'place')][2] == 1  # 同一輪的兩次合併成一筆
+    assert TRADER_PHASE_SECONDS.values[('METRICSUSDT', 'cycle')][2] == 1
+
+
+@pytest.fixture
+def server():
+    registry = MetricsRegistry()
+    registry.register(Counter, 'scrapes_total', 'Scrapes.').inc()
+    server = MetricsServer(registry, port=0).start()
+    yield server
+    server.stop()
+
+
+def test_metrics_server(server):
+    response = requests.get(server.url, timeout=5)
+    assert response.status_code == 200 and response.headers['Content-Type'].startswith('text/plain')
+    assert 'scrapes_total 1' in response.text.splitlines()
+    assert requests.get(server.url.replace('/metrics', '/other'), timeout=5).status_code == 404
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import pytest
+from gateway import Order, OrderStatus, GatewayError, to_orders
+from gateway.binance_websocket import parse_execution_report, parse_order_trade_update
+
+ORDER_JSON = {'symbol': 'BTCUSDT', 'orderId': 28, 'clientOrderId': 'x-A6SIDXVS1', 'price': '29000.01000000',
+              'origQty': '0.00100000', 'executedQty': '0.00000000', 'status': 'NEW', 'timeInForce': 'GTC',
+              'type': 'LIMIT', 'side': 'BUY', 'updateTime': 1499827319559}
+
+
+def test_from_dict_parses_numbers_once():
+    order = Order.from_dict(ORDER_JSON)
+    assert (order.price, order.orig_qty, order.executed_qty) == (29000.01, 0.001, 0.0)
+    assert order.status is OrderStatus.NEW and order.is_open
+    assert order.update_time == 1499827319559 and order.raw is None
+    assert not hasattr(order, '__dict__')  # __slots__, 不用每張單一個dict
+
+
+def test_dict_style_access():
+    order = Order.from_dict(ORDER_JSON)
+    assert order['clientOrderId'] == 'x-A6SIDXVS1' and order.get('price') == 29000.01
+    assert order.get('timeInForce') is None and 'timeInForce' not in order
+    with pytest.raises(KeyError):
+        order['timeInForce']
+
+    order = Order.from_dict(ORDER_JSON, keep_raw=True)
+    assert order['timeInForce'] == 'GTC' and 'timeInForce' in order  # keep_raw時讀得到其他欄位
+
+
+def test_to_dict_round_trip():
+    order = Order.from_dict(ORDER_JSON)
+    data = json.loads(json.dumps(order.to_dict()))
+    assert data['status'] == 'NEW' and data['price'] == 29000.01
+    restored = Order.from_dict(data)
+    assert [getattr(restored, name) for name in Order.__slots__] == [getattr(order, name) for name in Order.__slots__]
+
+
+def test_spot_cancel_response_uses_original_client_order_id():
+    data = dict(ORDER_JSON, clientOrderId='cancelRequestId', origClientOrderId='x-A6SIDXVS1', status='CANCELED',
+                transactTime=1499827320000)
+    del data['updateTime']
+    order = Order.from_dict(data)
+    assert order.client_order_id == 'x-A6SIDXVS1' and order.status is OrderStatus.CANCELED
+    assert order.update_time == 1499827320000 and not order.is_open
+
+
+def test_unknown_status_is_kept():
+    order = Order.from_dict(dict(ORDER_JSON, status='NEW_STATUS'))
+    assert order.status == 'NEW_STATUS' and not order.is_open
+
+
+def test_to_orders():
+    error = GatewayError('/api/v3/order', status=400, code=-2010)
+    assert to_orders(error) is error
+    assert to_orders({'code': -2011, 'msg': 'Unknown order sent.'}) == {'code': -2011, 'msg': 'Unknown order sent.'}
+    orders = to_orders([ORDER_JSON, {'code': -2019}])
+    assert isinstance(orders[0], Order) and orders[1] == {'code': -2019}
+
+    async def fetch():
+        return ORDER_JSON
+
+    assert isinstance(asyncio.run(to_orders(fetch())), Order)  # async gateway回傳coroutine
+
+
+def test_stream_events_match_rest_orders():
+    report = {'e': 'executionReport', 'E': 1499405658658, 's': 'BTCUSDT', 'c': 'cancelRequestId',
+              'C': 'x-A6SIDXVS1', 'S': 'BUY', 'o': 'LIMIT', 'q': '0.00100000', 'p': '29000.01000000',
+              'X': 'CANCELED', 'i': 28, 'z': '0.00000000'}
+    order = parse_execution_report(report)
+    assert (order.client_order_id, order.status, order.price, order.update_time) == \
+           ('x-A6SIDXVS1', OrderStatus.CANCELED, 29000.01, 1499405658658)
+
+    update = {'e': 'ORDER_TRADE_UPDATE', 'E': 1568879465651, 'o': {
+        's': 'BTCUSDT', 'c': 'x-cLbi5uMH1', 'S': 'SELL', 'o': 'LIMIT', 'q': '0.001', 'p': '31000', 'X': 'FILLED',
+        'i': 8886774, 'z': '0.001'}}
+    order = parse_order_trade_update(update)
+    assert (order.side, order.status, order.executed_qty) == ('SELL', OrderStatus.FILLED, 0.001)
@@ -0,0 +1,88 @@
+import random
+from gateway import Order
+from trader.order_book import OrderBook
+
+
+def order(client_order_id, price):
+    return {'clientOrderId': client_order_id, 'price': str(price)}
+
+
+def ids(orders):
+    return [item.get('clientOrderId') for item in orders]
+
+
+def test_orders_are_sorted_by_price_then_insertion():
+    book = OrderBook(tick_size=0.01)
+    for item in (order('c', 101.0), order('a', 99.0), order('b', 100.0), order('b2', 100.0)):
+        book.add(item)
+    assert ids(book) == ['a', 'b', 'b2', 'c']
+    assert ids(book.descending()) == ['c', 'b2', 'b', 'a']
+    assert book.lowest()['clientOrderId'] == 'a' and book.highest()['clientOrderId'] == 'c'
+    assert (book.lowest_price(), book.highest_price()) == (99.0, 101.0)
+    assert len(book) == 4 and 'b' in book and book.get_price('b2') == 100.0
+
+
+def test_remove_by_order_or_id():
+    book = OrderBook()
+    first, second = order('a', 99.0), order('b', 100.0)
+    book.add(first)
+    book.add(second)
+    assert book.remove('a') is first
+    assert book.remove(second) is second
+    assert book.remove('missing') is None
+    assert not book and book.lowest() is None and book.highest_price() is None
+
+
+def test_adding_same_id_replaces_the_order():
+    book = OrderBook()
+    book.add(order('a', 99.0))
+    book.add(Order('BTCUSDT', 'a', 'BUY', 101.0, 1.0))  # 推送更新後同一張單換了價格
+    assert len(book) == 1 and book.highest_price() == 101.0
+    assert isinstance(book.get('a'), Order)
+
+
+def test_neighbors():
+    book = OrderBook(tick_size=0.5)
+    for client_order_id, price in (('a', 99.0), ('b', 100.0), ('c', 101.0)):
+        book.add(order(client_order_id, price))
+    lower, upper = book.neighbors(100.0)  # 同價位的不算
+    assert (lower['clientOrderId'], upper['clientOrderId']) == ('a', 'c')
+    lower, upper = book.neighbors(98.0)
+    assert lower is None and upper['clientOrderId'] == 'a'
+    lower, upper = book.neighbors(100.2)  # 換算成tick之後跟100.0同一格
+    assert (lower['clientOrderId'], upper['clientOrderId']) == ('a', 'c')
+
+
+def test_close_orders():
+    book = OrderBook()
+    for client_order_id, price in (('a', 100.0), ('b', 100.05), ('c', 101.0), ('d', 101.01)):
+        book.add(order(client_order_id, price))
+    assert ids(book.close_orders(0.001)) == ['b', 'd']  # 保留每一組裡價格最低的
+
+
+def test_set_tick_size_reindexes():
+    book = OrderBook()
+    book.add(order('a', 100.0))
+    book.add(order('b', 99.0))
+    book.set_tick_size(0.01)
+    assert book.tick_size == 0.01 and ids(book) == ['b', 'a']
+    assert book.order_keys['a'][0] == 10000
+    book.set_tick_size(None)  # 沒有交易規則時保持原本的tick
+    assert book.tick_size == 0.01
+
+
+def test_matches_sorted_list():
+    rng = random.Random(1)
+    book = OrderBook(tick_size=0.01)
+    expected = {}
+    for index in range(500):
+        if expected and rng.random() < 0.3:
+            client_order_id = rng.choice(sorted(expected))
+            book.remove(client_order_id)
+            del expected[client_order_id]
+        else:
+            price = round(rng.uniform(90, 110), 2)
+            book.add(order(f"o{index}", price))
+            expected[f"o{index}"] = (price, index)
+    assert ids(book) == sorted(expected, key=lambda client_order_id: expected[client_order_id])
+    assert len(book.keys) == len(book.key_ids) == len(book.prices) == len(expected)
@@ -0,0 +1,75 @@
+import time
+from threading import Event, Lock
+import pytest
+from trader.order_executor import OrderExecutor
+
+
+@pytest.fixture
+def executor():
+    executor = OrderExecutor(max_workers=4)
+    yield executor
+    executor.shutdown()
+
+
+def test_same_key_runs_in_submit_order(executor):
+    calls = []
+    lock = Lock()
+
+    def action(name, delay):
+        time.sleep(delay)
+        with lock:
+            calls.append(name)
+        return name
+
+    # 查單比撤單慢, 但同一張單的撤單要等查單結束
+    results = executor.run_all([(action, ('check', 0.05), 'order1'), (action, ('cancel', 0), 'order1'),
+                                (action, ('other', 0), 'order2')])
+    assert results == ['check', 'cancel', 'other']
+    assert calls.index('check') < calls.index('cancel')
+    assert calls[0] == 'other'  # 不同key的動作不用排隊
+
+
+def test_different_keys_run_concurrently(executor):
+    start = time.monotonic()
+    executor.run_all([(time.sleep, (0.1,), key) for key in ('a', 'b', 'c', None)])
+    assert time.monotonic() - start < 0.3
+
+
+def test_failed_action_does_not_block_the_next_one(executor):
+    def fail():
+        raise ValueError('boom')
+
+    first = executor.submit(fail, key='order1')
+    second = executor.submit(lambda: 'done', key='order1')
+    assert second.result(timeout=2) == 'done'
+    with pytest.raises(ValueError):
+        first.result()
+
+
+def test_next_action_waits_for_previous(executor):
+    started = Event()
+    release = Event()
+
+    def blocked():
+        started.set()
+        release.wait(2)
+        return 'first'
+
+    first = executor.submit(blocked, key='order1')
+    second = executor.submit(lambda: 'second', key='order1')
+    assert started.wait(2)
+    time.sleep(0.05)
+    assert not second.done()
+    release.set()
+    assert (first.result(timeout=2), second.result(timeout=2)) == ('first', 'second')
+
+
+def test_run_all_keeps_results_when_one_task_fails(executor, caplog):
+    def place(name):
+        if name == 'bad':
+            raise ConnectionError('boom')
+        return name
+
+    results = executor.run_all([(place, ('grid1',), None), (place, ('bad',), 'bad'), (place, ('grid2',), None)])
+    assert results == ['grid1', None, 'grid2']  # 已經下成功的單不會因為其他單失敗而遺失
+    assert 'boom' in caplog.text
@@ -0,0 +1,175 @@
+import json
+import pytest
+from gateway import BinanceSpotHttp, Order, OrderSide, OrderStatus, OrderType
+from simulator import SimulatedExchange, connect
+from trader.grid_runner import GridRunner
+from trader.order_book import OrderBook
+from trader.order_journal import OrderJournal, BUY, SELL
+from utils import config
+import utils.utility
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.utility, 'TEMP_DIR', tmp_path)
+    return tmp_path
+
+
+def new_order(client_order_id, side, price):
+    return Order('BTCUSDT', client_order_id, side, price, 0.01)
+
+
+def books(buys=(), sells=()):
+    buy_orders, sell_orders = OrderBook(0.01), OrderBook(0.01)
+    for order in buys:
+        buy_orders.add(order)
+    for order in sells:
+        sell_orders.add(order)
+    return buy_orders, sell_orders
+
+
+def loaded(path):
+    journal = OrderJournal(path)
+    try:
+        return sorted((side, order.client_order_id, order.price) for side, order in journal.load())
+    finally:
+        journal.close()
+
+
+def test_record_and_replay(tmp_path):
+    path = tmp_path.joinpath('grid.jsonl')
+    journal = OrderJournal(path)
+    assert journal.load() == []
+    buy_orders, sell_orders = books([new_order('b1', BUY, 99.0), new_order('b2', BUY, 98.0)],
+                                     [new_order('s1', SELL, 101.0)])
+    assert journal.record(buy_orders, sell_orders) == 3
+    assert journal.record(buy_orders, sell_orders) == 0  # 沒有變化時不寫檔
+
+    buy_orders.remove(buy_orders.orders['b1'])
+    sell_orders.add(new_order('s2', SELL, 100.0))  # 成交一張, 補一張
+    assert journal.record(buy_orders, sell_orders) == 2
+    journal.close()
+
+    events = [json.loads(line) for line in path.read_text(encoding='UTF-8').splitlines()]
+    assert [event['e'] for event in events] == ['add', 'add', 'add', 'add', 'remove']
+    assert loaded(path) == [(BUY, 'b2', 98.0), (SELL, 's1', 101.0), (SELL, 's2', 100.0)]
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path.joinpath('grid.jsonl')
+    journal = OrderJournal(path)
+    journal.load()
+    journal.record(*books([new_order('b1', BUY, 99.0)]))
+    journal.close()
+    with open(path, mode='a', encoding='UTF-8') as f:
+        f.write('{"e":"add","t":1,"side":"SELL","o":{"clientOrder')  # 寫到一半中斷
+    assert loaded(path) == [(BUY, 'b1', 99.0)]
+    assert path.read_text(encoding='UTF-8') == ''  # 讀完壓縮成快照, 壞掉的一行也清掉了
+
+
+def test_compact_writes_snapshot_and_truncates(tmp_path):
+    path = tmp_path.joinpath('grid.jsonl')
+    journal = OrderJournal(path, compact_events=3)
+    journal.load()
+    buy_orders, sell_orders = books([new_order('b1', BUY, 99.0)])
+    journal.record(buy_orders, sell_orders)
+    assert journal.event_count == 1
+    sell_orders.add(new_order('s1', SELL, 101.0))
+    sell_orders.add(new_order('s2', SELL, 102.0))
+    journal.record(buy_orders, sell_orders)
+    assert journal.event_count == 0 and path.read_text(encoding='UTF-8') == ''
+
+    sell_orders.remove(sell_orders.orders['s2'])
+    journal.record(buy_orders, sell_orders)
+    journal.close()
+    snapshot = json.loads(tmp_path.joinpath('grid.jsonl.snapshot').read_text(encoding='UTF-8'))
+    assert len(snapshot['orders']) == 3
+    assert loaded(path) == [(BUY, 'b1', 99.0), (SELL, 's1', 101.0)]  # 快照 + journal
+
+
+def test_replay_is_idempotent(tmp_path):
+    path = tmp_path.joinpath('grid.jsonl')
+    order = new_order('b1', BUY, 99.0).to_dict()
+    lines = [{'e': 'add', 't': 1, 'side': BUY, 'o': order}, {'e': 'remove', 't': 2, 'id': 'b1'},
+             {'e': 'remove', 't': 3, 'id': 'unknown'}, {'e': 'add', 't': 4, 'side': BUY, 'o': order}]
+    # 壓縮時中斷: 快照已經有b1, journal還是舊的, 重播結果一樣
+    tmp_path.joinpath('grid.jsonl.snapshot').write_text(json.dumps({'orders': [[BUY, order]]}), encoding='UTF-8')
+    path.write_text(''.join(json.dumps(line) + '\n' for line in lines), encoding='UTF-8')
+    assert loaded(path) == [(BUY, 'b1', 99.0)]
+
+
+@pytest.fixture
+def exchange():
+    return SimulatedExchange(seed=1)
+
+
+def create_runner(exchange):
+    http_client = connect(BinanceSpotHttp(api_key='key', secret='secret', client_order_prefix='g1'), exchange)
+    runner_config = config.copy(platform='binance_spot', symbol='BTCUSDT', grids=[{'symbol': 'BTCUSDT'}],
+                                order_id_prefix='g1', order_journal=True, order_workers=2)
+    return GridRunner(runner_config, http_client=http_client)
+
+
+def place(http_client, exchange, order_side, level):
+    item = exchange.symbols['BTCUSDT']
+    if order_side == OrderSide.BUY:  # 離市價很遠, 不會成交
+        price = item.precision.ticks_to_price(item.engine.best_bid() - level * 1000)
+    else:
+        price = item.precision.ticks_to_price(item.engine.best_ask() + level * 1000)
+    return http_client.place_order('BTCUSDT', order_side, OrderType.LIMIT, 0.001, price)
+
+
+def test_resume_orders_from_journal(exchange):
+    runner = create_runner(exchange)
+    trader = runner.traders['BTCUSDT']
+    http_client = runner.http_client
+    open_order = place(http_client, exchange, OrderSide.BUY, 1)
+    closed_order = place(http_client, exchange, OrderSide.BUY, 2)
+    try:
+        trader.journal.load()
+        trader.buy_orders.add(open_order)
+        trader.buy_orders.add(closed_order)
+        trader.journal.record(trader.buy_orders, trader.sell_orders)
+        trader.journal.close()
+    finally:
+        runner.executor.shutdown()
+
+    # 停機期間: 一張被撤銷, 另外又下了一張還沒寫進journal的, 別的process也有一張單
+    http_client.cancel_order('BTCUSDT', closed_order.client_order_id)
+    adopted_order = place(http_client, exchange, OrderSide.BUY, 3)
+    other_client = connect(BinanceSpotHttp(api_key='key', secret='secret', client_order_prefix='zz'), exchange)
+    other_order = place(other_client, exchange, OrderSide.BUY, 4)
+
+    runner = create_runner(exchange)
+    trader = runner.traders['BTCUSDT']
+    try:
+        runner.resume_orders()
+        assert set(trader.buy_orders.orders) == {open_order.client_order_id, closed_order.client_order_id,
+                                                 adopted_order.client_order_id}
+        assert other_order.client_order_id not in trader.buy_orders.orders and len(trader.sell_orders) == 0
+        assert trader.buy_orders.orders[open_order.client_order_id] is not open_order  # 換成交易所的最新狀態
+        # 已經不在掛單的單先用journal的狀態放回去, 第一輪再查詢
+        assert trader.buy_orders.orders[closed_order.client_order_id].status == OrderStatus.NEW
+        assert len(exchange.symbols['BTCUSDT'].engine.open_orders()) == 3  # 沒有撤單
+        trader.journal.close()
+        assert {client_order_id for _, client_order_id, _ in loaded(trader.journal.path)} == \
+               set(trader.buy_orders.orders)  # 接手的單也寫進journal
+    finally:
+        runner.executor.shutdown()
+
+
+def test_empty_journal_falls_back_to_cancel(exchange):
+    runner = create_runner(exchange)
+    trader = runner.traders['BTCUSDT']
+    try:
+        own_order = place(runner.http_client, exchange, OrderSide.SELL, 1)
+        other_client = connect(BinanceSpotHttp(api_key='key', secret='secret', client_order_prefix='zz'), exchange)
+        other_order = place(other_client, exchange, OrderSide.BUY, 2)
+        assert own_order.status == OrderStatus.NEW
+        runner.resume_orders()
+        open_ids = {order.client_order_id for order in exchange.symbols['BTCUSDT'].engine.open_orders()}
+        assert open_ids == {other_order.client_order_id}  # 只撤自己前綴的單
+        assert own_order.client_order_id not in trader.sell_orders.orders
+    finally:
+        trader.journal.close()
+        runner.executor.shutdown()
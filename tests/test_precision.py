@@ -0,0 +1,73 @@
+import random
+from decimal import Decimal, ROUND_HALF_UP
+import pytest
+from utils import Precision, round_to
+from utils.precision import parse_increment, format_units, to_gap_units, ROUND_DOWN, ROUND_UP
+
+
+@pytest.mark.parametrize('increment, expected', [
+    ('0.01000000', (2, 1)), ('0.5', (1, 5)), ('10.00', (0, 10)), ('0.00001', (5, 1)), (0.001, (3, 1)),
+])
+def test_parse_increment(increment, expected):
+    assert parse_increment(increment) == expected
+
+
+def test_parse_increment_rejects_zero():
+    with pytest.raises(ValueError):
+        parse_increment('0.00000000')
+
+
+def test_format_units():
+    assert format_units(30, 1) == '3.0'
+    assert format_units(1, 5) == '0.00001'  # 不會變成1e-05
+    assert format_units(-125, 2) == '-1.25'
+    assert format_units(12, 0) == '12'
+    assert format_units(10 ** 20 + 7, 8) == '1000000000000.00000007'  # 超過float精度時用整數運算
+
+
+def test_price_and_qty_round_trip():
+    precision = Precision('0.01000000', '0.00100000')
+    ticks = precision.price_to_ticks(29000.015)
+    assert precision.format_price(ticks) in ('29000.01', '29000.02')
+    assert precision.format_price(precision.price_to_ticks(0.3)) == '0.30'
+    assert precision.format_qty(precision.qty_to_steps('0.0129', ROUND_DOWN)) == '0.012'
+    assert precision.format_qty(precision.qty_to_steps(0.0121, ROUND_UP)) == '0.013'
+    # 0.3 / 0.1 = 2.9999999999999996, 無條件捨去時不能變成2
+    assert Precision('0.1', '0.1').qty_to_steps(0.3, ROUND_DOWN) == 3
+
+
+def test_non_decimal_tick_size():
+    precision = Precision('0.5', '1')
+    assert precision.format_price(precision.price_to_ticks(100.7)) == '100.5'
+    assert precision.format_price(precision.price_to_ticks(100.8)) == '101.0'
+    assert precision.round_price(100.7, ROUND_UP) == 101.0
+    assert precision.format_qty(precision.qty_to_steps(3.4)) == '3'
+
+
+def test_round_price_matches_round_to():
+    rng = random.Random(1)
+    for tick_size in ('0.01', '0.00001', '0.5', '10'):
+        precision = Precision(tick_size, '0.001')
+        for _ in range(200):
+            price = rng.uniform(0.1, 50000)  # 剛好在兩個tick中間時round_to是銀行家捨入, 這裡不比較
+            assert precision.round_price(price) == pytest.approx(round_to(price, float(tick_size)), abs=1e-12)
+
+
+def test_shift_ticks_matches_decimal():
+    gap_percent = 0.0015
+    gap_units = to_gap_units(gap_percent)
+    assert gap_units == 150000
+    for ticks in (1, 999, 2900000, 123456789):
+        for levels, factor in ((1, 1 + Decimal('0.0015')), (-1, 1 - Decimal('0.0015'))):
+            expected = int((ticks * factor).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+            assert Precision.shift_ticks(ticks, gap_units, levels) == expected
+    assert Precision.shift_ticks(1000000, gap_units, 3) == \
+           Precision.shift_ticks(Precision.shift_ticks(Precision.shift_ticks(1000000, gap_units), gap_units), gap_units)
+
+
+def test_batch_conversion():
+    precision = Precision('0.01', '0.001')
+    ticks = precision.prices_to_ticks([100.004, 100.005001, 99.999])
+    assert [int(value) for value in ticks] == [10000, 10001, 10000]
+    assert [int(value) for value in precision.prices_to_ticks([0.3], ROUND_DOWN)] == [30]
+    assert precision.format_prices(ticks) == ['100.00', '100.01', '100.00']
@@ -0,0 +1,83 @@
+import json
+from multiprocessing import Value
+from urllib.parse import quote
+import pytest
+from gateway import RateLimiter
+from gateway.rate_limiter import SPOT_ENDPOINT_WEIGHTS, SPOT_ORDER_ENDPOINTS, FUTURE_ENDPOINT_WEIGHTS, \
+    FUTURE_ORDER_ENDPOINTS
+
+
+def rate_limit(limit_type, interval, interval_num, limit):
+    return {'rateLimitType': limit_type, 'interval': interval, 'intervalNum': interval_num, 'limit': limit}
+
+
+@pytest.fixture
+def now(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('gateway.rate_limiter.time.monotonic', lambda: now[0])
+    return now
+
+
+def test_get_costs():
+    limiter = RateLimiter(weights=SPOT_ENDPOINT_WEIGHTS, order_endpoints=SPOT_ORDER_ENDPOINTS)
+    assert limiter.get_costs('GET', '/api/v3/openOrders', {'symbol': 'BTCUSDT'}) == {'REQUEST_WEIGHT': 6}
+    assert limiter.get_costs('GET', '/api/v3/openOrders', {}) == {'REQUEST_WEIGHT': 80}  # 不帶symbol比較貴
+    assert limiter.get_costs('POST', '/api/v3/order', {'symbol': 'BTCUSDT'}) == {'REQUEST_WEIGHT': 1, 'ORDERS': 1}
+    assert limiter.get_costs('GET', '/api/v3/unknown') == {'REQUEST_WEIGHT': 1}
+
+    limiter = RateLimiter(weights=FUTURE_ENDPOINT_WEIGHTS, order_endpoints=FUTURE_ORDER_ENDPOINTS)
+    batch = quote(json.dumps([{'symbol': 'BTCUSDT'}] * 3))
+    assert limiter.get_costs('POST', '/fapi/v1/batchOrders', {'batchOrders': batch}) == \
+           {'REQUEST_WEIGHT': 5, 'ORDERS': 3}  # 批次下單按張數計算
+
+
+def test_reserve_waits_when_bucket_is_empty(now):
+    limiter = RateLimiter([rate_limit('REQUEST_WEIGHT', 'SECOND', 10, 10)])
+    assert [limiter.reserve('GET', '/a') for _ in range(10)] == [0] * 10
+    assert limiter.reserve('GET', '/a') == pytest.approx(1.0)  # 每秒補1
+    assert limiter.reserve('GET', '/a') == pytest.approx(2.0)  # 先來的先排
+
+    now[0] += 3
+    assert limiter.reserve('GET', '/a') == 0
+
+
+def test_orders_bucket_only_counts_order_requests(now):
+    limiter = RateLimiter([rate_limit('REQUEST_WEIGHT', 'MINUTE', 1, 1200), rate_limit('ORDERS', 'SECOND', 1, 1)],
+                          SPOT_ENDPOINT_WEIGHTS, SPOT_ORDER_ENDPOINTS)
+    params = {'symbol': 'BTCUSDT'}
+    assert limiter.reserve('POST', '/api/v3/order', params) == 0
+    assert limiter.reserve('GET', '/api/v3/order', params) == 0  # 查單不計入ORDERS
+    assert limiter.reserve('POST', '/api/v3/order', params) == pytest.approx(1.0)
+
+
+def test_configure_keeps_used_tokens(now):
+    limiter = RateLimiter([rate_limit('REQUEST_WEIGHT', 'MINUTE', 1, 60)])
+    limiter.reserve('GET', '/a', costs={'REQUEST_WEIGHT': 50})
+    limiter.configure([rate_limit('REQUEST_WEIGHT', 'MINUTE', 1, 120), rate_limit('ORDERS', 'SECOND', 10, 50)])
+    bucket = limiter.buckets[('REQUEST_WEIGHT', 'MINUTE', 1)]
+    assert (bucket.capacity, bucket.tokens) == (120, 10)
+    assert limiter.buckets[('ORDERS', 'SECOND', 10)].tokens == 50
+
+
+def test_update_from_headers_only_lowers_tokens(now):
+    limiter = RateLimiter([rate_limit('REQUEST_WEIGHT', 'MINUTE', 1, 1200), rate_limit('ORDERS', 'SECOND', 10, 50)],
+                          share=0.5)
+    used = limiter.update_from_headers({'x-mbx-used-weight-1m': '800', 'X-MBX-ORDER-COUNT-10S': '4',
+                                        'Content-Type': 'application/json'})
+    assert used == {'X-MBX-USED-WEIGHT-1M': 800, 'X-MBX-ORDER-COUNT-10S': 4}
+    assert limiter.buckets[('REQUEST_WEIGHT', 'MINUTE', 1)].tokens == 600 - 400  # 額度和已使用量都按比例
+    assert limiter.buckets[('ORDERS', 'SECOND', 10)].tokens == 25 - 2
+
+    limiter.update_from_headers({'X-MBX-USED-WEIGHT-1M': '10'})
+    assert limiter.buckets[('REQUEST_WEIGHT', 'MINUTE', 1)].tokens == 200  # 還在路上的請求沒有算進去, 不往回調
+
+
+def test_block_delays_every_request(now):
+    shared_block = Value('d', 0.0)
+    limiter = RateLimiter([rate_limit('REQUEST_WEIGHT', 'MINUTE', 1, 1200)], shared_block=shared_block)
+    limiter.block(5)
+    assert limiter.reserve('GET', '/a') == pytest.approx(5)
+    assert shared_block.value > 0
+
+    other = RateLimiter([rate_limit('REQUEST_WEIGHT', 'MINUTE', 1, 1200)], shared_block=shared_block)
+    assert 4 < other.reserve('GET', '/a') <= 5  # 其他process也一起暫停
@@ -0,0 +1,85 @@
+from threading import Thread
+import pytest
+from gateway import BinanceSpotHttp, OrderSide, OrderStatus, SymbolFilterCache, GatewayError
+from simulator import SimulatedExchange, connect
+from trader.binance_spot_trader import BinanceSpotTrader
+from trader.order_executor import OrderExecutor
+from utils import config
+from utils.metrics import RequestCounter, count_request
+
+
+@pytest.fixture
+def http_client():
+    return connect(BinanceSpotHttp(api_key='key', secret='secret'), SimulatedExchange(seed=1))
+
+
+def create_trader(http_client, symbol='BTCUSDT', executor=None, **kwargs):
+    trader_config = config.copy(symbol=symbol, quantity=0.01, gap_percent=0.002, max_orders=3, order_workers=2,
+                                **kwargs)
+    return BinanceSpotTrader(http_client, config=trader_config, symbol_cache=SymbolFilterCache(http_client),
+                             executor=executor)
+
+
+def test_check_orders_only_queries_orders_missing_from_snapshot(http_client):
+    trader = create_trader(http_client)
+    try:
+        orders = [trader.place_order(OrderSide.BUY, '0.01', price) for price in ('29000.00', '28900.00', '28800.00')]
+        assert all(orders)
+        assert http_client.cancel_order('BTCUSDT', orders[1].client_order_id)
+
+        with RequestCounter() as counter:
+            open_orders = trader.get_open_orders_snapshot()
+            check_orders = trader.check_orders(orders, open_orders=open_orders)
+        assert counter.count == 2  # 一次openOrders + 已經不在掛單裡的那一張
+        assert [check_orders[order.client_order_id].status for order in orders] == \
+               [OrderStatus.NEW, OrderStatus.CANCELED, OrderStatus.NEW]
+
+        with RequestCounter() as counter:
+            trader.check_orders(orders)
+        assert counter.count == 3  # 沒有快照時逐筆查詢
+    finally:
+        trader.executor.shutdown()
+
+
+def test_snapshot_failure_falls_back_to_per_order_queries(http_client, monkeypatch):
+    trader = create_trader(http_client)
+    monkeypatch.setattr(http_client, 'get_open_orders', lambda symbol=None: GatewayError('/api/v3/openOrders'))
+    try:
+        assert trader.get_open_orders_snapshot() is None
+    finally:
+        trader.executor.shutdown()
+
+
+def test_request_count_is_per_trader_on_a_shared_gateway(http_client):
+    executor = OrderExecutor(max_workers=4)
+    traders = [create_trader(http_client, executor=executor), create_trader(http_client, 'ETHUSDT', executor)]
+    try:
+        for trader in traders:
+            trader.start()  # 第一輪掛單
+        start_count = http_client.request_count
+
+        threads = [Thread(target=trader.start) for trader in traders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        counts = [trader.cycle_request_count for trader in traders]
+        assert all(count > 0 for count in counts)
+        assert sum(counts) == http_client.request_count - start_count
+    finally:
+        executor.shutdown()
+
+
+def test_request_counter_follows_executor_context():
+    executor = OrderExecutor(max_workers=2)
+    try:
+        with RequestCounter() as outer:
+            count_request()
+            with RequestCounter() as inner:
+                executor.run_all([(count_request, (), None), (count_request, (), 'key')])
+            count_request()
+        count_request()  # 沒有計數器時不計算
+    finally:
+        executor.shutdown()
+    assert (outer.count, inner.count) == (2, 2)
@@ -0,0 +1,161 @@
+import json
+import pytest
+import requests
+from gateway import BinanceSpotHttp, BinanceFutureHttp, RetryPolicy, RetryAction, GatewayError, Order, OrderSide, \
+    OrderType
+from gateway.binance_spot import RequestMethod
+from gateway.retry_policy import is_duplicate_order, is_unknown_result, get_order_query
+from simulator import SimulatedExchange, SimulatedSession
+from simulator.session import SimulatedResponse
+
+
+@pytest.mark.parametrize('status, code, action', [
+    (None, None, RetryAction.RETRY),  # 連線錯誤或逾時
+    (503, None, RetryAction.RETRY),
+    (429, -1003, RetryAction.RETRY),
+    (400, -1021, RetryAction.RESIGN),
+    (400, -1015, RetryAction.RETRY),
+    (400, -2010, RetryAction.FATAL),
+    (400, -1013, RetryAction.FATAL),
+    (401, -2015, RetryAction.FATAL),
+])
+def test_classify(status, code, action):
+    assert RetryPolicy().classify(status, code) == action
+
+
+def test_get_delay_is_bounded(monkeypatch):
+    monkeypatch.setattr('gateway.retry_policy.random.uniform', lambda low, high: high)
+    policy = RetryPolicy(base_delay=0.5, max_delay=3)
+    assert [policy.get_delay(attempt) for attempt in range(5)] == [0.5, 1, 2, 3, 3]
+    assert policy.get_delay(0, retry_after=7) == 7  # 至少等到Retry-After
+
+
+def test_should_retry(monkeypatch):
+    monkeypatch.setattr('gateway.retry_policy.time.monotonic', lambda: 100.0)
+    policy = RetryPolicy(try_counts=3, deadline=10)
+    assert policy.should_retry(RetryAction.RETRY, 1, 100.0, 1)
+    assert policy.should_retry(RetryAction.RESIGN, 2, 100.0, 1)
+    assert not policy.should_retry(RetryAction.FATAL, 1, 100.0, 0)
+    assert not policy.should_retry(RetryAction.RETRY, 3, 100.0, 0)
+    assert not policy.should_retry(RetryAction.RETRY, 1, 95.0, 6)  # 超過deadline
+
+
+def test_gateway_error():
+    error = GatewayError('/api/v3/order', status=400, code=-2010, msg='Duplicate order sent.')
+    assert not error
+    assert error.get('code') == -2010 and error.get('missing', 1) == 1
+    assert is_duplicate_order(error)
+    assert is_duplicate_order({'code': -4116, 'msg': 'ClientOrderId is duplicated.'})
+    assert not is_duplicate_order({'code': -2010, 'msg': 'Account has insufficient balance.'})
+    assert not is_duplicate_order(None)
+
+
+def test_unknown_result_and_order_query():
+    assert is_unknown_result(None) and is_unknown_result(408) and is_unknown_result(502)
+    assert not is_unknown_result(400) and not is_unknown_result(429)
+
+    query = get_order_query('POST', {'symbol': 'BTCUSDT', 'newClientOrderId': 'abc', 'price': '1'})
+    assert query['symbol'] == 'BTCUSDT' and query['origClientOrderId'] == 'abc' and 'timestamp' in query
+    assert get_order_query('DELETE', {'symbol': 'BTCUSDT', 'newClientOrderId': 'abc'}) is None
+    assert get_order_query('POST', {'symbol': 'BTCUSDT'}) is None
+
+
+class ScriptedSession(object):
+    """
+    依序回傳準備好的回應, (status, body, headers) 或者要拋出的例外.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.urls = []
+        self.headers = {}
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.urls.append(url)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        status, body, headers = response
+        return SimulatedResponse(status, headers, json.dumps(body).encode('utf-8'))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('gateway.binance_spot.time.sleep', sleeps.append)
+    return sleeps
+
+
+def create_client(responses):
+    http_client = BinanceSpotHttp(api_key='key', secret='secret', retry_policy=RetryPolicy(try_counts=3))
+    http_client.session = ScriptedSession(responses)
+    http_client._create_session = lambda: http_client.session
+    return http_client
+
+
+def test_retries_transient_errors(sleeps):
+    http_client = create_client([requests.exceptions.ConnectionError('reset'), (503, {}, {}),
+                                 (200, {'serverTime': 1}, {})])
+    assert http_client.request(RequestMethod.GET, '/api/v3/time') == {'serverTime': 1}
+    assert len(sleeps) == 2 and http_client.request_count == 3
+
+
+def test_fatal_error_is_not_retried(sleeps):
+    http_client = create_client([(400, {'code': -2010, 'msg': 'Account has insufficient balance.'}, {})])
+    error = http_client.request(RequestMethod.GET, '/api/v3/account', {'timestamp': 1}, verify=True)
+    assert not error and (error.code, error.action, error.attempts) == (-2010, RetryAction.FATAL, 1)
+    assert http_client.last_error is error and sleeps == []
+
+
+def test_timestamp_error_resigns(sleeps):
+    http_client = create_client([(400, {'code': -1021, 'msg': 'Timestamp outside of the recvWindow.'}, {}),
+                                 (200, {'balances': []}, {})])
+    assert http_client.request(RequestMethod.GET, '/api/v3/account', {'timestamp': 1}, verify=True) == \
+           {'balances': []}
+    first, second = http_client.session.urls
+    assert 'timestamp=1&' in first and 'timestamp=1&' not in second  # 用新的timestamp重新簽名
+
+
+def test_too_many_requests_blocks_the_limiter(sleeps):
+    http_client = create_client([(429, {'code': -1003, 'msg': 'Too many requests.'}, {'Retry-After': '3'}),
+                                 (200, {}, {})])
+    assert http_client.request(RequestMethod.GET, '/api/v3/time') == {}
+    assert sleeps[0] >= 3
+    assert http_client.rate_limiter.blocked_until > 0
+
+
+class LossySession(SimulatedSession):
+    """
+    交易所已經處理了下單, 但是回應在路上遺失(逾時).
+    """
+    lose = 1
+
+    def request(self, method, url, timeout=None, **kwargs):
+        response = super().request(method, url, timeout=timeout)
+        if method == 'POST' and self.lose:
+            self.lose -= 1
+            raise requests.exceptions.ReadTimeout('read timed out')
+        return response
+
+
+@pytest.mark.parametrize('futures, http_class', [(False, BinanceSpotHttp), (True, BinanceFutureHttp)])
+def test_timed_out_order_is_not_placed_twice(futures, http_class):
+    session = LossySession(SimulatedExchange(futures=futures, seed=1))
+    http_client = http_class(api_key='key', secret='secret', retry_policy=RetryPolicy(base_delay=0.01))
+    http_client.session = session
+    http_client._create_session = lambda: session
+
+    order = http_client.place_order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, '0.001', '29000.00')
+    assert isinstance(order, Order)  # 重送時clientOrderId重複, 查詢第一次送出的訂單
+    assert [item.client_order_id for item in http_client.get_open_orders('BTCUSDT')] == [order.client_order_id]
+
+    if futures:
+        session.lose = 1
+        results = http_client.place_batch_orders([{'symbol': 'BTCUSDT', 'order_side': OrderSide.BUY,
+                                                   'order_type': OrderType.LIMIT, 'quantity': '0.001',
+                                                   'price': f"{28000 + i}.00"} for i in range(3)])
+        assert all(isinstance(result, Order) for result in results.values())
+        assert len(http_client.get_open_orders('BTCUSDT')) == 4
@@ -0,0 +1,78 @@
+import time
+from threading import Thread
+import pytest
+from trader.scheduler import Scheduler, ScheduledTask
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture(params=[1, 2], ids=['inline', 'pool'])
+def scheduler(request):
+    scheduler = Scheduler(max_workers=request.param)
+    thread = Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    yield scheduler
+    scheduler.stop()
+    thread.join(2)
+    assert not thread.is_alive()
+
+
+def test_due_time():
+    task = ScheduledTask('grid', lambda: None, interval=20, min_interval=1)
+    task.next_run, task.last_run = 120, 100
+    assert task.due_time() == 120
+    task.pending = True
+    assert task.due_time() == 101  # 有事件時不用等到interval, 但要隔min_interval
+
+
+def test_runs_on_timer(scheduler):
+    task = scheduler.add_task('grid', lambda: None, interval=0.05)
+    assert wait_until(lambda: task.run_count >= 3)
+    assert task.deadline == 0.05
+
+
+def test_notify_wakes_task_early(scheduler):
+    task = scheduler.add_task('grid', lambda: None, interval=60)
+    assert wait_until(lambda: task.run_count == 1)
+
+    start = time.monotonic()
+    scheduler.notify('grid', 'order')
+    assert wait_until(lambda: task.run_count == 2, timeout=2)
+    assert time.monotonic() - start < 1
+    assert task.reasons == set()
+
+
+def test_min_interval_coalesces_events(scheduler):
+    task = scheduler.add_task('grid', lambda: None, interval=60, min_interval=0.3)
+    assert wait_until(lambda: task.run_count == 1)
+    for _ in range(10):
+        scheduler.notify(reason='ticker')  # 推送很頻繁時合併成一次
+    assert wait_until(lambda: task.run_count == 2)
+    time.sleep(0.1)
+    assert task.run_count == 2
+
+
+def test_error_and_overrun_are_counted(scheduler):
+    def fail():
+        raise RuntimeError('boom')
+
+    failing = scheduler.add_task('failing', fail, interval=60, error_delay=0.05)
+    slow = scheduler.add_task('slow', lambda: time.sleep(0.05), interval=60, deadline=0.01)
+    # 例外之後等error_delay再跑; error_count比run_count先加, 兩個都要等
+    assert wait_until(lambda: failing.error_count >= 2 and failing.run_count >= 2)
+    assert wait_until(lambda: slow.overrun_count == 1)
+    assert slow.max_duration >= 0.05
+
+
+def test_delay_postpones_first_run(scheduler):
+    task = scheduler.add_task('report', lambda: None, interval=60, delay=0.2)
+    time.sleep(0.1)
+    assert task.run_count == 0
+    assert wait_until(lambda: task.run_count == 1)
@@ -0,0 +1,153 @@
+import time
+import pytest
+from gateway import BinanceSpotHttp, OrderSide, OrderStatus, OrderType
+from simulator import MatchingEngine, SimulatedExchange, SimulatorError, connect
+from utils import Precision
+
+BUY, SELL = OrderSide.BUY.value, OrderSide.SELL.value
+
+
+@pytest.fixture
+def engine():
+    engine = MatchingEngine('BTCUSDT', Precision('0.01', '0.001'))
+    engine.set_reference(9990, 10010)  # 外部報價 99.90 / 100.10
+    return engine
+
+
+def test_price_time_priority(engine):
+    engine.place(SELL, 'LIMIT', 2, 10005, 'first', 'GTC', 1)
+    engine.place(SELL, 'LIMIT', 2, 10005, 'second', 'GTC', 2)
+    engine.place(SELL, 'LIMIT', 2, 10003, 'better', 'GTC', 3)
+    assert engine.best_ask() == 10003
+
+    taker = engine.place(BUY, 'LIMIT', 5, 10005, 'taker', 'GTC', 4)
+    assert taker.status == OrderStatus.FILLED and taker.quote == 2 * 10003 + 3 * 10005
+    assert engine.get('better').status == OrderStatus.FILLED
+    assert engine.get('first').status == OrderStatus.FILLED  # 同價格先掛的先成交
+    second = engine.get('second')
+    assert second.status == OrderStatus.PARTIALLY_FILLED and second.remaining == 1
+    assert engine.depth(5, 100)[1] == [(10005, 1), (10010, 100)]
+
+
+def test_crossing_the_reference_fills_at_the_reference(engine):
+    order = engine.place(BUY, 'LIMIT', 3, 10050, 'buy', 'GTC', 1)
+    assert order.status == OrderStatus.FILLED and order.quote == 3 * 10010
+    assert engine.last_price == 10010
+
+
+def test_ioc_fok_and_market(engine):
+    engine.set_reference(9990, 0)  # 沒有外部賣方流動性, 只有自己的掛單
+    engine.place(SELL, 'LIMIT', 2, 10005, 'ask', 'GTC', 1)
+    fok = engine.place(BUY, 'LIMIT', 3, 10005, 'fok', 'FOK', 2)
+    assert fok.status == OrderStatus.EXPIRED and fok.executed == 0
+    assert engine.get('ask').remaining == 2  # FOK不夠量時完全不成交
+
+    ioc = engine.place(BUY, 'LIMIT', 3, 10005, 'ioc', 'IOC', 3)
+    assert ioc.status == OrderStatus.EXPIRED and ioc.executed == 2  # 剩下的直接過期, 不掛單
+    assert engine.open_orders() == []
+
+    market = engine.place(SELL, 'MARKET', 4, 0, 'market', None, 4)
+    assert market.status == OrderStatus.FILLED and market.quote == 4 * 9990
+
+
+def test_duplicate_and_unknown_orders(engine):
+    engine.place(BUY, 'LIMIT', 1, 9900, 'grid1', 'GTC', 1)
+    with pytest.raises(SimulatorError) as e:
+        engine.place(BUY, 'LIMIT', 1, 9900, 'grid1', 'GTC', 2)
+    assert e.value.code == -2010
+
+    assert engine.cancel('grid1', 3).status == OrderStatus.CANCELED
+    with pytest.raises(SimulatorError) as e:
+        engine.cancel('grid1', 4)
+    assert e.value.code == -2011
+    with pytest.raises(SimulatorError) as e:
+        engine.get('missing')
+    assert e.value.code == -2013
+
+    engine.place(BUY, 'LIMIT', 1, 9900, 'grid1', 'GTC', 5)  # 已結束的clientOrderId可以再用
+    assert engine.bid_prices == [9900] and len(engine.open_orders()) == 1
+
+
+def test_sweep_with_volume_limit(engine):
+    for index, price in enumerate([9950, 9960, 9960]):
+        engine.place(BUY, 'LIMIT', 2, price, f"buy{index}", 'GTC', index)
+    engine.place(SELL, 'LIMIT', 2, 10050, 'sell', 'GTC', 3)
+
+    filled = engine.sweep(9955, 10040, 10, volume=3)
+    assert [order.client_order_id for order in filled] == ['buy1', 'buy2']  # 價格較高、先掛的優先
+    assert engine.get('buy1').status == OrderStatus.FILLED
+    assert engine.get('buy2').remaining == 1
+    assert engine.get('buy0').executed == 0 and engine.get('sell').executed == 0  # 沒有被掃到
+
+    filled = engine.sweep(9900, 10050, 11)
+    assert {order.client_order_id for order in filled} == {'buy0', 'buy2', 'sell'}
+    assert engine.open_orders() == [] and engine.bid_prices == [] and engine.ask_prices == []
+
+
+def signed(**params):
+    return dict(params, timestamp=str(int(time.time() * 1000)))
+
+
+def test_exchange_checks_filters_and_timestamp():
+    exchange = SimulatedExchange(symbols={'BTCUSDT': {'price': 100, 'min_notional': 5}}, seed=1)
+    status, _, body = exchange.handle('POST', '/api/v3/order', signed(
+        symbol='BTCUSDT', side='BUY', type='LIMIT', quantity='1', price='99.001', timeInForce='GTC'))
+    assert (status, body['code'], body['msg']) == (400, -1013, 'Filter failure: PRICE_FILTER')
+    status, _, body = exchange.handle('POST', '/api/v3/order', signed(
+        symbol='BTCUSDT', side='BUY', type='LIMIT', quantity='0.01', price='99', timeInForce='GTC'))
+    assert body['msg'] == 'Filter failure: NOTIONAL'
+
+    futures = SimulatedExchange(symbols={'BTCUSDT': {'price': 100}}, futures=True, seed=1)
+    _, _, body = futures.handle('POST', '/fapi/v1/order', signed(
+        symbol='BTCUSDT', side='BUY', type='LIMIT', quantity='1', price='99.001', timeInForce='GTC'))
+    assert body['code'] == -4014  # 合約的錯誤碼不一樣
+
+    skewed = SimulatedExchange(clock_skew_ms=10_000, seed=1)
+    status, _, body = skewed.handle('GET', '/api/v3/openOrders', signed())
+    assert (status, body['code']) == (400, -1021)
+    server_time = skewed.handle('GET', '/api/v3/time')[2]['serverTime']
+    status, _, _ = skewed.handle('GET', '/api/v3/openOrders', {'timestamp': str(server_time)})
+    assert status == 200
+
+
+def test_exchange_rate_limit_then_ban():
+    exchange = SimulatedExchange(weight_limit=3, ban_seconds=60, seed=1)
+    statuses = []
+    for _ in range(3):
+        status, headers, _ = exchange.handle('GET', '/api/v3/time')
+        statuses.append(status)
+    assert statuses == [200, 200, 200] and headers['X-MBX-USED-WEIGHT-1M'] == '3'
+
+    status, headers, body = exchange.handle('GET', '/api/v3/time')
+    assert (status, body['code']) == (429, -1003) and int(headers['Retry-After']) >= 1
+    status, headers, _ = exchange.handle('GET', '/api/v3/time')  # 沒有等Retry-After就繼續送
+    assert status == 418 and int(headers['Retry-After']) > 50
+    assert exchange.status_counts == {200: 3, 429: 1, 418: 1} and exchange.request_count == 5
+
+
+def test_history_bars_and_klines():
+    exchange = SimulatedExchange(history_bars=30, seed=1)
+    status, _, klines = exchange.handle('GET', '/api/v3/klines', {'symbol': 'BTCUSDT', 'interval': '1m',
+                                                                  'limit': '10'})
+    assert status == 200 and len(klines) == 10
+    assert all(later[0] - earlier[0] == 60_000 for earlier, later in zip(klines, klines[1:]))
+    assert klines[-1][6] < time.time() * 1000  # 最後一根已經收盤
+    assert all(float(kline[3]) <= float(kline[1]) <= float(kline[2]) for kline in klines)
+    _, _, body = exchange.handle('GET', '/api/v3/klines', {'symbol': 'BTCUSDT', 'interval': '1h'})
+    assert body['code'] == -1120
+
+
+def test_gateway_order_fills_after_step():
+    exchange = SimulatedExchange(symbols={'BTCUSDT': {'price': 100, 'volatility': 0.01}}, seed=3)
+    http_client = connect(BinanceSpotHttp(api_key='key', secret='secret'), exchange)
+    item = exchange.symbols['BTCUSDT']
+    price = item.precision.ticks_to_price(item.engine.best_bid())
+    order = http_client.place_order('BTCUSDT', OrderSide.BUY, OrderType.LIMIT, 1, price, client_order_id='grid1')
+    assert order.status == OrderStatus.NEW and order.client_order_id == 'grid1'
+
+    for _ in range(200):
+        if exchange.step():
+            break
+    order = http_client.get_order('BTCUSDT', client_order_id='grid1')
+    assert order.status == OrderStatus.FILLED and order.executed_qty == 1
+    assert http_client.get_open_orders('BTCUSDT') == []
@@ -0,0 +1,97 @@
+import time
+import pytest
+import websocket
+from gateway import BinanceSpotHttp, BinanceFutureHttp, BinanceBookTickerStream, OrderSide, OrderStatus, \
+    SymbolFilterCache
+from simulator import SimulatedExchange, StreamServer, connect
+from trader.binance_spot_trader import BinanceSpotTrader
+from utils import config
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def exchange():
+    return SimulatedExchange(seed=1)
+
+
+@pytest.fixture
+def server(exchange):
+    server = StreamServer(exchange).start()
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize('futures, http_class', [(False, BinanceSpotHttp), (True, BinanceFutureHttp)])
+def test_listen_key_routes(futures, http_class):
+    http_client = connect(http_class(api_key='key', secret='secret'), SimulatedExchange(futures=futures, seed=1))
+    listen_key = http_client.create_listen_key()['listenKey']
+    assert http_client.create_listen_key()['listenKey'] == listen_key  # 還有效的listenKey會重複使用
+
+    assert http_client.keep_alive_listen_key(listen_key) is not None
+    assert http_client.close_listen_key(listen_key) == {}
+    error = http_client.keep_alive_listen_key(listen_key)
+    assert not error and error.code == -1125
+
+
+def test_user_stream_reconnects_and_backfills(exchange, server):
+    http_client = connect(BinanceSpotHttp(api_key='key', secret='secret'), exchange)
+    trader = BinanceSpotTrader(http_client, config=config.copy(symbol='BTCUSDT', order_workers=2),
+                               symbol_cache=SymbolFilterCache(http_client))  # 不寫快照檔
+    trader.stream_host = server.url
+    trader.start_user_stream()
+    user_stream = trader.user_stream
+    user_stream.reconnect_delay = 0.5
+    try:
+        assert wait_until(lambda: user_stream.connected)
+        assert not trader.use_user_stream()  # 剛連線先用REST補查一次
+        assert trader.use_user_stream()
+
+        order = trader.place_order(OrderSide.BUY, '0.001', '29000.00')
+        trader.buy_orders.add(order)
+        client_order_id = order.client_order_id
+        assert wait_until(lambda: client_order_id in trader.order_updates)
+        assert trader.order_updates[client_order_id].status == OrderStatus.NEW
+
+        # 斷線期間撤單, 推送的事件會遺失
+        server.disconnect()
+        assert wait_until(lambda: not user_stream.connected)
+        assert http_client.cancel_order('BTCUSDT', client_order_id)
+        assert wait_until(lambda: user_stream.connected and user_stream.connect_count == 2)
+        assert trader.order_updates[client_order_id].status == OrderStatus.NEW
+
+        # 重新連線之後這一輪改用REST查詢, 補上斷線期間的變化
+        assert not trader.use_user_stream()
+        check_orders = trader.check_orders(list(trader.buy_orders), use_stream=False)
+        assert check_orders[client_order_id].status == OrderStatus.CANCELED
+        assert trader.order_updates[client_order_id].status == OrderStatus.CANCELED
+        assert trader.use_user_stream()
+    finally:
+        user_stream.stop()
+        trader.executor.shutdown()
+
+
+def test_book_ticker_stream(exchange, server):
+    stream = BinanceBookTickerStream(server.url, ['BTCUSDT'], reconnect_delay=0.1)
+    stream.start()
+    try:
+        assert wait_until(lambda: stream.connected)
+        exchange.step()
+        assert wait_until(lambda: stream.get_bid_ask('BTCUSDT') is not None)
+        bid_price, ask_price = stream.get_bid_ask('BTCUSDT')
+        ticker = exchange.get_book_ticker({'symbol': 'BTCUSDT'})
+        assert (bid_price, ask_price) == (float(ticker['bidPrice']), float(ticker['askPrice']))
+    finally:
+        stream.stop()
+
+
+def test_invalid_listen_key_is_rejected(server):
+    with pytest.raises(websocket.WebSocketBadStatusException):
+        websocket.create_connection(f"{server.url}/ws/unknown", timeout=2)
@@ -0,0 +1,79 @@
+import pytest
+from trader.supervisor import Supervisor, get_shard_prefix
+from utils import config
+
+
+class FakeProcess(object):
+
+    def __init__(self, alive=True, exitcode=None):
+        self.alive = alive
+        self.exitcode = exitcode
+
+    def is_alive(self):
+        return self.alive
+
+
+def grids(count):
+    return [{'symbol': f"SYM{index}USDT"} for index in range(count)]
+
+
+def test_get_shard_prefix():
+    assert get_shard_prefix(3) == 'w03'
+    assert get_shard_prefix(12).isalnum() and len(get_shard_prefix(12)) <= 6  # clientOrderId前綴的限制
+
+
+def test_grids_are_split_round_robin():
+    supervisor = Supervisor(config.copy(grids=grids(5)), processes=2)
+    assert supervisor.shard_count == 2
+    assert [[grid['symbol'] for grid in shard] for shard in supervisor.shards] == \
+           [['SYM0USDT', 'SYM2USDT', 'SYM4USDT'], ['SYM1USDT', 'SYM3USDT']]
+
+    assert Supervisor(config.copy(grids=grids(2)), processes=8).shard_count == 2  # 不會比網格數量多
+    supervisor = Supervisor(config.copy(symbol='BTCUSDT', grids=[]), processes=4)
+    assert supervisor.shards == [[{'symbol': 'BTCUSDT'}]]
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('trader.supervisor.time.monotonic', lambda: now[0])
+    supervisor = Supervisor(config.copy(grids=grids(2)), processes=2, restart_delay=5, max_restart_delay=15)
+    supervisor.now = now
+    supervisor.started = []
+
+    def start_shard(shard_index):
+        supervisor.started.append(shard_index)
+        supervisor.processes[shard_index] = FakeProcess()
+        supervisor.start_times[shard_index] = now[0]
+
+    monkeypatch.setattr(supervisor, 'start_shard', start_shard)
+    for shard_index in range(supervisor.shard_count):
+        supervisor.start_shard(shard_index)
+    supervisor.started.clear()
+    return supervisor
+
+
+def test_crashed_shard_is_restarted_with_backoff(supervisor):
+    now = supervisor.now
+    delays = []
+    for _ in range(3):
+        supervisor.processes[1] = FakeProcess(alive=False, exitcode=1)  # 很快就掛掉
+        supervisor.check_shards()
+        delays.append(supervisor.restart_times[1] - now[0])
+        now[0] += delays[-1] - 0.5
+        supervisor.check_shards()
+        assert supervisor.started == []  # 還沒到重啟時間
+        now[0] += 0.5
+        supervisor.check_shards()
+        assert supervisor.started == [1]
+        supervisor.started.clear()
+    assert delays == [10, 15, 15]  # 每次加倍, 不超過max_restart_delay
+
+
+def test_long_running_shard_resets_backoff(supervisor):
+    supervisor.restart_delays[0] = 15
+    supervisor.now[0] += 61
+    supervisor.processes[0] = FakeProcess(alive=False, exitcode=1)
+    supervisor.check_shards()
+    assert supervisor.restart_times[0] - supervisor.now[0] == 5
+    assert supervisor.restart_times[1] == 0  # 其他process不受影響
@@ -0,0 +1,123 @@
+import pytest
+from gateway import SymbolFilterCache, RateLimiter
+from gateway.retry_policy import GatewayError
+from gateway.symbol_filters import parse_symbol_filters
+import utils.utility
+
+
+def symbol_info(symbol, tick_size='0.01', step_size='0.001', status='TRADING'):
+    return {'symbol': symbol, 'status': status, 'filters': [
+        {'filterType': 'PRICE_FILTER', 'tickSize': tick_size},
+        {'filterType': 'LOT_SIZE', 'stepSize': step_size},
+        {'filterType': 'NOTIONAL', 'minNotional': '5.00000000'},
+    ]}
+
+
+class FakeHttp(object):
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.calls = []
+        self.fail = False
+        self.rate_limiter = RateLimiter()
+
+    def get_exchange_info(self, symbol=None):
+        self.calls.append(symbol)
+        if self.fail:
+            return GatewayError('/api/v3/exchangeInfo', status=503)
+        return {'rateLimits': [{'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1,
+                                'limit': 6000}],
+                'symbols': [item for item in self.symbols if symbol is None or item['symbol'] == symbol]}
+
+
+def test_parse_symbol_filters():
+    assert parse_symbol_filters(symbol_info('BTCUSDT')) == {
+        'symbol': 'BTCUSDT', 'min_price': 0.01, 'tick_size': '0.01', 'min_qty': 0.001, 'step_size': '0.001',
+        'min_notional': 5.0}
+
+    # 合約的欄位是notional
+    item = {'symbol': 'BTCUSDT', 'filters': [{'filterType': 'MIN_NOTIONAL', 'notional': '100'}]}
+    assert parse_symbol_filters(item) == {'symbol': 'BTCUSDT', 'min_notional': 100.0}
+
+
+def test_get_downloads_once_until_expired(monkeypatch):
+    http_client = FakeHttp([symbol_info('BTCUSDT')])
+    cache = SymbolFilterCache(http_client, ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr('gateway.symbol_filters.time.time', lambda: now[0])
+
+    assert cache.get('BTCUSDT')['min_price'] == 0.01
+    assert cache.get('BTCUSDT')['min_qty'] == 0.001
+    assert http_client.calls == ['BTCUSDT']  # 只有一個交易對時只下載那一個
+
+    now[0] += 61
+    cache.get('BTCUSDT')
+    assert http_client.calls == ['BTCUSDT', 'BTCUSDT']
+
+
+def test_multiple_symbols_share_one_download():
+    http_client = FakeHttp([symbol_info('BTCUSDT'), symbol_info('ETHUSDT'), symbol_info('OLDUSDT', status='BREAK')])
+    cache = SymbolFilterCache(http_client)
+    cache.get('BTCUSDT')
+    cache.invalidate('BTCUSDT')
+    assert cache.get('ETHUSDT')  # 第二個交易對整包下載
+    assert cache.get('BTCUSDT')
+    assert cache.get('OLDUSDT') is None  # 不在交易中的交易對不快取
+    assert http_client.calls == ['BTCUSDT', None, None]
+
+
+def test_refresh_configures_rate_limiter_and_keeps_old_data_on_failure():
+    http_client = FakeHttp([symbol_info('BTCUSDT')])
+    cache = SymbolFilterCache(http_client)
+    assert cache.refresh()
+    assert http_client.rate_limiter.buckets[('REQUEST_WEIGHT', 'MINUTE', 1)].capacity == 6000
+
+    http_client.fail = True
+    cache.invalidate('BTCUSDT')
+    assert not cache.refresh()
+    assert cache.get('BTCUSDT')['symbol'] == 'BTCUSDT'  # 請求失敗時繼續用舊的資料
+
+
+def test_check_rejection():
+    http_client = FakeHttp([symbol_info('BTCUSDT')])
+    cache = SymbolFilterCache(http_client)
+    cache.get('BTCUSDT')
+
+    assert not cache.check_rejection('BTCUSDT', {'code': -2010, 'msg': 'Account has insufficient balance.'})
+    assert not cache.check_rejection('BTCUSDT', None)
+    assert not cache.is_expired('BTCUSDT')
+
+    assert cache.check_rejection('BTCUSDT', GatewayError('/api/v3/order', status=400, code=-1013))
+    assert cache.is_expired('BTCUSDT')
+    cache.get('BTCUSDT')
+    assert len(http_client.calls) == 2
+
+
+def test_get_precision_reuses_engine_until_tick_size_changes():
+    http_client = FakeHttp([symbol_info('BTCUSDT')])
+    cache = SymbolFilterCache(http_client)
+    precision = cache.get_precision('BTCUSDT')
+    assert precision.tick_size == '0.01' and precision.step_size == '0.001'
+    assert cache.get_precision('BTCUSDT') is precision
+
+    http_client.symbols = [symbol_info('BTCUSDT', tick_size='0.10')]
+    cache.refresh()
+    assert cache.get_precision('BTCUSDT').tick_size == '0.10'
+
+
+def test_snapshot_survives_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.utility, 'TEMP_DIR', tmp_path)
+    http_client = FakeHttp([symbol_info('BTCUSDT')])
+    SymbolFilterCache(http_client, snapshot_name='symbols.json').get('BTCUSDT')
+    assert (tmp_path / 'symbols.json').exists()
+
+    http_client.fail = True
+    cache = SymbolFilterCache(http_client, snapshot_name='symbols.json')
+    assert cache.get('BTCUSDT')['tick_size'] == '0.01'
+    assert http_client.calls == ['BTCUSDT']  # 從快照讀取, 沒有重新下載
+
+
+@pytest.mark.parametrize('code', [-1013, -4014, -4164])
+def test_filter_error_codes(code):
+    cache = SymbolFilterCache(FakeHttp([]))
+    assert cache.check_rejection('BTCUSDT', {'code': code})
@@ -0,0 +1,225 @@
+import time
+from bisect import bisect_left, bisect_right, insort
+from gateway import OrderSide
+from trader.ladder import build_ladder
+from utils import config as default_config, Precision
+from utils.kline_store import klines_to_columns
+from utils.precision import to_gap_units
+
+try:
+    import numpy as np  # pip install numpy
+except ImportError:
+    np = None
+
+SCAN_CHUNK = 256  # 沒有事件時一次往後掃描幾根K線, 每次沒找到就加倍
+
+
+class BacktestResult(object):
+
+    def __init__(self, open_time, close, cash, inventory, fees, buy_fills, sell_fills, buy_orders, sell_orders,
+                 cycles, elapsed):
+        """
+        :param cash: 每根K線收盤時的現金(計價資產)
+        :param inventory: 每根K線收盤時的持倉(基礎資產), 可以是負數(表示先賣後買)
+        """
+        self.open_time = open_time
+        self.close = close
+        self.cash = cash
+        self.inventory = inventory
+        self.equity = cash + inventory * close  # 以收盤價計算的權益曲線
+        self.fees = fees
+        self.buy_fills = buy_fills
+        self.sell_fills = sell_fills
+        self.buy_orders = buy_orders  # 回測結束時還掛著的買單價格
+        self.sell_orders = sell_orders
+        self.cycles = cycles  # 實際跑過網格邏輯的K線數量, 其他的K線沒有碰到任何掛單, 直接跳過
+        self.elapsed = elapsed
+
+    @property
+    def pnl(self):
+        return float(self.equity[-1]) if len(self.equity) else 0.0
+
+    @property
+    def max_drawdown(self):
+        if not len(self.equity):
+            return 0.0
+        return float(np.max(np.maximum.accumulate(self.equity) - self.equity))
+
+    def summary(self):
+        return {'bars': len(self.close), 'cycles': self.cycles, 'pnl': self.pnl, 'fees': self.fees,
+                'buy_fills': self.buy_fills, 'sell_fills': self.sell_fills,
+                'final_inventory': float(self.inventory[-1]) if len(self.inventory) else 0.0,
+                'max_inventory': float(self.inventory.max()) if len(self.inventory) else 0.0,
+                'min_inventory': float(self.inventory.min()) if len(self.inventory) else 0.0,
+                'max_drawdown': self.max_drawdown, 'open_buys': len(self.buy_orders),
+                'open_sells': len(self.sell_orders), 'elapsed': self.elapsed}
+
+    def __repr__(self):
+        return f"BacktestResult({self.summary()})"
+
+
+class GridBacktester(object):
+
+    def __init__(self, config=None, tick_size='0.01', step_size='0.001', fee_rate=0.0, min_notional=0.0):
+        """
+        用歷史K線離線回測現貨網格, 成交/補單/撤單的規則跟BinanceSpotTrader.start()一樣:
+        - 每根K線收盤時跑一輪網格, 買賣價都用收盤價
+        - 買單價格 >= 最低價視為成交, 賣單價格 <= 最高價視為成交, 成交價就是掛單價
+        - 成交後在成交價上下各補一張單, 不會穿過盤口; 一邊沒有單時依盤口掛單, 超過max_orders時每輪撤銷最遠的一張
+        沒有碰到任何掛單的K線整段跳過(用numpy往後掃描), 一年的1分鐘K線只有成交的那幾根需要逐根處理.
+        :param config: 網格設定(gap_percent, quantity, max_orders, ladder_levels, ladder_mode)
+        :param tick_size: 價格最小跳動單位, 交易所的字串
+        :param step_size: 數量最小單位
+        :param fee_rate: 手續費率, 以成交金額計算
+        :param min_notional: 最小名義價值, 只在ladder_levels大於1時過濾
+        """
+        if np is None:
+            raise ImportError("backtesting needs the numpy package: pip install numpy")
+        self.config = config if config is not None else default_config
+        self.precision = Precision(tick_size, step_size)
+        self.fee_rate = float(fee_rate)
+        self.min_notional = min_notional
+        self.gap_units = to_gap_units(self.config.gap_percent)
+        self.quantity = self.precision.steps_to_qty(self.precision.qty_to_steps(self.config.quantity))
+        self.max_orders = int(self.config.max_orders)
+
+    def initial_orders(self, order_side: OrderSide, price_ticks):
+        """
+        一邊沒有掛單時要掛的價格(tick), 跟trader一樣ladder_levels大於1時一次掛多格.
+        """
+        if int(self.config.ladder_levels) > 1:
+            levels = min(int(self.config.ladder_levels), self.max_orders)
+            ladder = build_ladder(self.precision, self.precision.ticks_to_price(price_ticks), self.config.gap_percent,
+                                  levels, self.quantity, order_side, mode=self.config.ladder_mode,
+                                  min_notional=self.min_notional)
+            return ladder.price_ticks.tolist()
+        levels = 1 if order_side == OrderSide.SELL else -1
+        return [self.precision.shift_ticks(price_ticks, self.gap_units, levels)]
+
+    def run(self, klines):
+        """
+        :param klines: get_kline的輸出, 或者欄位陣列(KlineStore.read, KlineDownloader.download的結果)
+        :return: BacktestResult
+        """
+        start_time = time.perf_counter()
+        arrays = klines if isinstance(klines, dict) else klines_to_columns(klines)
+        precision = self.precision
+        highs = precision.prices_to_ticks(arrays['high'])
+        lows = precision.prices_to_ticks(arrays['low'])
+        closes = precision.prices_to_ticks(arrays['close'])
+        bar_count = len(closes)
+
+        buy_orders = []  # 由低到高排序的買單價格(tick)
+        sell_orders = []  # 由低到高排序的賣單價格(tick)
+        cash = 0.0
+        inventory = 0.0
+        fees = 0.0
+        buy_fills = 0
+        sell_fills = 0
+        cycles = 0
+        event_bars = []  # 持倉/現金有變化的K線
+        event_cash = []
+        event_inventory = []
+        gap_units = self.gap_units
+        quantity = self.quantity
+        tick = precision.tick
+        fee_rate = self.fee_rate
+        max_orders = self.max_orders
+
+        index = 0
+        while index < bar_count:
+            if buy_orders and sell_orders and len(buy_orders) <= max_orders and len(sell_orders) <= max_orders:
+                index = self.next_event(highs, lows, index, buy_orders[-1], sell_orders[0])
+                if index >= bar_count:
+                    break
+
+            cycles += 1
+            low, high, price = int(lows[index]), int(highs[index]), int(closes[index])
+            filled_buys = buy_orders[bisect_left(buy_orders, low):]  # 價格 >= 最低價的買單都成交
+            filled_sells = sell_orders[:bisect_right(sell_orders, high)]  # 價格 <= 最高價的賣單都成交
+            new_orders = []
+
+            for fill in reversed(filled_buys):  # 最高價到最低價, 跟trader一樣
+                sell_price = precision.shift_ticks(fill, gap_units, 1)
+                if 0 < sell_price < price:
+                    sell_price = price
+                new_orders.append((OrderSide.SELL, sell_price))
+                buy_price = precision.shift_ticks(fill, gap_units, -1)
+                if buy_price > price > 0:
+                    buy_price = price
+                new_orders.append((OrderSide.BUY, buy_price))
+
+            for fill in reversed(filled_sells):
+                buy_price = precision.shift_ticks(fill, gap_units, -1)
+                if buy_price > price > 0:
+                    buy_price = price
+                new_orders.append((OrderSide.BUY, buy_price))
+                sell_price = precision.shift_ticks(fill, gap_units, 1)
+                if 0 < sell_price < price:
+                    sell_price = price
+                new_orders.append((OrderSide.SELL, sell_price))
+
+            if filled_buys or filled_sells:
+                del buy_orders[len(buy_orders) - len(filled_buys):]
+                del sell_orders[:len(filled_sells)]
+                for fill in filled_buys:
+                    value = fill * tick * quantity
+                    cash -= value
+                    fees += value * fee_rate
+                    inventory += quantity
+                for fill in filled_sells:
+                    value = fill * tick * quantity
+                    cash += value
+                    fees += value * fee_rate
+                    inventory -= quantity
+                buy_fills += len(filled_buys)
+                sell_fills += len(filled_sells)
+
+            for order_side, order_price in new_orders:
+                insort(buy_orders if order_side == OrderSide.BUY else sell_orders, order_price)
+
+            if not buy_orders:
+                if price > 0:
+                    for order_price in self.initial_orders(OrderSide.BUY, price):
+                        insort(buy_orders, order_price)
+            elif len(buy_orders) > max_orders:
+                del buy_orders[0]  # 撤銷最低價的買單
+
+            if not sell_orders:
+                if price > 0:
+                    for order_price in self.initial_orders(OrderSide.SELL, price):
+                        insort(sell_orders, order_price)
+            elif len(sell_orders) > max_orders:
+                del sell_orders[-1]  # 撤銷最高價的賣單
+
+            if filled_buys or filled_sells:
+                event_bars.append(index)
+                event_cash.append(cash - fees)  # 手續費從現金扣除
+                event_inventory.append(inventory)
+            index += 1
+
+        # 把事件展開成每根K線的現金/持倉
+        bar_events = np.searchsorted(np.asarray(event_bars, dtype=np.int64), np.arange(bar_count), side='right') - 1
+        cash_path = np.where(bar_events >= 0, np.asarray(event_cash + [0.0])[bar_events], 0.0)
+        inventory_path = np.where(bar_events >= 0, np.asarray(event_inventory + [0.0])[bar_events], 0.0)
+        return BacktestResult(arrays['open_time'], arrays['close'], cash_path, inventory_path, fees, buy_fills,
+                              sell_fills, [precision.ticks_to_price(order) for order in buy_orders],
+                              [precision.ticks_to_price(order) for order in sell_orders], cycles,
+                              time.perf_counter() - start_time)
+
+    @staticmethod
+    def next_event(highs, lows, index, highest_buy, lowest_sell):
+        """
+        從index開始找第一根碰到掛單的K線(最低價 <= 最高的買單, 或最高價 >= 最低的賣單).
+        :return: K線位置, 找不到時回傳K線數量
+        """
+        bar_count = len(highs)
+        chunk = SCAN_CHUNK
+        while index < bar_count:
+            end = min(index + chunk, bar_count)
+            hits = np.flatnonzero((lows[index:end] <= highest_buy) | (highs[index:end] >= lowest_sell))
+            if len(hits):
+                return index + int(hits[0])
+            index = end
+            chunk *= 2
+        return bar_count
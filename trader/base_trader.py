@@ -0,0 +1,235 @@
+import logging
+from threading import Lock
+from gateway import OrderStatus, OrderType, OrderSide, SymbolFilterCache, BinanceUserStream, BinanceBookTickerStream
+from trader.ladder import build_ladder
+from trader.order_book import OrderBook
+from trader.order_executor import OrderExecutor
+from utils import config as default_config
+from utils.metrics import RequestCounter
+
+
+class BaseGridTrader(object):
+    """
+    現貨/合約網格共用的部分: 交易規則快取, 下單/撤單, 帳戶資料推送, bookTicker推送, 訂單狀態檢查和喚醒排程器.
+    子類別只需要指定gateway和推送的host, 以及交易所不同的下單方式(例如合約的批次下單)和start()裡的網格邏輯.
+    """
+    http_class = None  # 沒有傳入http_client時用設定建立的gateway
+    stream_host = None  # 帳戶資料推送和bookTicker推送的websocket host
+    snapshot_name = None  # 交易規則快取的檔名
+
+    def __init__(self, http_client=None, config=None, symbol_cache=None, executor=None):
+        """
+        :param http_client: 多個網格可以共用同一個gateway(連線池和頻率限制), None表示用設定建立
+        :param config: 這個網格的設定, None表示用utils.config
+        :param symbol_cache: 多個網格共用的交易規則快取, None表示自己建立
+        :param executor: 多個網格共用的OrderExecutor, None表示自己建立
+        """
+        self.config = config if config is not None else default_config
+        self.logger = logging.getLogger(f"binance.trader.{self.config.symbol}")  # 每個交易對可以設定自己的日誌等級
+        if http_client is None:
+            http_client = self.http_class(api_key=self.config.api_key, secret=self.config.api_secret,
+                                          proxy_host=self.config.proxy_host, proxy_port=self.config.proxy_port,
+                                          pool_connections=self.config.pool_connections,
+                                          pool_maxsize=self.config.pool_maxsize)
+        self.http_client = http_client  # 同步的gateway, 或者用SyncHttpClient包起來的async gateway
+
+        self.buy_orders = OrderBook()  # 買單
+        self.sell_orders = OrderBook()  # 賣單
+        self.symbols_dict = {}  # 幣種
+        if symbol_cache is None:
+            symbol_cache = SymbolFilterCache(self.http_client, ttl=self.config.exchange_info_ttl,
+                                             snapshot_name=self.snapshot_name)
+        self.symbol_cache = symbol_cache  # 交易規則快取
+
+        self.user_stream = None  # 帳戶資料推送
+        self.market_stream = None  # 最優買賣價推送
+        self.order_updates = {}  # clientOrderId -> 最新的訂單狀態
+        self.order_updates_lock = Lock()
+        self.stream_backfill = True  # (重新)連線後要用REST補查一次
+        self.wakeup_callback = None  # callback(reason), 有成交推送或價格穿過掛單價時喚醒排程器
+        self.trigger_levels = (None, None)  # (最高的買單價, 最低的賣單價), 價格穿過時可能已經成交
+        self.level_triggered = False  # 這一輪已經因為價格穿過喚醒過了
+        self.cycle_request_count = 0  # 上一輪這個網格發出的http請求數量
+        self.journal = None  # OrderJournal, 每輪結束把掛單的變化寫進去, 重啟時接回
+        if executor is None:
+            executor = OrderExecutor(max_workers=self.config.order_workers)
+        self.executor = executor  # 同時送出互相獨立的訂單請求
+
+    def get_exchange_info(self):
+        symbol_data = self.symbol_cache.get(self.config.symbol)
+        if symbol_data:
+            self.symbols_dict[self.config.symbol] = symbol_data
+
+    def place_order(self, order_side: OrderSide, quantity, price):
+        """
+        下限價單, 如果因為交易規則被拒絕, 讓交易規則的快取過期.
+        """
+        order = self.http_client.place_order(symbol=self.config.symbol, order_side=order_side, order_type=OrderType.LIMIT,
+                                             quantity=quantity, price=price)
+        if not order and self.symbol_cache.check_rejection(self.config.symbol, order):
+            self.logger.warning("order was rejected by symbol filters, refresh exchange info: %s", order)
+        return order
+
+    def place_orders(self, order_requests: list):
+        """
+        同時下多張限價單.
+        :param order_requests: [(order_side, quantity, price)]
+        :return: 跟order_requests順序一樣的訂單列表, 失敗的位置是None
+        """
+        if len(order_requests) <= 1:
+            return [self.place_order(order_side, quantity, price) for order_side, quantity, price in order_requests]
+
+        return self.executor.run_all([(self.place_order, order_request, None) for order_request in order_requests])
+
+    def place_ladder(self, order_side: OrderSide, center, precision, min_notional=0.0):
+        """
+        一邊沒有掛單時一次掛滿ladder_levels格(不超過max_orders), 每一格的價格/數量由build_ladder一次算好.
+        :return: 下單成功的訂單
+        """
+        levels = min(int(self.config.ladder_levels), int(self.config.max_orders))
+        ladder = build_ladder(precision, center, self.config.gap_percent, levels, self.config.quantity, order_side,
+                              mode=self.config.ladder_mode, min_notional=min_notional)
+        return [order for order in self.place_orders(ladder.order_requests()) if order]
+
+    def cancel_orders(self, orders: list):
+        """
+        同時撤銷多張訂單.
+        :return: 撤單成功的訂單
+        """
+        results = self.executor.run_all([(self.http_client.cancel_order, (order.symbol or self.config.symbol,
+                                                                          order.client_order_id),
+                                          order.client_order_id) for order in orders])
+        return [order for order, result in zip(orders, results) if result]
+
+    def start_user_stream(self):
+        """
+        開啟帳戶資料推送, 訂單狀態改由websocket推送, 不用每輪對每張單呼叫get_order.
+        """
+        self.user_stream = BinanceUserStream(self.http_client, self.stream_host, on_order=self.on_order_update,
+                                             on_connected=self.on_user_stream_connected)
+        self.user_stream.start()
+
+    def on_user_stream_connected(self):
+        self.stream_backfill = True  # 斷線期間可能漏掉訂單更新, 下一輪用REST補查
+
+    def on_order_update(self, order):
+        self.merge_order_update(order)
+        if order.status in (OrderStatus.FILLED, OrderStatus.CANCELED):
+            self.notify('order')  # 有成交或取消就馬上跑下一輪
+
+    def merge_order_update(self, order):
+        """
+        推送跟REST查詢的結果可能先後順序不同, 只保留updateTime最新的狀態.
+        """
+        client_order_id = order.client_order_id
+        with self.order_updates_lock:
+            current = self.order_updates.get(client_order_id)
+            if current is None or current.update_time <= order.update_time:
+                self.order_updates[client_order_id] = order
+
+    def use_user_stream(self):
+        """
+        這一輪能不能直接用推送的訂單狀態, 剛(重新)連線時先用REST查一次, 補上斷線期間的變化.
+        """
+        if not self.user_stream or not self.user_stream.connected:
+            return False
+
+        if self.stream_backfill:
+            self.stream_backfill = False
+            return False
+        return True
+
+    def get_open_orders_snapshot(self):
+        """
+        一次取得交易對所有掛單, 用來跟本地的buy_orders/sell_orders比對.
+        :return: clientOrderId -> order, 請求失敗時回傳None, 改用逐筆查詢
+        """
+        open_orders = self.http_client.get_open_orders(self.config.symbol)
+        if not isinstance(open_orders, list):
+            return None
+        return {order.client_order_id: order for order in open_orders}
+
+    def get_order_status(self, order, use_stream=False, open_orders=None):
+        client_order_id = order.client_order_id
+        if use_stream:
+            # 沒有收到推送代表訂單狀態沒有變化
+            with self.order_updates_lock:
+                return self.order_updates.get(client_order_id, order)
+
+        if open_orders is not None and client_order_id in open_orders:
+            return open_orders[client_order_id]  # 還掛著的訂單, 狀態是NEW或PARTIALLY_FILLED
+
+        # 逐筆查詢模式, 或者訂單已經不在掛單裡, 要查詢才知道是成交還是被取消
+        check_order = self.http_client.get_order(order.symbol or self.config.symbol, client_order_id=client_order_id)
+        if check_order and self.user_stream:
+            self.merge_order_update(check_order)
+        return check_order
+
+    def check_orders(self, orders: list, use_stream=False, open_orders=None):
+        """
+        同時檢查多張訂單的狀態, 同一張訂單的查詢跟撤單照順序執行.
+        :return: clientOrderId -> check_order
+        """
+        tasks = [(self.get_order_status, (order, use_stream, open_orders), order.client_order_id)
+                 for order in orders]
+        results = self.executor.run_all(tasks)
+        return {order.client_order_id: check_order for order, check_order in zip(orders, results)}
+
+    def prune_order_updates(self):
+        with self.order_updates_lock:
+            self.order_updates = {k: v for k, v in self.order_updates.items()
+                                  if k in self.buy_orders or k in self.sell_orders}
+
+    def start_market_stream(self):
+        """
+        開啟bookTicker推送, get_bid_ask_price直接讀記憶體裡的最新報價, 推送過期時才用REST查詢.
+        """
+        self.market_stream = BinanceBookTickerStream(self.stream_host, [self.config.symbol],
+                                                     stale_seconds=self.config.market_stream_stale,
+                                                     on_ticker=self.on_ticker)
+        self.market_stream.start()
+
+    def notify(self, reason):
+        if self.wakeup_callback:
+            self.wakeup_callback(reason)
+
+    def on_ticker(self, symbol, bid_price, ask_price):
+        """
+        賣一價跌到買單價或買一價漲到賣單價時, 掛單很可能已經成交, 不用等下一次計時就喚醒.
+        """
+        buy_level, sell_level = self.trigger_levels
+        if self.level_triggered:
+            return
+        if (buy_level and ask_price <= buy_level) or (sell_level and bid_price >= sell_level):
+            self.level_triggered = True
+            self.notify('ticker')
+
+    def update_trigger_levels(self):
+        self.trigger_levels = (self.buy_orders.highest_price(), self.sell_orders.lowest_price())
+        self.level_triggered = False
+
+    def get_bid_ask_price(self):  # 取得買進價/賣出價
+        if self.market_stream:
+            bid_ask = self.market_stream.get_bid_ask(self.config.symbol)
+            if bid_ask:
+                return bid_ask
+
+        ticker = self.http_client.get_ticker(self.config.symbol)
+
+        if ticker:
+            return float(ticker.get('bidPrice', 'Not Found')), float(ticker.get('askPrice', 'Not Found'))
+        else:
+            return 0, 0
+
+    def start(self):
+        """
+        跑一輪網格. 共用gateway時gateway的request_count是所有網格加總, 這裡只算這一輪經過自己發出的請求.
+        """
+        with RequestCounter() as counter:
+            self.grid_cycle()
+        self.cycle_request_count = counter.count
+        self.logger.info("cycle done", extra={'requests': self.cycle_request_count, 'buy_orders': len(self.buy_orders),
+                                              'sell_orders': len(self.sell_orders)})
+
+    def grid_cycle(self):  # 網格交易核心邏輯, 由子類別實作
+        raise NotImplementedError
@@ -1,246 +1,259 @@
-import logging
-from datetime import datetime
-from gateway import BinanceFutureHttp, OrderStatus, OrderType, OrderSide
-from utils import config
-from utils import round_to
-
-
-class BinanceFutureTrader(object):
-
-    def __init__(self):
+from gateway import BinanceFutureHttp, Order, OrderStatus, OrderType, OrderSide, FUTURE_STREAM_HOST
+from gateway.binance_future import BATCH_ORDER_LIMIT, BATCH_CANCEL_LIMIT
+from trader.base_trader import BaseGridTrader
+from utils.metrics import PhaseTimer
+from utils.precision import to_gap_units
+
+
+class BinanceFutureTrader(BaseGridTrader):
+    """
+    the grid trading in Future will endure a lot of risk， use it before you understand the risk and grid strategy.
+    網格交易在合約上有很大風險，注意風控
+    """
+    http_class = BinanceFutureHttp
+    stream_host = FUTURE_STREAM_HOST
+    snapshot_name = 'binance_future_symbols.json'
+
+    def place_orders(self, order_requests: list):
         """
-        the grid trading in Future will endure a lot of risk， use it before you understand the risk and grid strategy.
-        網格交易在合約上有很大風險，注意風控
+        一次下多張限價單, 超過一張時用batchOrders, 每BATCH_ORDER_LIMIT張一組同時送出.
+        :param order_requests: [(order_side, quantity, price)]
+        :return: 跟order_requests順序一樣的訂單列表, 失敗的位置是None
         """
-        self.http_client = BinanceFutureHttp(api_key=config.api_key, secret=config.api_secret,
-                                             proxy_host=config.proxy_host, proxy_port=config.proxy_port)
-
-        self.buy_orders = []  # 買單
-        self.sell_orders = []  # 賣單
-        self.symbols_dict = {}  # 幣種
-
-    def get_exchange_info(self):
-        data = self.http_client.exchange_info()
-        if isinstance(data, dict):
-            items = data.get('symbols', [])
-            for item in items:
-                if item.get('status') == 'TRADING':
-                    symbol = item['symbol']
-                    symbol_data = {'symbol': symbol}
-                    for filters in item['filters']:
-                        if filters['filterType'] == 'PRICE_FILTER':
-                            symbol_data['min_price'] = float(filters['tickSize'])
-                        elif filters['filterType'] == 'LOT_SIZE':
-                            symbol_data['min_qty'] = float(filters['stepSize'])
-                        elif filters['filterType'] == 'MIN_NOTIONAL':
-                            symbol_data['min_notional'] = float(filters['minNotional'])
-
-                    self.symbols_dict[symbol] = symbol_data
-
-        # print(len(self.symbols),self.symbols)  # 129 個交易對
-
-    def get_bid_ask_price(self):  # 取得買進價/賣出價
-        ticker = self.http_client.get_ticker(config.symbol)
-
-        if ticker:
-            return float(ticker.get('bidPrice', 'Not Found')), float(ticker.get('askPrice', 'Not Found'))
-        else:
-            return 0, 0
-
-    def start(self):  # 網格交易核心邏輯
+        if len(order_requests) <= 1:
+            return super().place_orders(order_requests)
+
+        batch = [{'symbol': self.config.symbol, 'order_side': order_side, 'order_type': OrderType.LIMIT,
+                  'quantity': quantity, 'price': price, 'client_order_id': self.http_client.get_client_order_id()}
+                 for order_side, quantity, price in order_requests]
+        results = {}
+        chunks = [batch[i:i + BATCH_ORDER_LIMIT] for i in range(0, len(batch), BATCH_ORDER_LIMIT)]
+        for chunk_results in self.executor.run_all([(self.http_client.place_batch_orders, (chunk,), None)
+                                                    for chunk in chunks]):
+            results.update(chunk_results or {})  # 丟出例外的那一組是None, 當作那幾張下單失敗
+
+        orders = []
+        for item in batch:
+            result = results.get(item['client_order_id'])
+            if isinstance(result, Order):
+                orders.append(result)
+            else:
+                self.logger.warning("batch order failed: %s, price: %s", result, item['price'])
+                self.symbol_cache.check_rejection(self.config.symbol, result)
+                orders.append(None)
+        return orders
+
+    def cancel_orders(self, orders: list):
+        """
+        一次撤銷多張訂單, 超過一張時用批次撤單, 每BATCH_CANCEL_LIMIT張一組同時送出.
+        :return: 撤單成功的訂單
+        """
+        if len(orders) <= 1:
+            return super().cancel_orders(orders)
+
+        client_order_ids = [order.client_order_id for order in orders]
+        chunks = [client_order_ids[i:i + BATCH_CANCEL_LIMIT] for i in range(0, len(client_order_ids), BATCH_CANCEL_LIMIT)]
+        results = {}
+        for chunk_results in self.executor.run_all([(self.http_client.cancel_batch_orders, (self.config.symbol, chunk), None)
+                                                    for chunk in chunks]):
+            results.update(chunk_results or {})
+        canceled_orders = []
+        for order in orders:
+            result = results.get(order.client_order_id)
+            if isinstance(result, Order):
+                canceled_orders.append(order)
+            else:
+                self.logger.warning("batch cancel failed: %s, order: %s", result, order.client_order_id)
+        return canceled_orders
+
+    def grid_cycle(self):  # 網格交易核心邏輯
+        timer = PhaseTimer(self.config.symbol)  # 各階段耗時, 給metrics用
         self.get_exchange_info()  # 取得交易所資訊
-        symbol_data = self.symbols_dict.get(config.symbol, None)
+        symbol_data = self.symbols_dict.get(self.config.symbol, None)
         if symbol_data is None:
             return None
 
         min_price = symbol_data.get('min_price', 0)
         min_qty = symbol_data.get('min_qty', 0)
+        min_notional = symbol_data.get('min_notional', 0)
 
         if min_price <= 0 and min_qty <= 0:
             return None
 
         bid_price, ask_price = self.get_bid_ask_price()
-        print(f"bid_price: {bid_price}, ask_price: {ask_price}, time: {datetime.now()}")
+        self.logger.debug("bid/ask price", extra={'bid': bid_price, 'ask': ask_price})
 
-        quantity = round_to(float(config.quantity), float(min_qty))
+        precision = self.symbol_cache.get_precision(self.config.symbol)  # 價格/數量換算成整數tick/step
+        if precision is None:
+            return None
+        quantity = precision.format_qty(precision.qty_to_steps(self.config.quantity))  # 處理小數位數
+        gap_units = to_gap_units(self.config.gap_percent)
+        bid_ticks = precision.price_to_ticks(bid_price)
+        ask_ticks = precision.price_to_ticks(ask_price)
 
-        self.buy_orders.sort(key=lambda x: float(x['price']), reverse=True)  # 最高價到最低價
-        self.sell_orders.sort(key=lambda x: float(x['price']), reverse=True)  # 最高價到最低價
+        self.buy_orders.set_tick_size(min_price)  # 掛單簿依價格tick排序, 不用每輪重新排序
+        self.sell_orders.set_tick_size(min_price)
 
         buy_delete_orders = []  # 需要刪除的買單
         sell_delete_orders = []  # 需要刪除的賣單
+        new_orders = []  # 成交後要補的單, 最後一起批次下單: (order_side, price, 成交的訂單, 補單成功後要刪除的列表)
+        with timer.measure('status_check'):
+            use_stream = self.use_user_stream()  # 訂單狀態用推送還是REST查詢
+            open_orders = None
+            if not use_stream and self.config.reconcile_mode == 'open_orders' and (self.buy_orders or self.sell_orders):
+                open_orders = self.get_open_orders_snapshot()
+            check_orders = self.check_orders(list(self.buy_orders) + list(self.sell_orders), use_stream, open_orders)
         # 買單邏輯，檢查成交狀況
-        for buy_order in self.buy_orders:
+        for buy_order in self.buy_orders.descending():  # 最高價到最低價
 
-            check_order = self.http_client.get_order(buy_order.get('symbol', config.symbol),
-                                                     client_order_id=buy_order.get('clientOrderId'))
+            check_order = check_orders.get(buy_order.client_order_id)
 
             if check_order:
-                if check_order.get('status') == OrderStatus.CANCELED.value:
+                if check_order.status == OrderStatus.CANCELED:
                     buy_delete_orders.append(buy_order)
-                    print(f"buy order was canceled: {check_order.get('status')}, time: {datetime.now()}")
-                elif check_order.get('status') == OrderStatus.FILLED.value:  # 買單成交，掛賣單
-                    print(f"buy order was filled, time: {datetime.now()}")
-                    logging.info(
-                        f"buy order was filled, price: {check_order.get('price')}, qty: {check_order.get('origQty')}, time: {datetime.now()}")
-
-                    sell_price = round_to(float(check_order.get("price")) * (1 + float(config.gap_percent)), min_price)
-
-                    if 0 < sell_price < ask_price:
-                        sell_price = round_to(ask_price, float(min_price))
-
-                    new_sell_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.SELL,
-                                                                  order_type=OrderType.LIMIT, quantity=quantity,
-                                                                  price=sell_price)
-                    if new_sell_order:
-                        print(
-                            f"buy order was filled and place the sell order: {new_sell_order}, time: {datetime.now()}")
-                        buy_delete_orders.append(buy_order)
-                        self.sell_orders.append(new_sell_order)
-
-                    buy_price = round_to(float(check_order.get("price")) * (1 - float(config.gap_percent)), min_price)
-
-                    if buy_price > bid_price > 0:
-                        buy_price = round_to(buy_price, min_price)
-
-                    new_buy_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.BUY,
-                                                                 order_type=OrderType.LIMIT, quantity=quantity,
-                                                                 price=buy_price)
-                    if new_buy_order:
-                        print(f"買單成交，下了更低價的買單: {new_buy_order}, 時間: {datetime.now()}")
-                        self.buy_orders.append(new_buy_order)
-
-                elif check_order.get('status') == OrderStatus.NEW.value:
-                    print(f"buy order status is: New , time: {datetime.now()}")
-                else:
-                    print(f"buy order status is not above options: {check_order.get('status')}, time: {datetime.now()}")
+                    self.logger.info("buy order was canceled: %s", check_order)
+                elif check_order.status == OrderStatus.FILLED:  # 買單成交，掛賣單
+                    self.logger.info("buy order was filled", extra={'side': 'BUY', 'price': check_order.price,
+                                                                    'qty': check_order.orig_qty,
+                                                                    'client_order_id': check_order.client_order_id})
 
-        # 刪掉過期或被拒絕的訂單.
-        for delete_order in buy_delete_orders:
-            self.buy_orders.remove(delete_order)
+                    sell_ticks = precision.shift_ticks(precision.price_to_ticks(check_order.price), gap_units, 1)
+
+                    if 0 < sell_ticks < ask_ticks:
+                        sell_ticks = ask_ticks
+
+                    new_orders.append((OrderSide.SELL, precision.format_price(sell_ticks), buy_order, buy_delete_orders))
+
+                    buy_ticks = precision.shift_ticks(precision.price_to_ticks(check_order.price), gap_units, -1)
+
+                    new_orders.append((OrderSide.BUY, precision.format_price(buy_ticks), None, None))
+
+                elif check_order.status == OrderStatus.NEW:
+                    self.logger.debug("buy order status is: New, %s", check_order.client_order_id)
+                else:
+                    self.logger.info("buy order status is not above options: %s", check_order)
 
         # 賣單邏輯，檢查賣單狀況
-        for sell_order in self.sell_orders:
+        for sell_order in self.sell_orders.descending():  # 最高價到最低價
 
-            check_order = self.http_client.get_order(sell_order.get('symbol', config.symbol),
-                                                     client_order_id=sell_order.get('clientOrderId'))
+            check_order = check_orders.get(sell_order.client_order_id)
             if check_order:
-                if check_order.get('status') == OrderStatus.CANCELED.value:
+                if check_order.status == OrderStatus.CANCELED:
                     sell_delete_orders.append(sell_order)
 
-                    print(f"sell order was canceled: {check_order.get('status')}, time: {datetime.now()}")
-                elif check_order.get('status') == OrderStatus.FILLED.value:
-                    logging.info(
-                        f"sell order was filled, price: {check_order.get('price')}, qty: {check_order.get('origQty')}, time: {datetime.now()}")
+                    self.logger.info("sell order was canceled: %s", check_order)
+                elif check_order.status == OrderStatus.FILLED:
+                    self.logger.info("sell order was filled", extra={'side': 'SELL', 'price': check_order.price,
+                                                                     'qty': check_order.orig_qty,
+                                                                     'client_order_id': check_order.client_order_id})
                     # 賣單成交，下買單
-                    buy_price = round_to(float(check_order.get("price")) * (1 - float(config.gap_percent)),
-                                         min_price)
-                    if buy_price > bid_price > 0:
-                        buy_price = round_to(buy_price, min_price)
-
-                    new_buy_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.BUY,
-                                                                 order_type=OrderType.LIMIT, quantity=quantity,
-                                                                 price=buy_price)
-                    if new_buy_order:
-                        print(f"sell order was filled, place buy order: {new_buy_order}, time: {datetime.now()}")
-                        sell_delete_orders.append(sell_order)
-                        self.buy_orders.append(new_buy_order)
-
-                    sell_price = round_to(float(check_order.get("price")) * (1 + float(config.gap_percent)),
-                                          min_price)
-
-                    if 0 < sell_price < ask_price:
-                        sell_price = round_to(ask_price, min_price)
-
-                    new_sell_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.SELL,
-                                                                  order_type=OrderType.LIMIT, quantity=quantity,
-                                                                  price=sell_price)
-                    if new_sell_order:
-                        print(f"賣單成交，下了更高價的賣單: {new_sell_order},time: {datetime.now()}")
-                        self.sell_orders.append(new_sell_order)
-
-                elif check_order.get('status') == OrderStatus.NEW.value:
-                    print(f"sell order is: New, time: {datetime.now()}")
+                    buy_ticks = precision.shift_ticks(precision.price_to_ticks(check_order.price), gap_units, -1)
+
+                    new_orders.append((OrderSide.BUY, precision.format_price(buy_ticks), sell_order, sell_delete_orders))
+
+                    sell_ticks = precision.shift_ticks(precision.price_to_ticks(check_order.price), gap_units, 1)
+
+                    if 0 < sell_ticks < ask_ticks:
+                        sell_ticks = ask_ticks
+
+                    new_orders.append((OrderSide.SELL, precision.format_price(sell_ticks), None, None))
+
+                elif check_order.status == OrderStatus.NEW:
+                    self.logger.debug("sell order status is: New, %s", check_order.client_order_id)
+                else:
+                    self.logger.info("sell order status is not in above options: %s", check_order)
+
+        # 成交後的補單, 超過一張時用batchOrders一次送出
+        with timer.measure('replace'):
+            placed_orders = self.place_orders([(order_side, quantity, price) for order_side, price, _, _ in new_orders])
+            for (order_side, price, filled_order, delete_orders), new_order in zip(new_orders, placed_orders):
+                if not new_order:
+                    continue
+
+                if order_side == OrderSide.BUY:
+                    self.logger.info("成交後下了買單: %s", new_order)
+                    self.buy_orders.add(new_order)
                 else:
-                    print(
-                        f"sell order status is not in above options: {check_order.get('status')}, 時間: {datetime.now()}")
+                    self.logger.info("成交後下了賣單: %s", new_order)
+                    self.sell_orders.add(new_order)
+
+                if filled_order is not None:
+                    delete_orders.append(filled_order)
 
         # 刪掉過期或被拒絕的訂單.
+        for delete_order in buy_delete_orders:
+            self.buy_orders.remove(delete_order)
+
         for delete_order in sell_delete_orders:
             self.sell_orders.remove(delete_order)
 
         # 沒有買單時
-        if len(self.buy_orders) <= 0:
-            if bid_price > 0:
-                price = round_to(bid_price * (1 - float(config.gap_percent)), min_price)
-
-                buy_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.BUY,
-                                                         order_type=OrderType.LIMIT, quantity=quantity, price=price)
-                print(f'沒有買單，根據盤口下買單: {buy_order}, 時間: {datetime.now()}')
+        if not self.buy_orders:
+            if bid_price > 0 and int(self.config.ladder_levels) > 1:  # 一次掛滿整邊網格
+                for order in self.place_ladder(OrderSide.BUY, bid_price, precision, min_notional):
+                    self.buy_orders.add(order)
+            elif bid_price > 0:
+                price = precision.format_price(precision.shift_ticks(bid_ticks, gap_units, -1))
+
+                buy_order = self.place_order(OrderSide.BUY, quantity, price)
+                self.logger.info("沒有買單，根據盤口下買單: %s", buy_order)
                 if buy_order:
-                    self.buy_orders.append(buy_order)
+                    self.buy_orders.add(buy_order)
         else:
-            self.buy_orders.sort(key=lambda x: float(x['price']), reverse=False)  # 最低價到最高價
-            delete_orders = []
-            for i in range(len(self.buy_orders) - 1):
-                order = self.buy_orders[i]
-                next_order = self.buy_orders[i + 1]
-
-                if float(next_order['price']) / float(order['price']) - 1 < 0.001:
-                    print(f"買單之間價差太小，撤銷訂單：{next_order}, 時間: {datetime.now()}")
-                    cancel_order = self.http_client.cancel_order(next_order.get('symbol'),
-                                                                 client_order_id=next_order.get('clientOrderId'))
-                    if cancel_order:
-                        delete_orders.append(next_order)
-
-            for order in delete_orders:
-                self.buy_orders.remove(order)
-
-            if len(self.buy_orders) > int(config.max_orders):  # 最大掛單數量
-                # 訂單數量較多時
-                self.buy_orders.sort(key=lambda x: float(x['price']), reverse=False)  # 最低價到最高價
+            with timer.measure('gap_cancel'):
+                close_orders = self.buy_orders.close_orders(0.001)
+                for close_order in close_orders:
+                    self.logger.info("買單之間價差太小，撤銷訂單：%s", close_order)
 
-                delete_order = self.buy_orders[0]
-                print(f"訂單太多了，撤銷最低價的買單：{delete_order}, 時間: {datetime.now()}")
-                order = self.http_client.cancel_order(delete_order.get('symbol'),
-                                                      client_order_id=delete_order.get('clientOrderId'))
-                if order:
-                    self.buy_orders.remove(delete_order)
+                for order in self.cancel_orders(close_orders):
+                    self.buy_orders.remove(order)
+
+            if len(self.buy_orders) > int(self.config.max_orders):  # 最大掛單數量
+                # 訂單數量較多時
+                with timer.measure('trim'):
+                    delete_order = self.buy_orders.lowest()
+                    self.logger.info("訂單太多了，撤銷最低價的買單：%s", delete_order)
+                    order = self.http_client.cancel_order(delete_order.symbol,
+                                                          client_order_id=delete_order.client_order_id)
+                    if order:
+                        self.buy_orders.remove(delete_order)
 
         # 沒有賣單的時候
-        if len(self.sell_orders) <= 0:
-            if ask_price > 0:
-                price = round_to(ask_price * (1 + float(config.gap_percent)), float(min_price))
-                sell_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.SELL,
-                                                          order_type=OrderType.LIMIT, quantity=quantity, price=price)
-                print(f'沒有賣單，根據盤口下單:{sell_order} , 時間: {datetime.now()}')
+        if not self.sell_orders:
+            if ask_price > 0 and int(self.config.ladder_levels) > 1:  # 一次掛滿整邊網格
+                for order in self.place_ladder(OrderSide.SELL, ask_price, precision, min_notional):
+                    self.sell_orders.add(order)
+            elif ask_price > 0:
+                price = precision.format_price(precision.shift_ticks(ask_ticks, gap_units, 1))
+                sell_order = self.place_order(OrderSide.SELL, quantity, price)
+                self.logger.info("沒有賣單，根據盤口下單: %s", sell_order)
                 if sell_order:
-                    self.sell_orders.append(sell_order)
+                    self.sell_orders.add(sell_order)
 
         else:
-            self.sell_orders.sort(key=lambda x: float(x['price']), reverse=False)  # 最低價到最高價
-            delete_orders = []
-            for i in range(len(self.sell_orders) - 1):
-                order = self.sell_orders[i]
-                next_order = self.sell_orders[i + 1]
-
-                if float(next_order['price']) / float(order['price']) - 1 < 0.001:
-                    print(f"賣單之間價差太小，撤銷訂單:{next_order}, 時間: {datetime.now()}")
-                    cancel_order = self.http_client.cancel_order(next_order.get('symbol'),
-                                                                 client_order_id=next_order.get('clientOrderId'))
-                    if cancel_order:
-                        delete_orders.append(next_order)
-
-            for order in delete_orders:
-                self.sell_orders.remove(order)
-
-            if len(self.sell_orders) > int(config.max_orders):  # 最大掛單數量
+            with timer.measure('gap_cancel'):
+                close_orders = self.sell_orders.close_orders(0.001)
+                for close_order in close_orders:
+                    self.logger.info("賣單之間價差太小，撤銷訂單: %s", close_order)
+
+                for order in self.cancel_orders(close_orders):
+                    self.sell_orders.remove(order)
+
+            if len(self.sell_orders) > int(self.config.max_orders):  # 最大掛單數量
                 # 訂單數量較多時
-                self.sell_orders.sort(key=lambda x: x['price'], reverse=True)  # 最高價到最低價
-
-                delete_order = self.sell_orders[0]
-                print(f"訂單太多了，撤銷最高價賣單：{delete_order}, 時間:{datetime.now()}")
-                order = self.http_client.cancel_order(delete_order.get('symbol'),
-                                                      client_order_id=delete_order.get('clientOrderId'))
-                if order:
-                    self.sell_orders.remove(delete_order)
+                with timer.measure('trim'):
+                    delete_order = self.sell_orders.highest()
+                    self.logger.info("訂單太多了，撤銷最高價賣單：%s", delete_order)
+                    order = self.http_client.cancel_order(delete_order.symbol,
+                                                          client_order_id=delete_order.client_order_id)
+                    if order:
+                        self.sell_orders.remove(delete_order)
+
+        if self.user_stream:
+            self.prune_order_updates()
+
+        self.update_trigger_levels()
+        if self.journal is not None:
+            with timer.measure('journal'):
+                self.journal.record(self.buy_orders, self.sell_orders)
+        timer.observe()
@@ -1,197 +1,186 @@
 import logging
-from datetime import datetime
-from gateway import BinanceSpotHttp, OrderStatus, OrderType, OrderSide
-from utils import config, round_to
+from gateway import BinanceSpotHttp, OrderStatus, OrderSide, SPOT_STREAM_HOST
+from trader.base_trader import BaseGridTrader
+from utils.metrics import PhaseTimer
+from utils.precision import to_gap_units
 
 
-class BinanceSpotTrader(object):
-
-    def __init__(self):
-        self.http_client = BinanceSpotHttp(api_key=config.api_key, secret=config.api_secret,
-                                           proxy_host=config.proxy_host, proxy_port=config.proxy_port)
-
-        self.buy_orders = []  # 買單
-        self.sell_orders = []  # 賣單
-        self.symbols_dict = {}  # 幣種
-
-    def get_exchange_info(self):
-        data = self.http_client.get_exchange_info()
-        if isinstance(data, dict):
-            items = data.get('symbols', [])
-            for item in items:
-                if item.get('status') == 'TRADING':
-                    symbol = item['symbol']
-                    symbol_data = {'symbol': symbol}
-                    for filters in item['filters']:
-                        if filters['filterType'] == 'PRICE_FILTER':
-                            symbol_data['min_price'] = float(filters['tickSize'])
-                        elif filters['filterType'] == 'LOT_SIZE':
-                            symbol_data['min_qty'] = float(filters['stepSize'])
-                        elif filters['filterType'] == 'MIN_NOTIONAL':
-                            symbol_data['min_notional'] = float(filters['minNotional'])
-
-                    self.symbols_dict[symbol] = symbol_data
-
-    def get_bid_ask_price(self):  # 取得買進價/賣出價
-        ticker = self.http_client.get_ticker(config.symbol)
-
-        if ticker:
-            return float(ticker.get('bidPrice', 'Not Found')), float(ticker.get('askPrice', 'Not Found'))
-        else:
-            return 0, 0
-
-    def start(self):   # 網格交易核心邏輯
+class BinanceSpotTrader(BaseGridTrader):
+    http_class = BinanceSpotHttp
+    stream_host = SPOT_STREAM_HOST
+    snapshot_name = 'binance_spot_symbols.json'
 
+    def grid_cycle(self):  # 網格交易核心邏輯
+        timer = PhaseTimer(self.config.symbol)  # 各階段耗時, 給metrics用
         self.get_exchange_info()  # 取得交易所資訊
-        symbol_data = self.symbols_dict.get(config.symbol, None)
+        symbol_data = self.symbols_dict.get(self.config.symbol, None)
         if symbol_data is None:
             return None
 
         min_price = symbol_data.get('min_price', 0)
         min_qty = symbol_data.get('min_qty', 0)
+        min_notional = symbol_data.get('min_notional', 0)
 
         if min_price <= 0 and min_qty <= 0:
             return None
 
         bid_price, ask_price = self.get_bid_ask_price()
-        print(f"bid_price: {bid_price}, ask_price: {ask_price}")
+        self.logger.debug("bid/ask price", extra={'bid': bid_price, 'ask': ask_price})
 
-        quantity = round_to(float(config.quantity), min_qty)  # 處理小數位數
+        precision = self.symbol_cache.get_precision(self.config.symbol)  # 價格/數量換算成整數tick/step
+        if precision is None:
+            return None
+        quantity = precision.format_qty(precision.qty_to_steps(self.config.quantity))  # 處理小數位數
+        gap_units = to_gap_units(self.config.gap_percent)
+        bid_ticks = precision.price_to_ticks(bid_price)
+        ask_ticks = precision.price_to_ticks(ask_price)
 
-        self.buy_orders.sort(key=lambda x: float(x['price']), reverse=True)  # 最高價到最低價
-        self.sell_orders.sort(key=lambda x: float(x['price']), reverse=True)  # 最高價到最低價
-        print(f"buy orders: {self.buy_orders}")
-        print("------------------------------")
-        print(f"sell orders: {self.sell_orders}")
+        self.buy_orders.set_tick_size(min_price)  # 掛單簿依價格tick排序, 不用每輪重新排序
+        self.sell_orders.set_tick_size(min_price)
+        if self.logger.isEnabledFor(logging.DEBUG):  # 掛單簿會一直變動, 先轉成字串再交給背景執行緒
+            self.logger.debug("buy orders: %s", repr(self.buy_orders))
+            self.logger.debug("sell orders: %s", repr(self.sell_orders))
 
         buy_delete_orders = []  # 需要刪除的買單
         sell_delete_orders = []  # 需要刪除的賣單
+        new_orders = []  # 成交後要補的單, 最後同時送出: (order_side, price, 成交的訂單, 補單成功後要刪除的列表)
+        with timer.measure('status_check'):
+            use_stream = self.use_user_stream()  # 訂單狀態用推送還是REST查詢
+            open_orders = None
+            if not use_stream and self.config.reconcile_mode == 'open_orders' and (self.buy_orders or self.sell_orders):
+                open_orders = self.get_open_orders_snapshot()
+            check_orders = self.check_orders(list(self.buy_orders) + list(self.sell_orders), use_stream, open_orders)
 
         # 買單邏輯，檢查成交狀況
-        for buy_order in self.buy_orders:
+        for buy_order in self.buy_orders.descending():  # 最高價到最低價
 
-            check_order = self.http_client.get_order(buy_order.get('symbol', config.symbol),
-                                                     client_order_id=buy_order.get('clientOrderId'))
+            check_order = check_orders.get(buy_order.client_order_id)
 
             if check_order:
-                if check_order.get('status') == OrderStatus.CANCELED.value:
+                if check_order.status == OrderStatus.CANCELED:
                     buy_delete_orders.append(buy_order)
-                    print(f"buy order status was canceled: {check_order.get('status')}")
-                elif check_order.get('status') == OrderStatus.FILLED.value:  # 買單成交，掛賣單
-                    logging.info(
-                        f"買單成交時間: {datetime.now()}, 價格: {check_order.get('price')}, 數量: {check_order.get('origQty')}")
-
-                    sell_price = round_to(float(check_order.get("price")) * (1 + float(config.gap_percent)), min_price)
-
-                    if 0 < sell_price < ask_price:
-                        sell_price = round_to(ask_price, min_price)
-
-                    new_sell_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.SELL,
-                                                                  order_type=OrderType.LIMIT, quantity=quantity,
-                                                                  price=sell_price)
-                    if new_sell_order:
-                        buy_delete_orders.append(buy_order)
-                        self.sell_orders.append(new_sell_order)
-
-                    buy_price = round_to(float(check_order.get('price')) * (1 - float(config.gap_percent)), min_price)
-                    if buy_price > bid_price > 0:
-                        buy_price = round_to(bid_price, min_price)
-
-                    new_buy_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.BUY,
-                                                                 order_type=OrderType.LIMIT, quantity=quantity,
-                                                                 price=buy_price)
-                    if new_buy_order:
-                        self.buy_orders.append(new_buy_order)
-
-                elif check_order.get('status') == OrderStatus.NEW.value:
-                    print('buy order status is: New')
-                else:
-                    print(f"buy order status is not above options: {check_order.get('status')}")
+                    self.logger.info("buy order was canceled: %s", check_order)
+                elif check_order.status == OrderStatus.FILLED:  # 買單成交，掛賣單
+                    self.logger.info("買單成交", extra={'side': 'BUY', 'price': check_order.price,
+                                                     'qty': check_order.orig_qty,
+                                                     'client_order_id': check_order.client_order_id})
 
-        # 刪掉過期或被拒絕的訂單.
-        for delete_order in buy_delete_orders:
-            self.buy_orders.remove(delete_order)
+                    sell_ticks = precision.shift_ticks(precision.price_to_ticks(check_order.price), gap_units, 1)
+
+                    if 0 < sell_ticks < ask_ticks:
+                        sell_ticks = ask_ticks
+
+                    new_orders.append((OrderSide.SELL, precision.format_price(sell_ticks), buy_order, buy_delete_orders))
+
+                    buy_ticks = precision.shift_ticks(precision.price_to_ticks(check_order.price), gap_units, -1)
+                    if buy_ticks > bid_ticks > 0:
+                        buy_ticks = bid_ticks
+
+                    new_orders.append((OrderSide.BUY, precision.format_price(buy_ticks), None, None))
+
+                elif check_order.status == OrderStatus.NEW:
+                    self.logger.debug("buy order status is: New, %s", check_order.client_order_id)
+                else:
+                    self.logger.info("buy order status is not above options: %s", check_order)
 
         # 賣單邏輯，檢查賣單狀況
-        for sell_order in self.sell_orders:
-            check_order = self.http_client.get_order(sell_order.get('symbol', config.symbol),
-                                                     client_order_id=sell_order.get('clientOrderId'))
+        for sell_order in self.sell_orders.descending():  # 最高價到最低價
+            check_order = check_orders.get(sell_order.client_order_id)
             if check_order:
-                if check_order.get('status') == OrderStatus.CANCELED.value:
+                if check_order.status == OrderStatus.CANCELED:
                     sell_delete_orders.append(sell_order)
 
-                    print(f"sell order status was canceled: {check_order.get('status')}")
-                elif check_order.get('status') == OrderStatus.FILLED.value:
-                    logging.info(
-                        f"賣單成交時間: {datetime.now()}, 價格: {check_order.get('price')}, 數量: {check_order.get('origQty')}")
+                    self.logger.info("sell order was canceled: %s", check_order)
+                elif check_order.status == OrderStatus.FILLED:
+                    self.logger.info("賣單成交", extra={'side': 'SELL', 'price': check_order.price,
+                                                     'qty': check_order.orig_qty,
+                                                     'client_order_id': check_order.client_order_id})
                     # 賣單成交，下買單
-                    buy_price = round_to(float(check_order.get('price')) * (1 - float(config.gap_percent)),
-                                         min_price)
-                    if buy_price > bid_price > 0:
-                        buy_price = round_to(bid_price, min_price)
-
-                    new_buy_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.BUY,
-                                                                 order_type=OrderType.LIMIT, quantity=quantity,
-                                                                 price=buy_price)
-                    if new_buy_order:
-                        sell_delete_orders.append(sell_order)
-                        self.buy_orders.append(new_buy_order)
-
-                    sell_price = round_to(float(check_order.get('price')) * (1 + float(config.gap_percent)), min_price)
-
-                    if 0 < sell_price < ask_price:
-                        sell_price = round_to(ask_price, min_price)
-
-                    new_sell_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.SELL,
-                                                                  order_type=OrderType.LIMIT, quantity=quantity,
-                                                                  price=sell_price)
-                    if new_sell_order:
-                        self.sell_orders.append(new_sell_order)
-
-                elif check_order.get('status') == OrderStatus.NEW.value:
-                    print('sell order status is: New')
+                    buy_ticks = precision.shift_ticks(precision.price_to_ticks(check_order.price), gap_units, -1)
+                    if buy_ticks > bid_ticks > 0:
+                        buy_ticks = bid_ticks
+
+                    new_orders.append((OrderSide.BUY, precision.format_price(buy_ticks), sell_order, sell_delete_orders))
+
+                    sell_ticks = precision.shift_ticks(precision.price_to_ticks(check_order.price), gap_units, 1)
+
+                    if 0 < sell_ticks < ask_ticks:
+                        sell_ticks = ask_ticks
+
+                    new_orders.append((OrderSide.SELL, precision.format_price(sell_ticks), None, None))
+
+                elif check_order.status == OrderStatus.NEW:
+                    self.logger.debug("sell order status is: New, %s", check_order.client_order_id)
+                else:
+                    self.logger.info("sell order status is not in above options: %s", check_order)
+
+        # 成交後的補單同時送出
+        with timer.measure('replace'):
+            placed_orders = self.place_orders([(order_side, quantity, price) for order_side, price, _, _ in new_orders])
+            for (order_side, price, filled_order, delete_orders), new_order in zip(new_orders, placed_orders):
+                if not new_order:
+                    continue
+
+                if order_side == OrderSide.BUY:
+                    self.buy_orders.add(new_order)
                 else:
-                    print(f"sell order status is not in above options: {check_order.get('status')}")
+                    self.sell_orders.add(new_order)
+
+                if filled_order is not None:
+                    delete_orders.append(filled_order)
 
         # 刪掉過期或被拒絕的訂單.
+        for delete_order in buy_delete_orders:
+            self.buy_orders.remove(delete_order)
+
         for delete_order in sell_delete_orders:
             self.sell_orders.remove(delete_order)
 
         # 沒有買單時
-        if len(self.buy_orders) <= 0:
-            if bid_price > 0:
-                price = round_to(bid_price * (1 - float(config.gap_percent)), min_price)
-                buy_order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.BUY,
-                                                         order_type=OrderType.LIMIT, quantity=quantity, price=price)
+        if not self.buy_orders:
+            if bid_price > 0 and int(self.config.ladder_levels) > 1:  # 一次掛滿整邊網格
+                for order in self.place_ladder(OrderSide.BUY, bid_price, precision, min_notional):
+                    self.buy_orders.add(order)
+            elif bid_price > 0:
+                price = precision.format_price(precision.shift_ticks(bid_ticks, gap_units, -1))
+                buy_order = self.place_order(OrderSide.BUY, quantity, price)
                 if buy_order:
-                    self.buy_orders.append(buy_order)
+                    self.buy_orders.add(buy_order)
 
-        elif len(self.buy_orders) > int(config.max_orders):  # 最大掛單數量
+        elif len(self.buy_orders) > int(self.config.max_orders):  # 最大掛單數量
             # 訂單數量多時
-            self.buy_orders.sort(key=lambda x: float(x['price']), reverse=False)  # 最低價到最高價
-
-            delete_order = self.buy_orders[0]
-            order = self.http_client.cancel_order(delete_order.get('symbol'),
-                                                  client_order_id=delete_order.get('clientOrderId'))
-            if order:
-                self.buy_orders.remove(delete_order)
+            with timer.measure('trim'):
+                delete_order = self.buy_orders.lowest()  # 撤銷最低價的買單
+                order = self.http_client.cancel_order(delete_order.symbol,
+                                                      client_order_id=delete_order.client_order_id)
+                if order:
+                    self.buy_orders.remove(delete_order)
 
         # 沒有賣單時
-        if len(self.sell_orders) <= 0:
-            if ask_price > 0:
-                price = round_to(ask_price * (1 + float(config.gap_percent)), min_price)
-                order = self.http_client.place_order(symbol=config.symbol, order_side=OrderSide.SELL,
-                                                     order_type=OrderType.LIMIT, quantity=quantity, price=price)
+        if not self.sell_orders:
+            if ask_price > 0 and int(self.config.ladder_levels) > 1:  # 一次掛滿整邊網格
+                for order in self.place_ladder(OrderSide.SELL, ask_price, precision, min_notional):
+                    self.sell_orders.add(order)
+            elif ask_price > 0:
+                price = precision.format_price(precision.shift_ticks(ask_ticks, gap_units, 1))
+                order = self.place_order(OrderSide.SELL, quantity, price)
                 if order:
-                    self.sell_orders.append(order)
+                    self.sell_orders.add(order)
 
-        elif len(self.sell_orders) > int(config.max_orders):  # 最大掛單數量
+        elif len(self.sell_orders) > int(self.config.max_orders):  # 最大掛單數量
             # 訂單數量多時
-            self.sell_orders.sort(key=lambda x: x['price'], reverse=True)  # 最高價到最低價
+            with timer.measure('trim'):
+                delete_order = self.sell_orders.highest()  # 撤銷最高價的賣單
+                order = self.http_client.cancel_order(delete_order.symbol,
+                                                      client_order_id=delete_order.client_order_id)
+                if order:
+                    self.sell_orders.remove(delete_order)
 
-            delete_order = self.sell_orders[0]
-            order = self.http_client.cancel_order(delete_order.get('symbol'),
-                                                  client_order_id=delete_order.get('clientOrderId'))
-            if order:
-                self.sell_orders.remove(delete_order)
+        if self.user_stream:
+            self.prune_order_updates()
 
+        self.update_trigger_levels()
+        if self.journal is not None:
+            with timer.measure('journal'):
+                self.journal.record(self.buy_orders, self.sell_orders)
+        timer.observe()
@@ -0,0 +1,177 @@
+import logging
+from functools import partial
+from gateway import BinanceSpotHttp, BinanceFutureHttp, SymbolFilterCache, BinanceUserStream, \
+    BinanceBookTickerStream, SPOT_STREAM_HOST, FUTURE_STREAM_HOST, AsyncBinanceSpotHttp, AsyncBinanceFutureHttp, \
+    SyncHttpClient
+from trader.binance_spot_trader import BinanceSpotTrader
+from trader.binance_future_trader import BinanceFutureTrader
+from trader.order_executor import OrderExecutor
+from trader.order_journal import OrderJournal, BUY
+from trader.scheduler import Scheduler
+from utils import config as default_config, get_folder_path
+
+logger = logging.getLogger('binance.runner')
+
+
+class GridRunner(object):
+
+    def __init__(self, config=None, http_client=None, rate_limiter=None):
+        """
+        在同一個process裡跑多個交易對的網格, 共用gateway(連線池, 頻率限制), 交易規則快取, 下單執行緒和websocket.
+        :param config: 主設定, config.grids裡每一筆是一個網格要覆蓋的欄位, 沒有設定grids時只跑config.symbol
+        :param http_client: 共用的gateway, None表示用設定建立
+        :param rate_limiter: 建立gateway時用的RateLimiter, None表示gateway預設的
+        """
+        self.config = config if config is not None else default_config
+        self.is_future = self.config.platform == 'binance_future'
+        if self.is_future:
+            trader_class = BinanceFutureTrader
+            self.stream_host, snapshot_name = FUTURE_STREAM_HOST, 'binance_future_symbols.json'
+        else:
+            trader_class = BinanceSpotTrader
+            self.stream_host, snapshot_name = SPOT_STREAM_HOST, 'binance_spot_symbols.json'
+
+        if http_client is None:
+            http_client = self.create_http_client(rate_limiter)
+        self.http_client = http_client
+        self.symbol_cache = SymbolFilterCache(http_client, ttl=self.config.exchange_info_ttl,
+                                              snapshot_name=snapshot_name)
+        self.executor = OrderExecutor(max_workers=self.config.order_workers)
+        self.scheduler = Scheduler(max_workers=self.config.grid_workers)
+        self.user_stream = None
+        self.market_stream = None
+
+        self.traders = {}  # symbol -> trader
+        for grid in self.config.grids or [{}]:
+            grid_config = self.config.copy(**grid)
+            symbol = grid_config.symbol
+            if symbol in self.traders:
+                raise ValueError(f"duplicate grid symbol: {symbol}")
+
+            trader = trader_class(http_client, config=grid_config, symbol_cache=self.symbol_cache,
+                                  executor=self.executor)
+            trader.wakeup_callback = partial(self.scheduler.notify, symbol)  # 只喚醒這個交易對的網格
+            if grid_config.order_journal:
+                journal_path = get_folder_path('journal').joinpath(f"{grid_config.platform}_{symbol}.jsonl")
+                trader.journal = OrderJournal(journal_path, compact_events=int(grid_config.journal_compact_events))
+            self.traders[symbol] = trader
+            self.scheduler.add_task(symbol, trader.start, interval=grid_config.cycle_interval,
+                                    deadline=grid_config.cycle_deadline, min_interval=grid_config.cycle_min_interval)
+        self.scheduler.add_task('report', self.scheduler.report, interval=300, delay=300)  # 定時印出每個任務的執行統計
+
+    def create_http_client(self, rate_limiter=None):
+        """
+        config.async_client為true時改用asyncio版本的gateway, 在背景的event loop上執行.
+        """
+        kwargs = dict(api_key=self.config.api_key, secret=self.config.api_secret, proxy_host=self.config.proxy_host,
+                      proxy_port=self.config.proxy_port, pool_connections=self.config.pool_connections,
+                      pool_maxsize=self.config.pool_maxsize, rate_limiter=rate_limiter,
+                      client_order_prefix=self.config.order_id_prefix)
+        if self.config.async_client:
+            http_class = AsyncBinanceFutureHttp if self.is_future else AsyncBinanceSpotHttp
+            return SyncHttpClient(http_class(**kwargs))
+
+        http_class = BinanceFutureHttp if self.is_future else BinanceSpotHttp
+        return http_class(**kwargs)
+
+    def cancel_open_orders(self):
+        """
+        啟動時撤銷舊的掛單. 有設定order_id_prefix時只撤銷clientOrderId帶有自己前綴的單,
+        不會動到其他process或者手動下的單.
+        """
+        for symbol, trader in self.traders.items():
+            self.cancel_symbol_orders(symbol, trader)
+
+    def cancel_symbol_orders(self, symbol, trader):
+        if not self.config.order_id_prefix:
+            orders = self.http_client.cancel_open_orders(symbol)
+            logger.info("cancel %s orders: %s", symbol, orders)
+            return
+
+        open_orders = self.http_client.get_open_orders(symbol)
+        if not isinstance(open_orders, list):
+            logger.warning("get %s open orders failed: %s", symbol, open_orders)
+            return
+        own_orders = [order for order in open_orders if self.http_client.is_own_order(order.client_order_id)]
+        orders = trader.cancel_orders(own_orders)
+        logger.info("cancel %s orders: %d/%d", symbol, len(orders), len(own_orders))
+
+    def resume_orders(self):
+        """
+        啟動時從order journal接回上次的掛單, 跟get_open_orders比對, 不撤單重來:
+        - journal裡還掛著的單: 用交易所的最新狀態放回掛單簿
+        - journal裡已經不在掛單的單: 也放回去, 第一輪查詢是成交(補單)還是被撤銷
+        - 交易所上自己的單但journal沒有(下單後還沒寫進journal就中斷): 依買賣方向接手
+        journal是空的交易對照舊撤單重來.
+        """
+        for symbol, trader in self.traders.items():
+            if trader.journal is None:
+                self.cancel_symbol_orders(symbol, trader)
+                continue
+
+            orders = trader.journal.load()
+            if not orders:
+                self.cancel_symbol_orders(symbol, trader)
+                continue
+
+            open_orders = self.http_client.get_open_orders(symbol)
+            if not isinstance(open_orders, list):
+                logger.warning("get %s open orders failed: %s, check journal orders one by one", symbol, open_orders)
+                open_orders = []
+            open_orders = {order.client_order_id: order for order in open_orders}
+
+            still_open = 0
+            for side, order in orders:
+                open_order = open_orders.pop(order.client_order_id, None)
+                if open_order is not None:
+                    still_open += 1
+                    order = open_order
+                (trader.buy_orders if side == BUY else trader.sell_orders).add(order)
+
+            adopted = 0
+            for order in open_orders.values():
+                if self.http_client.is_own_order(order.client_order_id):
+                    (trader.buy_orders if order.side == BUY else trader.sell_orders).add(order)
+                    adopted += 1
+
+            trader.journal.record(trader.buy_orders, trader.sell_orders)
+            logger.info("resume %s orders: %d from journal, %d still open, %d adopted", symbol, len(orders),
+                        still_open, adopted)
+
+    def start_user_stream(self):
+        """
+        同一個帳號只開一條帳戶資料推送, 依照symbol把訂單更新分給各個網格.
+        """
+        self.user_stream = BinanceUserStream(self.http_client, self.stream_host, on_order=self.on_order_update,
+                                             on_connected=self.on_user_stream_connected)
+        for trader in self.traders.values():
+            trader.user_stream = self.user_stream
+        self.user_stream.start()
+
+    def on_user_stream_connected(self):
+        for trader in self.traders.values():
+            trader.on_user_stream_connected()
+
+    def on_order_update(self, order):
+        trader = self.traders.get(order.symbol)
+        if trader:
+            trader.on_order_update(order)
+
+    def start_market_stream(self):
+        """
+        所有交易對的bookTicker用同一條combined stream訂閱.
+        """
+        self.market_stream = BinanceBookTickerStream(self.stream_host, list(self.traders),
+                                                     stale_seconds=self.config.market_stream_stale,
+                                                     on_ticker=self.on_ticker)
+        for trader in self.traders.values():
+            trader.market_stream = self.market_stream
+        self.market_stream.start()
+
+    def on_ticker(self, symbol, bid_price, ask_price):
+        trader = self.traders.get(symbol)
+        if trader:
+            trader.on_ticker(symbol, bid_price, ask_price)
+
+    def run(self):
+        self.scheduler.run()
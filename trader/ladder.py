@@ -0,0 +1,79 @@
+from gateway import OrderSide
+
+try:
+    import numpy as np  # pip install numpy
+except ImportError:
+    np = None
+
+GEOMETRIC = 'geometric'  # 每一格乘上(1 ± gap_percent)
+ARITHMETIC = 'arithmetic'  # 每一格加減 center * gap_percent
+
+
+class Ladder(object):
+
+    def __init__(self, side: OrderSide, price_ticks, qty_steps, precision):
+        """
+        一邊的網格掛單, 由離中心價最近的一格排到最遠的一格, 價格/數量都是整數tick/step的陣列.
+        """
+        self.side = side
+        self.precision = precision
+        self.price_ticks = price_ticks
+        self.qty_steps = qty_steps
+        self.prices = precision.ticks_to_price(price_ticks)
+        self.quantities = precision.steps_to_qty(qty_steps)
+        self.notionals = self.prices * self.quantities
+
+    def __len__(self):
+        return len(self.price_ticks)
+
+    def order_requests(self):
+        """
+        :return: [(order_side, quantity, price)], 價格/數量是交易所要的字串, 可以直接交給trader.place_orders
+        """
+        quantities = self.precision.format_qtys(self.qty_steps.tolist())
+        prices = self.precision.format_prices(self.price_ticks.tolist())
+        return [(self.side, quantity, price) for quantity, price in zip(quantities, prices)]
+
+    def __repr__(self):
+        return f"Ladder({self.side.value} {list(zip(self.prices.tolist(), self.quantities.tolist()))})"
+
+
+def build_ladder(precision, center, gap_percent, levels, quantity, side: OrderSide, mode=GEOMETRIC,
+                 min_notional=0.0):
+    """
+    一次算出整邊網格每一格的價格、數量和名義價值, 不用一格一格往上/往下推.
+    :param precision: utils.Precision, 交易對的tick/step
+    :param center: 中心價, 買單往下排, 賣單往上排, 第一格離中心價一個間距
+    :param gap_percent: 網格間距
+    :param levels: 格數
+    :param quantity: 每一格的數量, 也可以是每一格各自的數量(長度跟levels一樣)
+    :param side: OrderSide.BUY or OrderSide.SELL
+    :param mode: GEOMETRIC or ARITHMETIC
+    :param min_notional: 名義價值(價格*數量)小於這個值的格子會被過濾掉
+    :return: Ladder
+    """
+    if np is None:
+        raise ImportError("ladder generation needs the numpy package: pip install numpy")
+    if mode not in (GEOMETRIC, ARITHMETIC):
+        raise ValueError(f"unknown ladder mode: {mode}")
+
+    direction = 1 if side == OrderSide.SELL else -1
+    steps = np.arange(1, int(levels) + 1, dtype=np.float64)
+    gap = float(gap_percent)
+    if mode == GEOMETRIC:
+        prices = float(center) * (1 + direction * gap) ** steps
+    else:
+        prices = float(center) * (1 + direction * gap * steps)
+
+    price_ticks = precision.prices_to_ticks(prices)
+    qty_steps = np.rint(np.broadcast_to(np.asarray(quantity, dtype=np.float64), prices.shape)
+                        * precision.qty_factor).astype(np.int64)
+
+    # 間距比tick小時相鄰幾格會落在同一個價位, 只保留離中心價最近的那一格
+    _, first_index = np.unique(price_ticks, return_index=True)
+    keep = np.sort(first_index)
+    price_ticks, qty_steps = price_ticks[keep], qty_steps[keep]
+
+    notionals = precision.ticks_to_price(price_ticks) * precision.steps_to_qty(qty_steps)
+    mask = (price_ticks > 0) & (qty_steps > 0) & (notionals >= float(min_notional or 0))
+    return Ladder(side, price_ticks[mask], qty_steps[mask], precision)
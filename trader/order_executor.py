@@ -0,0 +1,78 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextvars import copy_context
+from threading import Lock
+
+logger = logging.getLogger('binance.executor')
+
+
+class OrderExecutor(object):
+
+    def __init__(self, max_workers=8):
+        """
+        同一輪網格裡互相獨立的下單/撤單/查單同時送出, 一輪的時間從所有請求相加變成最慢的那一個.
+        同一個key(例如clientOrderId)的動作會照送出的順序一個一個執行.
+        :param max_workers: 同時執行的請求數量, 不要超過http連線池的pool_maxsize
+        """
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='order')
+        self.key_futures = {}  # key -> 這個key最後一個動作的future
+        self.lock = Lock()
+
+    def submit(self, fn, *args, key=None, **kwargs):
+        """
+        :param key: 相同key的動作依序執行, None表示沒有順序限制
+        :return: concurrent.futures.Future
+        """
+        context = copy_context()  # 在呼叫端的context裡執行, 例如每個trader自己的RequestCounter
+        if key is None:
+            return self.pool.submit(context.run, fn, *args, **kwargs)
+
+        future = Future()
+
+        def run(_=None):
+            inner = self.pool.submit(context.run, fn, *args, **kwargs)
+            inner.add_done_callback(lambda f: self._copy_result(f, future))
+
+        with self.lock:
+            previous = self.key_futures.get(key)
+            self.key_futures[key] = future
+
+        future.add_done_callback(lambda f: self._release(key, f))
+        if previous is None:
+            run()
+        else:
+            previous.add_done_callback(run)  # 前一個動作結束(不管成功失敗)後才執行
+        return future
+
+    def run_all(self, tasks: list):
+        """
+        同時執行多個動作, 等全部完成.
+        某個動作丟出例外時記錄下來, 那個位置的結果是None, 其他動作的結果(例如已經下成功的單)照常回傳.
+        :param tasks: [(fn, args, key)]
+        :return: 跟tasks順序一樣的結果列表
+        """
+        futures = [self.submit(fn, *args, key=key) for fn, args, key in tasks]
+        results = []
+        for (fn, args, key), future in zip(tasks, futures):
+            try:
+                results.append(future.result())
+            except Exception:
+                logger.exception("%s%s failed, key: %s", getattr(fn, '__name__', fn), args, key)
+                results.append(None)
+        return results
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+    @staticmethod
+    def _copy_result(source: Future, target: Future):
+        error = source.exception()
+        if error is not None:
+            target.set_exception(error)
+        else:
+            target.set_result(source.result())
+
+    def _release(self, key, future):
+        with self.lock:
+            if self.key_futures.get(key) is future:
+                del self.key_futures[key]
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import time
+from gateway import Order, OrderSide
+
+logger = logging.getLogger('binance.journal')
+
+BUY, SELL = OrderSide.BUY.value, OrderSide.SELL.value
+
+
+class OrderJournal(object):
+
+    def __init__(self, path, compact_events=10000, fsync=True):
+        """
+        掛單的append-only journal: 每輪結束時把買賣掛單簿的變化(新增/移除)寫成JSON lines, 一輪只fsync一次.
+        事件累積到compact_events筆時, 把目前的掛單寫成快照, 再清空journal.
+        重啟時 快照 + journal 就是上次停下來時的掛單, 不用撤掉全部重新掛.
+        :param path: journal檔案路徑, 快照是同名加上 .snapshot
+        :param compact_events: journal累積多少筆事件就壓縮成快照
+        :param fsync: 寫入後是否fsync, 關掉時只flush到作業系統
+        """
+        self.path = str(path)
+        self.snapshot_path = self.path + '.snapshot'
+        self.compact_events = compact_events
+        self.fsync = fsync
+        self.orders = {}  # clientOrderId -> (BUY/SELL, 寫進journal時的訂單dict)
+        self.event_count = 0  # journal檔裡目前的事件數
+        self.file = None
+
+    def load(self):
+        """
+        讀取快照再重播journal, 最後一行寫到一半(寫入時中斷)的部分丟掉. 讀完先壓縮一次, 之後從乾淨的journal開始附加.
+        :return: [(BUY/SELL, Order)]
+        """
+        self.close()
+        self.orders = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, mode='r', encoding='UTF-8') as f:
+                for side, data in json.load(f).get('orders', []):
+                    self.orders[data['clientOrderId']] = (side, data)
+
+        if os.path.exists(self.path):
+            with open(self.path, mode='r', encoding='UTF-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        logger.warning("journal %s line %d is incomplete, ignore the rest", self.path, line_number)
+                        break
+                    self.apply(event)
+
+        self.compact()
+        return [(side, Order.from_dict(data)) for side, data in self.orders.values()]
+
+    def apply(self, event):
+        # 重播是冪等的: 每張單的結果只看最後一筆事件, 壓縮中斷時重播舊的journal也會得到同樣的掛單
+        if event['e'] == 'add':
+            self.orders[event['o']['clientOrderId']] = (event['side'], event['o'])
+        elif event['e'] == 'remove':
+            self.orders.pop(event['id'], None)
+
+    def record(self, buy_orders, sell_orders):
+        """
+        比對掛單簿跟journal裡的掛單, 把差異一次寫出並fsync. 沒有變化時不寫檔.
+        :param buy_orders: trader.buy_orders (OrderBook)
+        :param sell_orders: trader.sell_orders (OrderBook)
+        :return: 寫入的事件數
+        """
+        now = int(time.time() * 1000)
+        events = []
+        for side, book in ((BUY, buy_orders), (SELL, sell_orders)):
+            for client_order_id in book.orders.keys() - self.orders.keys():
+                events.append({'e': 'add', 't': now, 'side': side, 'o': book.orders[client_order_id].to_dict()})
+        removed = self.orders.keys() - buy_orders.orders.keys() - sell_orders.orders.keys()
+        events.extend({'e': 'remove', 't': now, 'id': client_order_id} for client_order_id in removed)
+        if not events:
+            return 0
+
+        for event in events:
+            self.apply(event)
+        self.append(events)
+        if self.event_count >= self.compact_events:
+            self.compact()
+        return len(events)
+
+    def append(self, events):
+        if self.file is None:
+            self.file = open(self.path, mode='a', encoding='UTF-8')
+        self.file.write(''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events))
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.event_count += len(events)
+
+    def compact(self):
+        """
+        把目前的掛單寫成快照(先寫暫存檔再rename, 中斷時舊的快照還在), 然後清空journal.
+        """
+        self.close()
+        data = {'time': int(time.time() * 1000), 'orders': list(self.orders.values())}
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, mode='w', encoding='UTF-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        self.file = open(self.path, mode='w', encoding='UTF-8')
+        self.event_count = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
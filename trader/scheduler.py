@@ -0,0 +1,152 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Event
+
+logger = logging.getLogger('binance.scheduler')
+
+
+class ScheduledTask(object):
+
+    def __init__(self, name, fn, interval, deadline=None, min_interval=0.0, error_delay=5):
+        """
+        :param name: 任務名稱, notify(name)用來喚醒指定的任務
+        :param fn: 要執行的函數, 不帶參數
+        :param interval: 沒有事件時多久執行一次(秒)
+        :param deadline: 一次執行最多可以花幾秒, 超過就記為overrun, None表示跟interval一樣
+        :param min_interval: 兩次執行最少間隔幾秒, 避免推送太頻繁時一直重跑
+        :param error_delay: 發生例外後等幾秒再執行
+        """
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.deadline = deadline if deadline is not None else interval
+        self.min_interval = min_interval
+        self.error_delay = error_delay
+        self.next_run = 0  # time.monotonic(), 0表示馬上執行
+        self.last_run = 0
+        self.pending = False  # 有事件在等待處理
+        self.running = False  # 正在執行, 同一個任務不會同時執行兩次
+        self.reasons = set()  # 這次被喚醒的原因
+        self.run_count = 0
+        self.error_count = 0
+        self.overrun_count = 0
+        self.last_duration = 0
+        self.max_duration = 0
+
+    def due_time(self):
+        """
+        :return: 下一次要執行的時間(time.monotonic())
+        """
+        if self.pending:
+            return min(self.next_run, self.last_run + self.min_interval)
+        return self.next_run
+
+
+class Scheduler(object):
+
+    def __init__(self, max_workers=1):
+        """
+        事件驅動的排程器, 任務在計時到了或者被notify喚醒時執行, 取代固定sleep的主迴圈.
+        notify可以從websocket等其他執行緒呼叫.
+        :param max_workers: 1表示任務都在呼叫run()的執行緒依序執行, 大於1時不同的任務可以同時執行
+        """
+        self.tasks = {}  # name -> ScheduledTask
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='task') if max_workers > 1 else None
+        self.condition = Condition()
+        self.stop_event = Event()
+
+    def add_task(self, name, fn, interval, deadline=None, min_interval=0.0, error_delay=5, delay=0):
+        """
+        參數見ScheduledTask.
+        :param delay: 第一次執行前等幾秒, 0表示馬上執行
+        """
+        task = ScheduledTask(name, fn, interval, deadline, min_interval, error_delay)
+        task.next_run = time.monotonic() + delay if delay else 0
+        with self.condition:
+            self.tasks[name] = task
+            self.condition.notify()
+        return task
+
+    def notify(self, name=None, reason='event'):
+        """
+        喚醒任務, 在min_interval允許的範圍內盡快執行.
+        :param name: 任務名稱, None表示全部任務
+        :param reason: 喚醒的原因, 例如 'order', 'ticker'
+        """
+        with self.condition:
+            tasks = self.tasks.values() if name is None else [self.tasks[name]]
+            for task in tasks:
+                task.pending = True
+                task.reasons.add(reason)
+            self.condition.notify()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify()
+        if self.pool:
+            self.pool.shutdown(wait=False)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.condition:
+                now = time.monotonic()
+                idle_tasks = [task for task in self.tasks.values() if not task.running]
+                due_tasks = [task for task in idle_tasks if task.due_time() <= now]
+                if not due_tasks:
+                    wait = min([task.due_time() for task in idle_tasks], default=now + 1) - now
+                    self.condition.wait(max(wait, 0))
+                    continue
+
+                reasons = {}
+                for task in due_tasks:
+                    reasons[task.name] = task.reasons or {'timer'}
+                    task.reasons = set()
+                    task.pending = False
+                    task.running = True
+
+            for task in due_tasks:
+                if self.pool:
+                    self.pool.submit(self._run_and_release, task, reasons[task.name])
+                else:
+                    self._run_and_release(task, reasons[task.name])
+
+    def _run_and_release(self, task: ScheduledTask, reasons):
+        try:
+            if not self.stop_event.is_set():
+                self.run_task(task, reasons)
+        finally:
+            with self.condition:
+                task.running = False
+                self.condition.notify()
+
+    def run_task(self, task: ScheduledTask, reasons=None):
+        start_time = time.monotonic()
+        late = start_time - task.next_run if task.next_run else 0
+        task.last_run = start_time
+        try:
+            task.fn()
+            next_delay = task.interval
+        except Exception as error:
+            task.error_count += 1
+            logger.exception("task %s error: %s", task.name, error)
+            next_delay = task.error_delay
+
+        duration = time.monotonic() - start_time
+        task.run_count += 1
+        task.last_duration = duration
+        task.max_duration = max(task.max_duration, duration)
+        task.next_run = time.monotonic() + next_delay
+        if duration > task.deadline:
+            task.overrun_count += 1
+            logger.warning("task %s overrun: took %.2fs, deadline %ss, late %.2fs, reasons: %s", task.name, duration,
+                           task.deadline, max(late, 0), sorted(reasons or []))
+
+    def report(self):
+        """
+        印出每個任務的執行統計, 可以當作定時任務加進排程器.
+        """
+        for task in list(self.tasks.values()):
+            logger.info("task %s: runs %d, errors %d, overruns %d, last %.2fs, max %.2fs", task.name, task.run_count,
+                        task.error_count, task.overrun_count, task.last_duration, task.max_duration)
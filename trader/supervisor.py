@@ -0,0 +1,130 @@
+import logging
+import multiprocessing
+import time
+from gateway import RateLimiter
+from gateway.rate_limiter import SPOT_RATE_LIMITS, SPOT_ENDPOINT_WEIGHTS, SPOT_ORDER_ENDPOINTS, \
+    FUTURE_RATE_LIMITS, FUTURE_ENDPOINT_WEIGHTS, FUTURE_ORDER_ENDPOINTS
+from trader.grid_runner import GridRunner
+from utils import config as default_config
+from utils.log import setup_logging
+from utils.metrics import MetricsServer
+
+logger = logging.getLogger('binance.supervisor')
+
+
+def get_shard_prefix(shard_index):
+    """
+    每個process的clientOrderId前綴, 重啟後還是同一個, 才能找回自己之前下的單.
+    """
+    return f"w{shard_index:02d}"
+
+
+def run_shard(config_fields: dict, shard_index, shard_count, shared_block):
+    """
+    子process的進入點: 跑分配到的交易對, 頻率限制只用1/shard_count的額度.
+    """
+    shard_config = default_config.copy(**config_fields)
+    shard_config.order_id_prefix = get_shard_prefix(shard_index)
+    setup_logging(shard_config, suffix=shard_config.order_id_prefix)  # 每個process寫自己的日誌檔
+    if shard_config.platform == 'binance_future':
+        limits = (FUTURE_RATE_LIMITS, FUTURE_ENDPOINT_WEIGHTS, FUTURE_ORDER_ENDPOINTS)
+    else:
+        limits = (SPOT_RATE_LIMITS, SPOT_ENDPOINT_WEIGHTS, SPOT_ORDER_ENDPOINTS)
+    rate_limiter = RateLimiter(*limits, share=1 / shard_count, shared_block=shared_block)
+
+    if shard_config.metrics_port:
+        MetricsServer(port=shard_config.metrics_port + shard_index).start()  # 每個process各自一個port
+
+    runner = GridRunner(shard_config, rate_limiter=rate_limiter)
+    if shard_config.order_journal:
+        runner.resume_orders()  # 從journal接回上次的網格
+    else:
+        runner.cancel_open_orders()  # 只撤銷自己前綴的單, 其他process的單不受影響
+
+    if shard_config.user_stream:
+        runner.start_user_stream()
+
+    if shard_config.market_stream:
+        runner.start_market_stream()
+
+    runner.run()
+
+
+class Supervisor(object):
+
+    def __init__(self, config=None, processes=None, restart_delay=5, max_restart_delay=300):
+        """
+        把config.grids的交易對分給多個process, 每個process跑一個GridRunner, 簽名/JSON解析/策略計算可以用到多個CPU.
+        - 每個process的clientOrderId有自己的前綴, 不會互相衝突, 重啟時只撤銷自己的單
+        - 每個process只用1/n的頻率限制額度, 再用回應header校正整個帳號的已使用量,
+          任何一個process收到429/418時所有process一起暫停
+        - 子process掛掉時自動重啟, 連續很快就掛掉時拉長重啟間隔
+        :param processes: process數量, None表示config.processes
+        :param restart_delay: 子process結束後多久重啟(秒)
+        :param max_restart_delay: 重啟間隔的上限(秒)
+        """
+        self.config = config if config is not None else default_config
+        grids = self.config.grids or [{'symbol': self.config.symbol}]
+        processes = processes or self.config.processes or multiprocessing.cpu_count()
+        self.shard_count = max(1, min(processes, len(grids)))
+        self.shards = [grids[i::self.shard_count] for i in range(self.shard_count)]  # 輪流分配, 每個process數量差不多
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.shared_block = multiprocessing.Value('d', 0)  # 所有process共用的429/418暫停期限
+        self.processes = [None] * self.shard_count
+        self.start_times = [0] * self.shard_count
+        self.restart_delays = [restart_delay] * self.shard_count
+        self.restart_times = [0] * self.shard_count  # 0表示不用重啟
+        self.stopping = False
+
+    def start_shard(self, shard_index):
+        config_fields = dict(vars(self.config))
+        config_fields['grids'] = self.shards[shard_index]
+        process = multiprocessing.Process(target=run_shard, name=f"grid-{get_shard_prefix(shard_index)}",
+                                          args=(config_fields, shard_index, self.shard_count, self.shared_block))
+        process.start()
+        self.processes[shard_index] = process
+        self.start_times[shard_index] = time.monotonic()
+        symbols = [grid.get('symbol') for grid in self.shards[shard_index]]
+        logger.info("start shard %d pid %s: %s", shard_index, process.pid, symbols)
+
+    def check_shards(self):
+        now = time.monotonic()
+        for shard_index, process in enumerate(self.processes):
+            if self.restart_times[shard_index]:
+                if now >= self.restart_times[shard_index]:
+                    self.restart_times[shard_index] = 0
+                    self.start_shard(shard_index)
+                continue
+
+            if process.is_alive():
+                continue
+
+            # 跑超過一分鐘才掛掉就從頭算重啟間隔, 否則每次加倍
+            if now - self.start_times[shard_index] > 60:
+                self.restart_delays[shard_index] = self.restart_delay
+            else:
+                self.restart_delays[shard_index] = min(self.restart_delays[shard_index] * 2, self.max_restart_delay)
+            delay = self.restart_delays[shard_index]
+            self.restart_times[shard_index] = now + delay
+            logger.warning("shard %d exited with code %s, restart in %ss", shard_index, process.exitcode, delay)
+
+    def run(self, check_interval=1):
+        for shard_index in range(self.shard_count):
+            self.start_shard(shard_index)
+
+        try:
+            while not self.stopping:
+                self.check_shards()
+                time.sleep(check_interval)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopping = True
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=10)
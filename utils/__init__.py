@@ -1,2 +1,3 @@
 from .config import config
-from .utility import *
\ No newline at end of file
+from .utility import *
+from .precision import Precision
@@ -16,6 +16,34 @@ class Config:
         self.max_orders: int = 1
         self.proxy_host: str = ''  # proxy host
         self.proxy_port: int = 0  # proxy port
+        self.pool_connections: int = 10  # http連線池數量
+        self.pool_maxsize: int = 10  # 每個host最多保持的連線數
+        self.exchange_info_ttl: int = 3600  # 交易規則快取時間(秒)
+        self.user_stream: bool = False  # 是否用websocket接收訂單推送
+        self.market_stream: bool = False  # 是否用websocket接收最優買賣價
+        self.market_stream_stale: float = 10  # 報價超過幾秒沒更新就改用REST查詢
+        self.async_client: bool = False  # 是否使用asyncio版本的gateway
+        self.order_workers: int = 8  # 同時送出訂單請求的執行緒數量, 不要超過pool_maxsize
+        self.reconcile_mode: str = 'open_orders'  # 訂單狀態檢查: open_orders 一次取得所有掛單, poll 逐筆查詢
+        self.cycle_interval: float = 20  # 沒有事件時多久跑一輪網格(秒)
+        self.cycle_deadline: float = 10  # 一輪網格最多花幾秒, 超過就回報overrun
+        self.cycle_min_interval: float = 1  # 事件觸發時兩輪之間最少間隔幾秒
+        self.grids: list = []  # 多個交易對的網格, 每一筆是要覆蓋的欄位, 例如 {"symbol": "ETHUSDT", "quantity": 0.01}
+        self.grid_workers: int = 4  # 同時執行幾個交易對的網格
+        self.processes: int = 1  # 把grids分給幾個process執行, 0表示CPU核心數
+        self.order_id_prefix: str = ''  # clientOrderId的前綴(最多6個英數字), 設定後啟動時只撤銷自己前綴的單
+        self.ladder_levels: int = 1  # 一邊沒有掛單時一次掛幾格, 大於1時需要numpy
+        self.ladder_mode: str = 'geometric'  # 網格間距: geometric 每格乘上(1 ± gap_percent), arithmetic 每格加減固定價差
+        self.metrics_port: int = 0  # Prometheus指標的HTTP port(只聽127.0.0.1), 0表示不開, 多個process時每個process依序+1
+        self.log_file: str = 'log.txt'  # 日誌檔(JSON lines), 空字串表示不寫檔, 多個process時檔名加上process前綴
+        self.log_level: str = 'INFO'  # 日誌等級
+        self.log_levels: dict = {}  # 各分類的日誌等級, 例如 {"gateway": "WARNING", "trader.BTCUSDT": "DEBUG"}
+        self.log_console: bool = True  # 日誌是否也輸出到終端機
+        self.log_max_bytes: int = 10 * 1024 * 1024  # 日誌檔超過多少byte就輪替
+        self.log_backup_count: int = 5  # 保留幾個輪替後的日誌檔
+        self.log_queue_size: int = 10000  # 日誌queue最多放幾筆, 寫檔跟不上時丟棄並計數
+        self.order_journal: bool = True  # 掛單寫進trader/journal, 重啟時接回上次的網格, false時照舊撤單重來
+        self.journal_compact_events: int = 10000  # journal累積多少筆事件就壓縮成快照
 
     def loads(self, config_file=None):
         configures = {}
@@ -32,6 +60,15 @@ class Config:
                 exit(0)
         self._update(configures)
 
+    def copy(self, **overrides):
+        """
+        複製一份設定, 再用overrides覆蓋部分欄位, 每個交易對的網格各自一份.
+        """
+        new_config = Config()
+        new_config._update(vars(self))
+        new_config._update(overrides)
+        return new_config
+
     def _update(self, update_fields):
         for k, v in update_fields.items():
             setattr(self, k, v)
@@ -0,0 +1,182 @@
+import json
+import os
+from .utility import get_folder_path
+
+try:
+    import numpy as np  # pip install numpy
+except ImportError:
+    np = None
+
+# get_kline每一根K線的欄位, 依順序對應到 (欄位名稱, 磁碟上的dtype)
+KLINE_FIELDS = (
+    ('open_time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+    ('close_time', '<i8'),
+    ('quote_volume', '<f8'),
+    ('trades', '<i8'),
+    ('taker_buy_volume', '<f8'),
+    ('taker_buy_quote_volume', '<f8'),
+)
+META_FILENAME = 'meta.json'
+
+
+def klines_to_columns(klines):
+    """
+    get_kline的輸出(字串列表)轉成每個欄位一個numpy陣列, 缺少的欄位補0.
+    """
+    if np is None:
+        raise ImportError("kline columns need the numpy package: pip install numpy")
+    rows = [kline[:len(KLINE_FIELDS)] for kline in klines]
+    columns = list(zip(*rows)) if rows else []
+    arrays = {}
+    for i, (name, dtype) in enumerate(KLINE_FIELDS):
+        if i < len(columns):
+            # 整數欄位(時間, 成交筆數)要先轉int, 不然大的毫秒時間轉float會失去精度
+            values = [int(value) for value in columns[i]] if dtype == '<i8' else columns[i]
+            arrays[name] = np.asarray(values, dtype=dtype)
+        else:
+            arrays[name] = np.zeros(len(rows), dtype=dtype)
+    return arrays
+
+
+class KlineStore(object):
+
+    def __init__(self, folder_name='klines'):
+        """
+        K線的欄式儲存: 每個交易對/週期一個資料夾, 每個欄位一個固定dtype的二進位檔, 讀取時直接memory-map,
+        不用解析json. K線依開盤時間排序, 用二分搜尋open_time欄位當作時間索引.
+        meta.json記錄筆數、欄位檔的版本(generation)和已下載的區間, meta是寫完所有欄位之後才更新, 當作提交點:
+        附加時寫到一半中斷, 多出來的資料會被忽略; 合併時寫到新版本的檔案, 中斷時meta還指向舊版本, 欄位不會錯開.
+        :param folder_name: 資料夾名稱, 在utils.utility的TEMP_DIR底下
+        """
+        if np is None:
+            raise ImportError("kline store needs the numpy package: pip install numpy")
+        self.root = get_folder_path(folder_name)
+
+    def get_path(self, symbol, interval):
+        path = self.root.joinpath(f"{symbol}_{getattr(interval, 'value', interval)}")
+        if not path.exists():
+            path.mkdir()
+        return path
+
+    def load_meta(self, symbol, interval):
+        meta_path = self.get_path(symbol, interval).joinpath(META_FILENAME)
+        if not meta_path.exists():
+            return {'count': 0, 'generation': 0, 'ranges': []}
+        with open(meta_path, mode='r', encoding='UTF-8') as f:
+            return json.load(f)
+
+    def save_meta(self, symbol, interval, meta: dict):
+        meta_path = self.get_path(symbol, interval).joinpath(META_FILENAME)
+        temp_path = meta_path.with_suffix('.tmp')
+        with open(temp_path, mode='w', encoding='UTF-8') as f:
+            json.dump(meta, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, meta_path)
+
+    @staticmethod
+    def get_column_path(path, name, generation=0):
+        # 第0版沒有後綴, 合併重寫時寫到下一版, 舊的檔案在meta更新之後才刪除
+        return path.joinpath(name if not generation else f"{name}.{generation}")
+
+    def get_ranges(self, symbol, interval):
+        return self.load_meta(symbol, interval).get('ranges', [])
+
+    def set_ranges(self, symbol, interval, ranges):
+        meta = self.load_meta(symbol, interval)
+        meta['ranges'] = ranges
+        self.save_meta(symbol, interval, meta)
+
+    def count(self, symbol, interval):
+        return self.load_meta(symbol, interval)['count']
+
+    def read(self, symbol, interval, start_time=None, end_time=None, fields=None):
+        """
+        :param start_time: 開盤時間 >= start_time(毫秒), None表示從頭
+        :param end_time: 開盤時間 <= end_time, None表示到最後
+        :param fields: 要讀的欄位, None表示全部
+        :return: {欄位名稱: 唯讀的memmap陣列}, 不會複製資料
+        """
+        path = self.get_path(symbol, interval)
+        meta = self.load_meta(symbol, interval)
+        count, generation = meta['count'], meta.get('generation', 0)
+        fields = fields or [name for name, _ in KLINE_FIELDS]
+        dtypes = dict(KLINE_FIELDS)
+        if not count:
+            return {name: np.zeros(0, dtype=dtypes[name]) for name in fields}
+
+        open_time = np.memmap(self.get_column_path(path, 'open_time', generation), dtype=dtypes['open_time'],
+                              mode='r', shape=(count,))
+        start = 0 if start_time is None else int(np.searchsorted(open_time, start_time, side='left'))
+        end = count if end_time is None else int(np.searchsorted(open_time, end_time, side='right'))
+        columns = {}
+        for name in fields:
+            column = open_time if name == 'open_time' else \
+                np.memmap(self.get_column_path(path, name, generation), dtype=dtypes[name], mode='r', shape=(count,))
+            columns[name] = column[start:end]
+        return columns
+
+    def append(self, symbol, interval, columns: dict):
+        """
+        加入K線, 已經存在的開盤時間會被略過. 新的K線都比最後一根晚時直接附加在檔案尾端,
+        否則(補舊的資料)合併後把所有欄位寫到下一版的檔案, 最後才更新meta切換過去.
+        :param columns: klines_to_columns的結果
+        :return: 實際加入的K線數量
+        """
+        new_times = np.asarray(columns['open_time'])
+        if not len(new_times):
+            return 0
+
+        path = self.get_path(symbol, interval)
+        meta = self.load_meta(symbol, interval)
+        count, generation = meta['count'], meta.get('generation', 0)
+        order = np.argsort(new_times, kind='stable')
+        new_times = new_times[order]
+        keep = np.ones(len(new_times), dtype=bool)
+        keep[1:] = new_times[1:] != new_times[:-1]  # 同一批裡重複的開盤時間
+
+        existing = self.read(symbol, interval)['open_time'] if count else np.zeros(0, dtype='<i8')
+        if count:
+            positions = np.searchsorted(existing, new_times)
+            found = positions < count
+            found[found] = existing[positions[found]] == new_times[found]
+            keep &= ~found
+        added = int(keep.sum())
+        if not added:
+            return 0
+
+        selected = order[keep]
+        if not count or new_times[keep][0] > existing[-1]:
+            for name, dtype in KLINE_FIELDS:
+                file_path = self.get_column_path(path, name, generation)
+                itemsize = np.dtype(dtype).itemsize
+                with open(file_path, mode='ab') as f:
+                    f.truncate(count * itemsize)  # 上次寫到一半中斷時多出來的資料
+                    f.write(np.asarray(columns[name])[selected].astype(dtype).tobytes())
+        else:
+            old = self.read(symbol, interval)
+            merged_order = np.argsort(np.concatenate([old['open_time'], new_times[keep]]), kind='stable')
+            for name, dtype in KLINE_FIELDS:
+                values = np.concatenate([np.asarray(old[name]), np.asarray(columns[name])[selected]])[merged_order]
+                # 上次合併中斷時留下的同一版檔案直接覆蓋
+                with open(self.get_column_path(path, name, generation + 1), mode='wb') as f:
+                    f.write(values.astype(dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            del old
+            meta['generation'] = generation + 1
+
+        meta['count'] = count + added
+        self.save_meta(symbol, interval, meta)
+        if meta.get('generation', 0) != generation:
+            for name, _ in KLINE_FIELDS:
+                try:
+                    os.remove(self.get_column_path(path, name, generation))
+                except OSError:  # 已經刪掉了, 或者Windows上還被memmap開著, 留著不影響讀取
+                    pass
+        return added
@@ -0,0 +1,205 @@
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from threading import Lock
+from utils.metrics import metrics
+
+LOGGER_ROOT = 'binance'  # 所有分類的上層logger: binance.trader.<symbol>, binance.gateway, binance.stream ...
+STOP_TIMEOUT = 5  # 結束時最多等幾秒把queue裡的日誌寫完
+
+LOG_DROPPED = metrics.counter('log_records_dropped_total', 'Log records dropped because the log queue was full.',
+                              ('logger',))
+
+# LogRecord本身的屬性, 其他的(logger.info(..., extra={...})帶進來的)才是結構化欄位
+RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+def get_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        """
+        一筆一行的JSON: time, level, logger, msg, 再加上extra帶進來的欄位, 值不能轉成JSON時用str().
+        """
+        data = {'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                'level': record.levelname, 'logger': record.name, 'msg': record.getMessage()}
+        data.update(get_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def formatMessage(self, record):
+        message = super().formatMessage(record)
+        fields = get_fields(record)
+        if fields:
+            message += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return message
+
+
+class DroppingQueueHandler(QueueHandler):
+
+    def __init__(self, log_queue):
+        """
+        呼叫端只把LogRecord放進有上限的queue就返回, 格式化和寫檔都在QueueListener的背景執行緒.
+        queue滿了(寫檔跟不上)就丟掉這一筆並計數, 不會卡住交易迴圈; 之後有空位時補一筆WARNING說明丟了幾筆.
+        """
+        super().__init__(log_queue)
+        self.drop_lock = Lock()
+        self.dropped = 0  # 總共丟掉幾筆
+        self.unreported = 0  # 還沒寫進日誌的丟棄數量
+
+    def prepare(self, record):
+        # 不在呼叫端組訊息字串, msg/args留給背景執行緒; traceback物件不能留到之後, 先轉成文字
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.drop_lock:
+                self.dropped += 1
+                self.unreported += 1
+            LOG_DROPPED.inc(record.name)
+            return
+
+        if self.unreported:
+            with self.drop_lock:
+                count, self.unreported = self.unreported, 0
+            if count:
+                notice = logging.makeLogRecord({'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                                'msg': 'log queue full, dropped %d records', 'args': (count,),
+                                                'dropped': count})
+                try:
+                    self.queue.put_nowait(notice)
+                except queue.Full:
+                    with self.drop_lock:
+                        self.unreported += count
+
+
+class LogListener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # 結束時queue可能是滿的, 等背景執行緒消化出空位再放結束訊號, 剩下的日誌才不會遺失
+        self.queue.put(self._sentinel, timeout=STOP_TIMEOUT)
+
+
+class LogPipeline(object):
+
+    def __init__(self, log_file='log.txt', level='INFO', levels=None, console=True, max_bytes=10 * 1024 * 1024,
+                 backup_count=5, queue_size=10000):
+        """
+        非同步的結構化日誌: 檔案是JSON lines(依大小輪替), 終端機是一般文字, 都在背景執行緒寫出.
+        :param log_file: 日誌檔路徑, 空字串表示不寫檔
+        :param level: binance底下所有分類的預設等級
+        :param levels: 各分類的等級, 例如 {"gateway": "WARNING", "trader.BTCUSDT": "DEBUG"}, 名稱可以省略binance.
+        :param console: 是否同時輸出到終端機
+        :param max_bytes: 日誌檔超過幾個byte就輪替, 0表示不輪替
+        :param backup_count: 保留幾個輪替後的舊檔
+        :param queue_size: queue最多放幾筆, 超過就丟棄並計數
+        """
+        self.pid = os.getpid()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+
+        handlers = []
+        if log_file:
+            file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                               encoding='UTF-8', delay=True)
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(ConsoleFormatter())
+            handlers.append(console_handler)
+        self.listener = LogListener(self.queue, *handlers, respect_handler_level=True)
+        self.started = False
+
+        self.loggers = {LOGGER_ROOT: level}
+        for name, category_level in (levels or {}).items():
+            if name != LOGGER_ROOT and not name.startswith(LOGGER_ROOT + '.'):
+                name = f"{LOGGER_ROOT}.{name}"
+            self.loggers[name] = category_level
+
+    @property
+    def dropped(self):
+        return self.handler.dropped
+
+    def start(self):
+        for name, level in self.loggers.items():
+            logging.getLogger(name).setLevel(level.upper() if isinstance(level, str) else level)
+        # handler掛在root上, 其他套件(urllib3, websocket)照root原本的等級, 預設只有WARNING以上
+        logging.getLogger().addHandler(self.handler)
+        self.listener.start()
+        self.started = True
+        return self
+
+    def detach(self):
+        logging.getLogger().removeHandler(self.handler)
+
+    def stop(self):
+        """
+        拿掉handler, 等背景執行緒把queue裡剩下的寫完.
+        """
+        self.detach()
+        if self.started:
+            self.started = False
+            try:
+                self.listener.stop()
+            except queue.Full:  # 寫檔的執行緒卡住, 放不進結束訊號
+                pass
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+pipeline = None
+
+
+def setup_logging(config, suffix=''):
+    """
+    依照設定啟動日誌. 重複呼叫時先停掉前一個; fork出來的子process裡前一個的背景執行緒已經不在了, 只拿掉handler.
+    :param suffix: 加在日誌檔名後面, 多個process時每個process寫自己的檔案, 輪替才不會互相干擾
+    :return: LogPipeline
+    """
+    global pipeline
+    if pipeline is not None:
+        if pipeline.pid == os.getpid():
+            pipeline.stop()
+        else:
+            pipeline.detach()
+
+    log_file = config.log_file
+    if log_file and suffix:
+        root, ext = os.path.splitext(log_file)
+        log_file = f"{root}.{suffix}{ext}"
+    pipeline = LogPipeline(log_file=log_file, level=config.log_level, levels=config.log_levels,
+                           console=config.log_console, max_bytes=int(config.log_max_bytes),
+                           backup_count=int(config.log_backup_count), queue_size=int(config.log_queue_size)).start()
+    return pipeline
+
+
+def stop_logging():
+    global pipeline
+    if pipeline is not None and pipeline.pid == os.getpid():
+        pipeline.stop()
+    pipeline = None
+
+
+atexit.register(stop_logging)
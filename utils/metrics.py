@@ -0,0 +1,293 @@
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+# 請求延遲的histogram分界(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 網格每個階段耗時的histogram分界(秒)
+PHASE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+logger = logging.getLogger('binance.metrics')
+
+
+def format_labels(label_names, label_values, extra=''):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = Lock()
+        self.values = {}  # label值的tuple -> 數值
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)  # 第一個 >= value 的分界, 超過全部分界時只算進+Inf
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [[0] * len(self.buckets), 0.0, 0]  # 各分界的次數, 總和, 次數
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            items = sorted((label_values, (list(state[0]), state[1], state[2]))
+                           for label_values, state in self.values.items())
+        for label_values, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label_names, label_values, f'le="{format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        """
+        process內所有指標的集合, render()輸出Prometheus的text格式.
+        同名的指標只會建立一次, 多個gateway/trader共用同一份.
+        """
+        self.lock = Lock()
+        self.metrics = {}
+
+    def register(self, metric_class, name, documentation, label_names=(), **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_class(name, documentation, label_names, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter, name, documentation, label_names)
+
+    def gauge(self, name, documentation, label_names=()):
+        return self.register(Gauge, name, documentation, label_names)
+
+    def histogram(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+# gateway: 每個接口(method, path)的延遲、回應、錯誤碼、重試和權重
+REQUEST_SECONDS = metrics.histogram('binance_request_duration_seconds', 'HTTP request latency per attempt.',
+                                    ('method', 'path'))
+REQUEST_RESPONSES = metrics.counter('binance_responses_total',
+                                    'Responses per HTTP status, status="error" for connection errors.',
+                                    ('method', 'path', 'status'))
+REQUEST_ERRORS = metrics.counter('binance_errors_total', 'Exchange error codes in failed responses.',
+                                 ('method', 'path', 'code'))
+REQUEST_RETRIES = metrics.counter('binance_retries_total', 'Retried requests per retry action.',
+                                  ('method', 'path', 'action'))
+REQUEST_WEIGHT = metrics.counter('binance_request_weight_total', 'Rate limit units consumed (sent attempts).',
+                                 ('method', 'path', 'limit_type'))
+USED_WEIGHT = metrics.gauge('binance_used_weight', 'Last X-MBX-USED-WEIGHT / X-MBX-ORDER-COUNT header value.',
+                            ('header',))
+
+# trader: 每一輪網格各階段的耗時
+TRADER_PHASE_SECONDS = metrics.histogram('grid_cycle_phase_seconds', 'Time spent per grid cycle phase.',
+                                         ('symbol', 'phase'), buckets=PHASE_BUCKETS)
+
+
+def observe_request(method, path, seconds, status, costs=None, used=None):
+    """
+    gateway每送出一次請求(包含重試)記錄一次.
+    :param status: HTTP狀態碼, 連線錯誤時是None
+    :param costs: RateLimiter.get_costs的結果
+    :param used: RateLimiter.update_from_headers的結果, 交易所回報的已使用額度
+    """
+    REQUEST_SECONDS.observe(seconds, method, path)
+    REQUEST_RESPONSES.inc(method, path, str(status) if status is not None else 'error')
+    if costs:
+        for limit_type, cost in costs.items():
+            if cost:
+                REQUEST_WEIGHT.inc(method, path, limit_type, amount=cost)
+    if used:
+        for name, value in used.items():
+            USED_WEIGHT.set(value, name)
+
+
+def observe_error(method, path, code, action=None, retry=False):
+    """
+    請求失敗時記錄交易所的錯誤碼, 要重試時再記錄重試的原因(RetryAction).
+    """
+    if code is not None:
+        REQUEST_ERRORS.inc(method, path, str(code))
+    if retry:
+        REQUEST_RETRIES.inc(method, path, getattr(action, 'value', action))
+
+
+class PhaseTimer(object):
+
+    def __init__(self, symbol):
+        """
+        一輪網格各階段的計時, 同一個階段出現多次時(例如買賣兩邊)累加, 最後observe()一次寫入histogram.
+        """
+        self.symbol = symbol
+        self.start_time = time.perf_counter()
+        self.elapsed = {}
+
+    @contextmanager
+    def measure(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.elapsed[phase] = self.elapsed.get(phase, 0.0) + time.perf_counter() - start
+
+    def observe(self):
+        for phase, seconds in self.elapsed.items():
+            TRADER_PHASE_SECONDS.observe(seconds, self.symbol, phase)
+        TRADER_PHASE_SECONDS.observe(time.perf_counter() - self.start_time, self.symbol, 'cycle')
+
+
+current_counter = ContextVar('request_counter', default=None)
+
+
+class RequestCounter(object):
+
+    def __init__(self):
+        """
+        計算with區塊裡發出的http請求(包含重試). 多個網格共用同一個gateway時, gateway的request_count是全部加總,
+        這個只算自己的: 計數器放在contextvars裡, OrderExecutor的工作執行緒和async gateway的event loop都會帶過去.
+        """
+        self.count = 0
+        self.lock = Lock()
+        self.token = None
+
+    def __enter__(self):
+        self.token = current_counter.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        current_counter.reset(self.token)
+        self.token = None
+
+    def add(self, count=1):
+        with self.lock:
+            self.count += count
+
+
+def count_request():
+    counter = current_counter.get()
+    if counter is not None:
+        counter.add()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        data = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(object):
+
+    def __init__(self, registry=None, host='127.0.0.1', port=9100):
+        """
+        本機的 /metrics HTTP服務, 給Prometheus抓取.
+        :param registry: MetricsRegistry, None表示全域的metrics
+        :param port: 0表示由系統分配
+        """
+        self.httpd = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry if registry is not None else metrics
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self.thread = Thread(target=self.httpd.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+        logger.info("metrics served on %s", self.url)
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
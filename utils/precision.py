@@ -0,0 +1,141 @@
+import math
+from decimal import Decimal
+
+try:
+    import numpy as np  # pip install numpy, 沒有安裝時批次轉換用list
+except ImportError:
+    np = None
+
+ROUND_NEAREST = 'nearest'
+ROUND_DOWN = 'down'
+ROUND_UP = 'up'
+
+GAP_SCALE = 10 ** 8  # gap_percent換算成整數時的單位(1e-8)
+EXACT_FLOAT_LIMIT = 10 ** 15  # 小於這個數的整數除以10^n再格式化回n位小數, 誤差小於0.5位, 結果跟整數運算一樣
+TICK_EPSILON = 1e-9  # 無條件捨去/進位時容許的浮點誤差(以tick為單位), 例如 0.3 / 0.1 = 2.9999999999999996
+
+
+def parse_increment(increment):
+    """
+    把交易所的tickSize/stepSize字串拆成 (小數位數, 以10^-小數位數為單位的整數).
+    例如 '0.01000000' -> (2, 1), '0.5' -> (1, 5), '10.00' -> (0, 10)
+    """
+    value = Decimal(str(increment)).normalize()
+    if value <= 0:
+        raise ValueError(f"increment must be greater than 0: {increment}")
+    decimals = max(0, -value.as_tuple().exponent)
+    return decimals, int(value.scaleb(decimals))
+
+
+def format_units(units: int, decimals: int):
+    """
+    以10^-decimals為單位的整數轉成固定小數位數的字串, 不會出現 0.30000000000000004 或 1e-05.
+    """
+    if decimals == 0:
+        return str(units)
+    if -EXACT_FLOAT_LIMIT < units < EXACT_FLOAT_LIMIT:
+        return '%.*f' % (decimals, units / 10 ** decimals)
+    sign = '-' if units < 0 else ''
+    whole, fraction = divmod(abs(units), 10 ** decimals)
+    return f"{sign}{whole}.{fraction:0{decimals}d}"
+
+
+def to_gap_units(gap_percent):
+    """
+    網格間距換算成整數, 之後的價格計算都用整數.
+    """
+    return int(round(float(gap_percent) * GAP_SCALE))
+
+
+class Precision(object):
+
+    def __init__(self, tick_size, step_size):
+        """
+        整數精度引擎: 價格換算成tick數, 數量換算成step數, 網格的價格計算全部用整數,
+        最後才格式化成交易所要的字串. 每個交易對建立一次(見SymbolFilterCache.get_precision).
+        :param tick_size: 價格最小跳動單位, 交易所的字串, 例如 '0.01000000'
+        :param step_size: 數量最小單位, 例如 '0.00100000'
+        """
+        self.tick_size = str(tick_size)
+        self.step_size = str(step_size)
+        self.price_decimals, self.tick_units = parse_increment(tick_size)
+        self.qty_decimals, self.step_units = parse_increment(step_size)
+        self.tick = self.tick_units / 10 ** self.price_decimals
+        self.step = self.step_units / 10 ** self.qty_decimals
+        self.price_factor = 10 ** self.price_decimals / self.tick_units  # 價格 * price_factor = tick數
+        self.qty_factor = 10 ** self.qty_decimals / self.step_units
+
+    @staticmethod
+    def _to_int(value, rounding):
+        if rounding == ROUND_NEAREST:
+            return round(value)
+        if rounding == ROUND_DOWN:
+            return math.floor(value + TICK_EPSILON)
+        return math.ceil(value - TICK_EPSILON)
+
+    def price_to_ticks(self, price, rounding=ROUND_NEAREST):
+        if rounding == ROUND_NEAREST:
+            return round(price * self.price_factor)
+        return self._to_int(float(price) * self.price_factor, rounding)
+
+    def qty_to_steps(self, quantity, rounding=ROUND_NEAREST):
+        return self._to_int(float(quantity) * self.qty_factor, rounding)
+
+    def ticks_to_price(self, ticks):
+        return ticks * self.tick_units / 10 ** self.price_decimals
+
+    def steps_to_qty(self, steps):
+        return steps * self.step_units / 10 ** self.qty_decimals
+
+    def format_price(self, ticks):
+        return format_units(int(ticks) * self.tick_units, self.price_decimals)
+
+    def format_qty(self, steps):
+        return format_units(int(steps) * self.step_units, self.qty_decimals)
+
+    def round_price(self, price, rounding=ROUND_NEAREST):
+        """
+        跟utils.round_to一樣回傳float, 但不經過str/Decimal.
+        """
+        return self.ticks_to_price(self.price_to_ticks(price, rounding))
+
+    def round_qty(self, quantity, rounding=ROUND_NEAREST):
+        return self.steps_to_qty(self.qty_to_steps(quantity, rounding))
+
+    @staticmethod
+    def shift_ticks(ticks, gap_units, levels=1):
+        """
+        往上(levels > 0)或往下(levels < 0)移動幾格網格, 每格乘上(1 ± gap), 四捨五入到tick.
+        只用整數運算, ticks可以是int或numpy的int64陣列.
+        :param gap_units: to_gap_units(gap_percent)
+        """
+        factor = GAP_SCALE + gap_units if levels > 0 else GAP_SCALE - gap_units
+        if levels == 1 or levels == -1:
+            return (ticks * factor + GAP_SCALE // 2) // GAP_SCALE
+        for _ in range(abs(levels)):
+            ticks = (ticks * factor + GAP_SCALE // 2) // GAP_SCALE
+        return ticks
+
+    def prices_to_ticks(self, prices, rounding=ROUND_NEAREST):
+        """
+        批次轉換, 有安裝numpy時回傳int64陣列.
+        """
+        if np is None:
+            return [self.price_to_ticks(price, rounding) for price in prices]
+        values = np.asarray(prices, dtype=np.float64) * self.price_factor
+        if rounding == ROUND_DOWN:
+            values = np.floor(values + TICK_EPSILON)
+        elif rounding == ROUND_UP:
+            values = np.ceil(values - TICK_EPSILON)
+        else:
+            values = np.rint(values)
+        return values.astype(np.int64)
+
+    def format_prices(self, ticks):
+        return [self.format_price(value) for value in ticks]
+
+    def format_qtys(self, steps):
+        return [self.format_qty(value) for value in steps]
+
+    def __repr__(self):
+        return f"Precision(tick_size={self.tick_size}, step_size={self.step_size})"